@@ -163,6 +163,45 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# In-process trigram index behind /api/employees/search/?fuzzy= (see api/fuzzy_index.py)
+EMPLOYEE_FUZZY_INDEX = {
+    'MAX_TERMS': 2_000_000,
+    'THRESHOLD': 0.2,
+    'REFRESH_INTERVAL': 5,
+    'WARM_ON_STARTUP': True,
+}
+
+# Limits of /api/batch/ (see api/views_batch.py)
+API_BATCH = {
+    'MAX_REQUESTS': 20,
+    'MAX_WORKERS': 4,
+}
+
+# Audit log writes (see api/audit.py), 'sync' writes each entry in the request
+AUDIT_LOG = {
+    'MODE': 'buffered',
+    'MAX_BATCH': 200,
+    'FLUSH_INTERVAL': 1.0,
+    'JOURNAL_DIR': BASE_DIR / 'audit_journal',
+}
+
+# Audit log rows older than RETENTION_DAYS are moved to DIRECTORY by archive_audit_logs
+AUDIT_ARCHIVE = {
+    'RETENTION_DAYS': 90,
+    'DIRECTORY': BASE_DIR / 'audit_archive',
+}
+
+# Background exports of /api/exports/ (see api/export_jobs.py)
+EXPORT_JOBS = {
+    'MAX_WORKERS': 2,
+    'PROCESSES': 2,
+    'PARTITION_ROWS': 50000,
+    'MAX_WAIT': 30,
+}
+
+# Render the dashboard page with its data embedded instead of fetching /api/dashboard/bootstrap/
+DASHBOARD_EMBED_BOOTSTRAP = True
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
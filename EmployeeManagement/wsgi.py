@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EmployeeManagement.settings')
 
 application = get_wsgi_application()
+
+# Build the fuzzy search index in the background instead of on the first request
+from api import fuzzy_index  # noqa: E402
+
+fuzzy_index.warm_in_background()
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import UserProfile, FormTemplate, FormField, Employee, EmployeeFieldValue, AuditLog
+from .models import UserProfile, FormTemplate, FormField, Employee, EmployeeFieldValue, AuditLog, AuditLogRollup, ExportJob
+from . import projections
 
 
 class UserProfileInline(admin.StackedInline):
@@ -34,6 +35,13 @@ class FormTemplateAdmin(admin.ModelAdmin):
     inlines = [FormFieldInline]
     readonly_fields = ['created_at', 'updated_at']
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.bump_schema_version()
+        form.instance.rebuild_employee_snapshots()
+        # Field types may have changed, so the projection columns are recreated
+        projections.rebuild(form.instance)
+
 
 @admin.register(FormField)
 class FormFieldAdmin(admin.ModelAdmin):
@@ -42,6 +50,26 @@ class FormFieldAdmin(admin.ModelAdmin):
     search_fields = ['field_label', 'field_name', 'form_template__name']
     ordering = ['form_template', 'order']
 
+    def schema_changed(self, form_template):
+        form_template.bump_schema_version()
+        form_template.rebuild_employee_snapshots()
+        projections.rebuild(form_template)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.schema_changed(obj.form_template)
+
+    def delete_model(self, request, obj):
+        form_template = obj.form_template
+        super().delete_model(request, obj)
+        self.schema_changed(form_template)
+
+    def delete_queryset(self, request, queryset):
+        form_templates = list(FormTemplate.objects.filter(fields__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for form_template in form_templates:
+            self.schema_changed(form_template)
+
 
 class EmployeeFieldValueInline(admin.TabularInline):
     model = EmployeeFieldValue
@@ -51,11 +79,15 @@ class EmployeeFieldValueInline(admin.TabularInline):
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
-    list_display = ['employee_id', 'form_template', 'created_by', 'created_at', 'is_active']
+    list_display = ['employee_id', 'display_name', 'form_template', 'created_by', 'created_at', 'is_active']
     list_filter = ['is_active', 'created_at', 'form_template', 'created_by']
-    search_fields = ['employee_id', 'form_template__name']
+    search_fields = ['employee_id', 'display_name', 'form_template__name']
     inlines = [EmployeeFieldValueInline]
-    readonly_fields = ['employee_id', 'created_at', 'updated_at']
+    readonly_fields = ['employee_id', 'display_name', 'created_at', 'updated_at']
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.sync_field_values()
 
 
 @admin.register(EmployeeFieldValue)
@@ -74,6 +106,20 @@ class AuditLogAdmin(admin.ModelAdmin):
     readonly_fields = ['timestamp']
 
 
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'export_format', 'form_template', 'status', 'row_count', 'created_at', 'finished_at']
+    list_filter = ['status', 'export_format']
+    readonly_fields = ['fingerprint', 'watermark', 'created_at', 'started_at', 'finished_at']
+
+
+@admin.register(AuditLogRollup)
+class AuditLogRollupAdmin(admin.ModelAdmin):
+    list_display = ['hour', 'owner', 'action', 'count']
+    list_filter = ['action']
+    date_hierarchy = 'hour'
+
+
 # Re-register UserAdmin
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
\ No newline at end of file
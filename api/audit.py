@@ -0,0 +1,272 @@
+"""Buffered AuditLog writer
+
+Request paths call ``record()`` instead of ``AuditLog.objects.create()``. In
+the default ``buffered`` mode the event is queued in memory once the
+surrounding transaction commits, and a background thread writes the queue
+with ``bulk_create`` when it holds ``MAX_BATCH`` events or ``FLUSH_INTERVAL``
+seconds after the first queued event. Every queued event is first appended
+to a per-process journal file under ``JOURNAL_DIR``; a flush rotates the
+journal and removes the rotated file once its rows are written. Journals left
+behind by a process that died, or by a failed flush, are replayed by the
+next writer to start and by the ``flush_audit_journal`` command.
+
+Journal files are named after their process and a random token, so a new
+process that reuses the PID of a dead one (PID 1 in containers) neither
+appends to nor rotates the dead process's journal. A replay first claims a
+journal by renaming it into its own namespace, so concurrent replays never
+write the same events twice.
+
+The ``sync`` mode writes each event immediately in the caller's transaction,
+for tests and scripts that read the audit log right after writing.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import audit_rollups
+from .models import AuditLog, Employee
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MODE': 'buffered',         # or 'sync'
+    'MAX_BATCH': 200,           # events that trigger a flush
+    'FLUSH_INTERVAL': 1.0,      # seconds an event may wait in the queue
+    'JOURNAL_DIR': None,        # defaults to <BASE_DIR>/audit_journal
+    'FSYNC': False,             # fsync the journal after every event
+}
+
+_writer = None
+_writer_lock = threading.Lock()
+_process = None
+_process_lock = threading.Lock()
+_segments = count(1)
+
+
+def _setting(name):
+    return getattr(settings, 'AUDIT_LOG', {}).get(name, DEFAULTS[name])
+
+
+def journal_dir():
+    return str(_setting('JOURNAL_DIR') or os.path.join(settings.BASE_DIR, 'audit_journal'))
+
+
+def _process_name():
+    """``<pid>-<token>`` prefix of the journal files of this process, renewed in forked children"""
+    global _process
+    with _process_lock:
+        if _process is None or _process[0] != os.getpid():
+            _process = (os.getpid(), uuid.uuid4().hex[:12])
+        return f"{_process[0]}-{_process[1]}"
+
+
+def _segment_name():
+    """Unique name of a journal being written to the table by this process"""
+    return f"{_process_name()}-{next(_segments)}.flushing"
+
+
+def _event(employee, action, performed_by=None, changes=None, ip_address=None, user_agent=None):
+    return {
+        'employee_id': getattr(employee, 'pk', employee),
+        'action': action,
+        'performed_by_id': getattr(performed_by, 'pk', performed_by),
+        'changes': changes,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+def _write_events(events):
+    """Insert events, skipping employees deleted since (their rows would have cascaded)"""
+    if not events:
+        return 0
+    owners = dict(Employee.objects.filter(pk__in={event['employee_id'] for event in events}).values_list('pk', 'created_by_id'))
+    user_ids = {event['performed_by_id'] for event in events if event['performed_by_id'] is not None}
+    user_ids = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True)) if user_ids else set()
+    rows = [
+        AuditLog(
+            employee_id=event['employee_id'],
+            action=event['action'],
+            performed_by_id=event['performed_by_id'] if event['performed_by_id'] in user_ids else None,
+            changes=event['changes'],
+            ip_address=event['ip_address'],
+            user_agent=event['user_agent'],
+            timestamp=parse_datetime(event['timestamp']),
+        )
+        for event in events if event['employee_id'] in owners
+    ]
+    with transaction.atomic():
+        AuditLog.objects.bulk_create(rows, batch_size=500)
+        # bulk_create() does not send the post_save signal that maintains the rollups
+        audit_rollups.add(rows, owners)
+    return len(rows)
+
+
+def _read_journal(path):
+    events = []
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # Last line of a journal cut off mid-write
+                continue
+    return events
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def replay_journals():
+    """Write the events of journals left by dead processes and failed flushes, returns the rows written
+
+    A journal is ``<pid>-<token>.jsonl`` while its writer appends to it and
+    ``<pid>-<token>-<n>.flushing`` while a flush writes it; the files of dead
+    writers and failed flushes (``.failed``) of any writer are replayed.
+    Each file is claimed first with an atomic rename to a ``.flushing`` name
+    of this process; a file another replay claimed first is skipped.
+    """
+    directory = journal_dir()
+    if not os.path.isdir(directory):
+        return 0
+    own = _process_name()
+    own_pid = own.split('-')[0]
+    written = 0
+    for name in sorted(os.listdir(directory)):
+        parts = name.split('.')[0].split('-')
+        pid = parts[0]
+        if not pid.isdigit():
+            continue
+        failed = name.endswith('.failed')
+        if not failed:
+            if '-'.join(parts[:2]) == own:
+                continue
+            # Files of this PID with another token were left by a dead process that had the same PID
+            if pid != own_pid and _pid_alive(int(pid)):
+                continue
+        claimed = os.path.join(directory, _segment_name())
+        try:
+            os.rename(os.path.join(directory, name), claimed)
+        except FileNotFoundError:
+            continue
+        try:
+            written += _write_events(_read_journal(claimed))
+        except Exception:
+            os.replace(claimed, claimed[:-len('.flushing')] + '.failed')
+            raise
+        os.remove(claimed)
+    return written
+
+
+class BufferedWriter:
+    """Queue of audit events of this process, flushed by a daemon thread"""
+
+    def __init__(self):
+        self.directory = journal_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.pid = os.getpid()
+        self.journal_path = os.path.join(self.directory, f"{_process_name()}.jsonl")
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.queue = []
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name='audit-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def add(self, event):
+        line = json.dumps(event, default=str) + '\n'
+        with self.condition:
+            self.journal.write(line)
+            self.journal.flush()
+            if _setting('FSYNC'):
+                os.fsync(self.journal.fileno())
+            self.queue.append(event)
+            if len(self.queue) == 1 or len(self.queue) >= _setting('MAX_BATCH'):
+                self.condition.notify()
+
+    def take(self):
+        """Detach the queued events with their journal, returns ``(events, journal path)``"""
+        with self.condition:
+            if not self.queue:
+                return [], None
+            events, self.queue = self.queue, []
+            self.journal.close()
+            rotated = os.path.join(self.directory, _segment_name())
+            os.replace(self.journal_path, rotated)
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+            return events, rotated
+
+    def flush(self):
+        events, rotated = self.take()
+        if not events:
+            return 0
+        try:
+            written = _write_events(events)
+        except Exception:
+            logger.exception("Writing %d audit events failed, kept in %s", len(events), rotated)
+            os.replace(rotated, rotated[:-len('.flushing')] + '.failed')
+            connection.close()
+            return 0
+        os.remove(rotated)
+        return written
+
+    def run(self):
+        try:
+            replay_journals()
+        except Exception:
+            logger.exception("Replaying audit journals failed")
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                if len(self.queue) < _setting('MAX_BATCH'):
+                    self.condition.wait(_setting('FLUSH_INTERVAL'))
+            self.flush()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = BufferedWriter()
+        return _writer
+
+
+def record(employee, action, performed_by=None, changes=None, ip_address=None, user_agent=None):
+    """Log an action on an employee, takes the arguments of AuditLog"""
+    if _setting('MODE') == 'sync':
+        return AuditLog.objects.create(
+            employee_id=getattr(employee, 'pk', employee), action=action,
+            performed_by_id=getattr(performed_by, 'pk', performed_by), changes=changes,
+            ip_address=ip_address, user_agent=user_agent,
+        )
+    event = _event(employee, action, performed_by, changes, ip_address, user_agent)
+    # Events of rolled back transactions are never queued
+    transaction.on_commit(lambda: get_writer().add(event))
+    return None
+
+
+def flush():
+    """Write the events queued in this process now, returns the rows written"""
+    if _writer is None or _writer.pid != os.getpid():
+        return 0
+    return _writer.flush()
@@ -0,0 +1,268 @@
+"""Archival of old audit log rows to compressed segments
+
+``archive()`` (the ``archive_audit_logs`` command) moves AuditLog rows older
+than ``RETENTION_DAYS`` out of the table into one gzip-compressed JSONL
+segment per day under ``DIRECTORY``::
+
+    2025/03/2025-03-14.jsonl.gz      one archived row per line
+    2025/03/2025-03-14.index.json    row count, time range, employees, owners, actions
+
+A day's segment and index are rebuilt from the rows already archived plus
+the rows still in the table, merged by id, and replace the old files
+atomically before the rows are deleted from the table. Archiving a day again
+after an interrupted run therefore neither duplicates rows nor inflates the
+index. Both inputs are read in ``(timestamp, id)`` order and merged as they
+are written, so memory does not grow with the number of rows of a day. ``search()`` reads only the segments whose date is in the requested
+range and whose index lists the requested employee and owner.
+"""
+import gzip
+import heapq
+import json
+import os
+from array import array
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLog
+
+
+DEFAULTS = {
+    'RETENTION_DAYS': 90,       # rows older than this are archived
+    'DIRECTORY': None,          # defaults to <BASE_DIR>/audit_archive
+}
+
+BATCH_SIZE = 2000
+
+
+def _setting(name):
+    return getattr(settings, 'AUDIT_ARCHIVE', {}).get(name, DEFAULTS[name])
+
+
+def archive_dir():
+    return str(_setting('DIRECTORY') or os.path.join(settings.BASE_DIR, 'audit_archive'))
+
+
+def segment_paths(day):
+    base = os.path.join(archive_dir(), f"{day:%Y}", f"{day:%m}", day.isoformat())
+    return f"{base}.jsonl.gz", f"{base}.index.json"
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min)
+    if settings.USE_TZ:
+        start = timezone.make_aware(start)
+    return start, start + timedelta(days=1)
+
+
+def _local_date(moment):
+    return timezone.localtime(moment).date() if timezone.is_aware(moment) else moment.date()
+
+
+def _row(log):
+    return {
+        'id': log['id'],
+        'employee': log['employee_id'],
+        'employee_name': log['employee__display_name'] or f"Employee {log['employee__employee_id']}",
+        'owner': log['employee__created_by_id'],
+        'action': log['action'],
+        'performed_by': log['performed_by_id'],
+        'performed_by_username': log['performed_by__username'],
+        'changes': log['changes'],
+        # Full precision, DjangoJSONEncoder would cut microseconds
+        'timestamp': log['timestamp'].isoformat(),
+        'ip_address': log['ip_address'],
+        'user_agent': log['user_agent'],
+    }
+
+
+ROW_COLUMNS = (
+    'id', 'employee_id', 'employee__display_name', 'employee__employee_id', 'employee__created_by_id', 'action',
+    'performed_by_id', 'performed_by__username', 'changes', 'timestamp', 'ip_address', 'user_agent',
+)
+
+
+def read_index(day):
+    _, index_path = segment_paths(day)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, encoding='utf-8') as index_file:
+        return json.load(index_file)
+
+
+def _write_index(day, index):
+    _, index_path = segment_paths(day)
+    temporary = f"{index_path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file)
+    os.replace(temporary, index_path)
+
+
+class SegmentIndex:
+    """Index of a segment, built one row at a time while the segment is written"""
+
+    def __init__(self, day):
+        self.day = day
+        self.rows = 0
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.employees = set()
+        self.owners = set()
+        self.actions = {}
+
+    def add(self, row):
+        self.rows += 1
+        timestamp = row['timestamp']
+        if self.min_timestamp is None or timestamp < self.min_timestamp:
+            self.min_timestamp = timestamp
+        if self.max_timestamp is None or timestamp > self.max_timestamp:
+            self.max_timestamp = timestamp
+        self.employees.add(row['employee'])
+        if row['owner'] is not None:
+            self.owners.add(row['owner'])
+        self.actions[row['action']] = self.actions.get(row['action'], 0) + 1
+
+    def as_dict(self):
+        return {
+            'date': self.day.isoformat(),
+            'rows': self.rows,
+            'min_timestamp': self.min_timestamp,
+            'max_timestamp': self.max_timestamp,
+            'employees': sorted(self.employees),
+            'owners': sorted(self.owners),
+            'actions': self.actions,
+        }
+
+
+def _row_key(row):
+    return parse_datetime(row['timestamp']), row['id']
+
+
+def _read_segment(day):
+    """Rows of a day's segment in file order, which is ``(timestamp, id)`` order"""
+    segment_path, _ = segment_paths(day)
+    if not os.path.exists(segment_path):
+        return
+    with gzip.open(segment_path, 'rt', encoding='utf-8') as segment:
+        for line in segment:
+            yield json.loads(line)
+
+
+def archive_day(day):
+    """Move the audit rows of one day into its segment, returns the number of rows moved"""
+    start, end = _day_bounds(day)
+    logs = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    if not logs.exists():
+        return 0
+
+    moved = array('q')
+
+    def hot_rows():
+        for log in logs.order_by('timestamp', 'id').values(*ROW_COLUMNS).iterator(chunk_size=BATCH_SIZE):
+            moved.append(log['id'])
+            yield _row(log)
+
+    segment_path, _ = segment_paths(day)
+    os.makedirs(os.path.dirname(segment_path), exist_ok=True)
+    temporary = f"{segment_path}.tmp"
+    encoder = DjangoJSONEncoder()
+    index = SegmentIndex(day)
+    last_id = None
+    with gzip.open(temporary, 'wt', encoding='utf-8') as segment:
+        # Rows still in the table come first among equal keys, and win over their archived copy
+        for row in heapq.merge(hot_rows(), _read_segment(day), key=_row_key):
+            if row['id'] == last_id:
+                continue
+            last_id = row['id']
+            segment.write(encoder.encode(row) + '\n')
+            index.add(row)
+    os.replace(temporary, segment_path)
+    _write_index(day, index.as_dict())
+
+    for offset in range(0, len(moved), BATCH_SIZE):
+        AuditLog.objects.filter(id__in=moved[offset:offset + BATCH_SIZE].tolist()).delete()
+    return len(moved)
+
+
+def archive(retention_days=None, on_day=None):
+    """Archive every day older than the retention period, returns the number of rows moved"""
+    if retention_days is None:
+        retention_days = _setting('RETENTION_DAYS')
+    cutoff, _ = _day_bounds(timezone.localdate() - timedelta(days=retention_days))
+    days = (
+        AuditLog.objects.filter(timestamp__lt=cutoff)
+        .annotate(day=TruncDate('timestamp')).order_by('day')
+        .values_list('day', flat=True).distinct()
+    )
+    moved = 0
+    for day in list(days):
+        count = archive_day(day)
+        moved += count
+        if on_day:
+            on_day(day, count)
+    return moved
+
+
+def archived_days():
+    """Dates that have a segment, newest first"""
+    directory = archive_dir()
+    days = []
+    if os.path.isdir(directory):
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith('.index.json'):
+                    days.append(datetime.strptime(name[:-len('.index.json')], '%Y-%m-%d').date())
+    return sorted(days, reverse=True)
+
+
+def segment_rows(day):
+    """Rows archived for a day, each once even if the day was archived twice"""
+    rows = {}
+    for row in _read_segment(day):
+        rows[row['id']] = row
+    return list(rows.values())
+
+
+def search(owner=None, employee=None, action=None, since=None, until=None, before=None, limit=100, performed_by=None):
+    """Archived rows matching the filters, newest first
+
+    ``since``/``until`` are datetimes bounding the timestamp, ``before`` is a
+    ``(timestamp, id)`` pair to continue after the last row of a previous page.
+    """
+    results = []
+    for day in archived_days():
+        if since and day < _local_date(since):
+            break
+        if (until and day > _local_date(until)) or (before and day > _local_date(before[0])):
+            continue
+        index = read_index(day)
+        if index is None or not index['rows']:
+            continue
+        if employee is not None and employee not in index['employees']:
+            continue
+        if owner is not None and owner not in index['owners']:
+            continue
+        if action is not None and action not in index['actions']:
+            continue
+
+        rows = [
+            row for row in segment_rows(day)
+            if (owner is None or row['owner'] == owner)
+            and (employee is None or row['employee'] == employee)
+            and (action is None or row['action'] == action)
+            and (performed_by is None or row['performed_by'] == performed_by)
+        ]
+        for row in sorted(rows, key=lambda row: (row['timestamp'], row['id']), reverse=True):
+            timestamp = parse_datetime(row['timestamp'])
+            if (since and timestamp < since) or (until and timestamp > until):
+                continue
+            if before and (timestamp, row['id']) >= before:
+                continue
+            results.append(row)
+            if len(results) >= limit:
+                return results
+    return results
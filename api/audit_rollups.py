@@ -0,0 +1,155 @@
+"""Hourly rollups of the audit log
+
+AuditLogRollup holds the number of audit rows per owner (the user who
+created the employee), UTC hour and action. It is incremented as audit rows
+are written: by the AuditLog post_save signal for single rows, and by
+``add()`` in the paths that ``bulk_create()`` audit rows (the buffered
+writer and the bulk operations). Archiving audit rows leaves their rollups in
+place, so ``histogram()`` covers the archived months too.
+
+``backfill()`` (the ``backfill_audit_rollups`` command) recomputes the
+rollups from the audit table, and from the archive segments of the days it
+covers, and repairs any drift.
+"""
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import audit_archive
+from .models import AuditLog, AuditLogRollup, Employee
+
+
+BUCKETS = ('hour', 'day')
+MAX_BUCKETS = 2000
+
+
+def _hour(moment):
+    """Start of the UTC hour of an aware datetime"""
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _increment(owner_id, hour, action, count):
+    updated = AuditLogRollup.objects.filter(owner_id=owner_id, hour=hour, action=action).update(count=F('count') + count)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            AuditLogRollup.objects.create(owner_id=owner_id, hour=hour, action=action, count=count)
+    except IntegrityError:
+        # Created concurrently since the update
+        AuditLogRollup.objects.filter(owner_id=owner_id, hour=hour, action=action).update(count=F('count') + count)
+
+
+def add(logs, owners=None):
+    """Count written AuditLog rows, ``owners`` maps employee ids to owner ids where known"""
+    owners = dict(owners or {})
+    missing = {log.employee_id for log in logs} - set(owners)
+    if missing:
+        owners.update(Employee.objects.filter(pk__in=missing).values_list('pk', 'created_by_id'))
+    counts = Counter((owners.get(log.employee_id), _hour(log.timestamp), log.action) for log in logs)
+    for (owner_id, hour, action), count in counts.items():
+        _increment(owner_id, hour, action, count)
+
+
+def _archived_counts(days):
+    """Rollup counts of archived rows of ``days`` that are no longer in the audit table"""
+    counts = Counter()
+    for day in days:
+        start, end = audit_archive._day_bounds(day)
+        hot = set(AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end).values_list('id', flat=True))
+        for row in audit_archive.segment_rows(day):
+            if row['id'] not in hot:
+                counts[(row['owner'], _hour(parse_datetime(row['timestamp'])), row['action'])] += 1
+    return counts
+
+
+def backfill(since=None, everything=False):
+    """Recompute the rollups of the days from ``since``, returns the number of rollup rows written
+
+    ``since`` defaults to the day of the oldest row of the audit table;
+    ``everything`` recomputes all rollups, including every archived day.
+    """
+    if everything:
+        since = None
+    elif since is None:
+        since = AuditLog.objects.aggregate(oldest=Min('timestamp'))['oldest']
+        if since is None:
+            return 0
+    if since is not None:
+        since, _ = audit_archive._day_bounds(audit_archive._local_date(since))
+        days = [day for day in audit_archive.archived_days() if day >= since.date()]
+    else:
+        days = audit_archive.archived_days()
+
+    with transaction.atomic():
+        counts = _archived_counts(days)
+        logs = AuditLog.objects.all()
+        if since is not None:
+            logs = logs.filter(timestamp__gte=since)
+        hot = (
+            logs.annotate(hour=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+            .values('employee__created_by', 'hour', 'action').annotate(count=Count('id')).order_by()
+        )
+        for row in hot:
+            counts[(row['employee__created_by'], _hour(row['hour']), row['action'])] += row['count']
+
+        stale = AuditLogRollup.objects.all()
+        if since is not None:
+            stale = stale.filter(hour__gte=since)
+        stale.delete()
+        AuditLogRollup.objects.bulk_create([
+            AuditLogRollup(owner_id=owner_id, hour=hour, action=action, count=count)
+            for (owner_id, hour, action), count in counts.items()
+        ], batch_size=500)
+    return len(counts)
+
+
+def bucket_start(moment, bucket):
+    """Start of the hour (UTC) or day (local time) holding ``moment``"""
+    if bucket == 'hour':
+        return _hour(moment)
+    return audit_archive._day_bounds(audit_archive._local_date(moment))[0]
+
+
+def bucket_starts(since, until, bucket):
+    """Starts of every bucket from the one holding ``since`` to the one holding ``until``"""
+    if bucket == 'hour':
+        first = _hour(since)
+        return [first + timedelta(hours=offset) for offset in range((_hour(until) - first) // timedelta(hours=1) + 1)]
+    # Local days are not always 24 hours long
+    first = audit_archive._local_date(since)
+    days = (audit_archive._local_date(until) - first).days + 1
+    return [audit_archive._day_bounds(first + timedelta(days=offset))[0] for offset in range(days)]
+
+
+def day_buckets_supported(since, until):
+    """Whether local days from ``since`` to ``until`` start on a whole UTC hour
+
+    Day buckets are sums of UTC hour rollups, so in time zones with a
+    half-hour offset (e.g. Asia/Kolkata) the rows of the first half hour of a
+    day would be counted in the previous day.
+    """
+    return all(
+        timezone.localtime(moment).utcoffset() % timedelta(hours=1) == timedelta(0)
+        for moment in (since, until)
+    )
+
+
+def histogram(owner, bucket, since, until, action=None):
+    """``[(bucket start, count)]`` of every bucket from ``since`` to ``until``, empty buckets included
+
+    Day buckets need a time zone offset of whole hours, see day_buckets_supported().
+    """
+    starts = bucket_starts(since, until, bucket)
+    rollups = AuditLogRollup.objects.filter(owner=owner, hour__gte=starts[0], hour__lte=until)
+    if action:
+        rollups = rollups.filter(action=action)
+    counts = Counter()
+    for hour, count in rollups.order_by().values('hour').annotate(total=Sum('count')).values_list('hour', 'total'):
+        counts[bucket_start(hour, bucket)] += count
+    return [(start, counts.get(start, 0)) for start in starts]
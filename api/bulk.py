@@ -0,0 +1,264 @@
+"""Bulk employee writes
+
+Used by ``POST /api/employees/bulk/`` and ``POST /api/employees/bulk_update/``.
+Items are validated against the cached template schema first. The valid ones
+are then inserted with ``bulk_create`` in one transaction, and every
+denormalized copy normally maintained by Employee.save()/sync_field_values()
+and the model signals (typed value columns, snapshot, projection, search
+indexes, counters, dashboard stats) is updated in bulk. Invalid items are
+reported by index without aborting the batch. Bulk updates apply one
+changeset to many employees with set-based UPDATEs and maintain the same
+copies.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import audit_rollups, counters, schema_cache
+from .changesets import typed_value
+from .field_types import parse_date, parse_number, typed_columns
+from .models import AuditLog, Employee, EmployeeFieldValue, FormField, FormTemplate
+
+
+MAX_BULK_ITEMS = 1000
+
+
+def validate_item(schema, item):
+    """Validate one employee payload, returns ``(field values, is_active, errors)``"""
+    if not isinstance(item, dict):
+        return None, None, ['expected an object']
+    errors = [f"unsupported key '{key}'" for key in item if key not in ('field_values_data', 'is_active')]
+    is_active = item.get('is_active', True)
+    if not isinstance(is_active, bool):
+        errors.append('is_active must be true or false')
+    data = item.get('field_values_data')
+    if data is None:
+        return None, None, errors + ['field_values_data is required']
+    if not isinstance(data, dict):
+        return None, None, errors + ['field_values_data must be an object']
+
+    values = {}
+    for field_id, value in data.items():
+        field = schema.field(field_id)
+        if field is None:
+            errors.append(f"unknown field {field_id}")
+            continue
+        if value in (None, ''):
+            continue
+        if field.field_type == 'number' and parse_number(value) is None:
+            errors.append(f"{field.field_label} must be a number")
+        elif field.field_type == 'date' and parse_date(value) is None:
+            errors.append(f"{field.field_label} must be a date (YYYY-MM-DD)")
+        values[field] = value
+    for field in schema.required_fields:
+        if field not in values:
+            errors.append(f"{field.field_label} is required")
+    if not values and not errors:
+        errors.append('field_values_data has no values')
+    return values, is_active, errors
+
+
+def create_employees(form_template, items, user, ip_address=None):
+    """Create the valid employees of a batch
+
+    Returns ``(created, errors)``: the created Employee objects with the index
+    of their item, and ``{'index', 'errors'}`` entries for rejected items.
+    """
+    schema = schema_cache.get_schema(form_template)
+    valid = []
+    errors = []
+    for index, item in enumerate(items):
+        values, is_active, item_errors = validate_item(schema, item)
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+        else:
+            valid.append((index, values, is_active))
+    if not valid:
+        return [], errors
+
+    with transaction.atomic():
+        employees = Employee.objects.bulk_create([
+            Employee(form_template=form_template, created_by=user, is_active=is_active)
+            for _, _, is_active in valid
+        ], batch_size=500)
+
+        field_values = []
+        for employee, (_, values, _) in zip(employees, valid):
+            for field, value in values.items():
+                if field.field_type == 'file':
+                    field_value = EmployeeFieldValue(employee=employee, field=field, file_value=value)
+                else:
+                    field_value = EmployeeFieldValue(employee=employee, field=field, value=str(value))
+                # bulk_create() does not call save(), which fills the typed columns
+                field_value.set_typed_values()
+                field_values.append(field_value)
+        EmployeeFieldValue.objects.bulk_create(field_values, batch_size=500)
+
+        by_employee = {}
+        for field_value in field_values:
+            by_employee.setdefault(field_value.employee_id, []).append(field_value)
+        Employee.bulk_sync_field_values(form_template, employees, by_employee)
+
+        logs = AuditLog.objects.bulk_create([
+            AuditLog(employee=employee, action='create', performed_by=user, ip_address=ip_address, changes={'bulk': True})
+            for employee in employees
+        ], batch_size=500)
+        audit_rollups.add(logs, {employee.pk: user.pk for employee in employees})
+
+        # Counters normally maintained by the Employee post_save signal
+        from dashboard import stats
+
+        active = sum(1 for employee in employees if employee.is_active)
+        counters.adjust(form_template.pk, total=len(employees), active=active)
+        stats.adjust(user.pk, total_employees=len(employees), active_employees=active)
+        stats.count_created(user.pk, timezone.now(), len(employees))
+        for employee in employees:
+            employee._counted_state = counters.counted_state(employee)
+
+    return [(index, employee) for (index, _, _), employee in zip(valid, employees)], errors
+
+
+def validate_changes(changes, user):
+    """Validate a bulk update changeset, returns ``(is_active, {field: value}, errors)``
+
+    ``is_active`` is None when the changeset does not change it.
+    """
+    if not isinstance(changes, dict) or not changes:
+        return None, {}, ['changes must be a non-empty object']
+    errors = [f"unsupported change '{key}'" for key in changes if key not in ('is_active', 'field_values_data')]
+    is_active = changes.get('is_active')
+    if is_active is not None and not isinstance(is_active, bool):
+        errors.append('is_active must be true or false')
+
+    data = changes.get('field_values_data') or {}
+    if not isinstance(data, dict):
+        return None, {}, errors + ['field_values_data must be an object']
+    fields = {}
+    ids = [field_id for field_id in data if str(field_id).isdigit()]
+    for field in FormField.objects.filter(id__in=ids, form_template__created_by=user):
+        fields[str(field.id)] = field
+    values = {}
+    for field_id, value in data.items():
+        field = fields.get(str(field_id))
+        if field is None:
+            errors.append(f"unknown field {field_id}")
+        elif field.field_type == 'file':
+            errors.append(f"{field.field_label} is a file field and cannot be bulk updated")
+        elif field.field_type == 'number' and value not in (None, '') and parse_number(value) is None:
+            errors.append(f"{field.field_label} must be a number")
+        elif field.field_type == 'date' and value not in (None, '') and parse_date(value) is None:
+            errors.append(f"{field.field_label} must be a date (YYYY-MM-DD)")
+        else:
+            values[field] = value
+    return is_active, values, errors
+
+
+def _set_active(employee_rows, is_active, now):
+    """Set is_active on the rows that differ, returns their ids"""
+    from dashboard import stats
+
+    changed = [row for row in employee_rows if row['is_active'] != is_active]
+    if not changed:
+        return set()
+    Employee.objects.filter(id__in=[row['id'] for row in changed]).update(is_active=is_active, updated_at=now)
+    delta = 1 if is_active else -1
+    per_template = {}
+    per_user = {}
+    for row in changed:
+        per_template[row['form_template_id']] = per_template.get(row['form_template_id'], 0) + delta
+        per_user[row['created_by_id']] = per_user.get(row['created_by_id'], 0) + delta
+    for form_template_id, active in per_template.items():
+        counters.adjust(form_template_id, active=active)
+    for user_id, active in per_user.items():
+        stats.adjust(user_id, active_employees=active)
+    return {row['id'] for row in changed}
+
+
+def _upsert_field(field, value, employee_ids, now):
+    """Set one field of the given employees, returns ``{employee_id: (old, new)}`` of the changed ones
+
+    Values are compared like api.changesets does, by typed value, so a value
+    stored as ``"51000.0"`` is not rewritten by ``51000``, and employees
+    without a stored value get no row when the new value is empty.
+    """
+    old_values = dict(
+        EmployeeFieldValue.objects.filter(field=field, employee_id__in=employee_ids).values_list('employee_id', 'value')
+    )
+    new = typed_value(field, value)
+    new_value = None if value is None else str(value)
+    columns = {'value': new_value, **typed_columns(field.field_type, new_value, field.options)}
+
+    changed = {}
+    for employee_id, stored in old_values.items():
+        old = typed_value(field, stored)
+        if old != new:
+            changed[employee_id] = (old, new)
+    if changed:
+        EmployeeFieldValue.objects.filter(field=field, employee_id__in=changed).update(updated_at=now, **columns)
+    if new is not None:
+        missing = [employee_id for employee_id in employee_ids if employee_id not in old_values]
+        EmployeeFieldValue.objects.bulk_create([
+            EmployeeFieldValue(employee_id=employee_id, field=field, **columns) for employee_id in missing
+        ], batch_size=500)
+        changed.update(dict.fromkeys(missing, (None, new)))
+    return changed
+
+
+def update_employees(queryset, is_active, values, user, ip_address=None, chunk_size=500):
+    """Apply a validated changeset to the employees of a queryset with set-based writes
+
+    Works through the matching employees in id-ordered chunks: ``is_active``
+    is changed with one UPDATE per chunk, each field with one UPDATE plus one
+    bulk_create for employees that had no value yet. Snapshots, projections
+    and search indexes of the touched employees are refreshed in bulk, and one
+    compact audit record per changed employee is inserted in a batch.
+    Returns ``(matched, updated)`` employee counts.
+    """
+    now = timezone.now()
+    matched = updated = 0
+    last_id = 0
+    rows = queryset.order_by('id').values('id', 'form_template_id', 'created_by_id', 'is_active')
+    with transaction.atomic():
+        while True:
+            chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1]['id']
+            matched += len(chunk)
+
+            changes = {}
+            if is_active is not None:
+                for employee_id in _set_active(chunk, is_active, now):
+                    changes.setdefault(employee_id, {})['is_active'] = [not is_active, is_active]
+
+            touched = {}
+            for field, value in values.items():
+                employee_ids = [row['id'] for row in chunk if row['form_template_id'] == field.form_template_id]
+                if not employee_ids:
+                    continue
+                for employee_id, (old, new) in _upsert_field(field, value, employee_ids, now).items():
+                    # Same {field_name: [old, new]} form as api.changesets
+                    changes.setdefault(employee_id, {})[field.field_name] = [old, new]
+                    touched.setdefault(field.form_template_id, set()).add(employee_id)
+
+            if touched:
+                Employee.objects.filter(id__in=set().union(*touched.values())).update(updated_at=now)
+                _resync(touched)
+
+            logs = AuditLog.objects.bulk_create([
+                AuditLog(employee_id=employee_id, action='update', performed_by=user, ip_address=ip_address,
+                         changes=employee_changes)
+                for employee_id, employee_changes in changes.items()
+            ], batch_size=500)
+            audit_rollups.add(logs, {row['id']: row['created_by_id'] for row in chunk})
+            updated += len(changes)
+    return matched, updated
+
+
+def _resync(touched):
+    """Refresh snapshots and indexes of employees whose field values changed, per template"""
+    for form_template in FormTemplate.objects.filter(id__in=touched):
+        employees = list(Employee.objects.filter(id__in=touched[form_template.id]))
+        by_employee = {}
+        for field_value in EmployeeFieldValue.objects.filter(employee_id__in=touched[form_template.id]).select_related('field'):
+            by_employee.setdefault(field_value.employee_id, []).append(field_value)
+        Employee.bulk_sync_field_values(form_template, employees, by_employee)
@@ -0,0 +1,108 @@
+"""Field-level diffs of employee updates
+
+Every employee update path builds a Changeset: the stored values of the
+fields in the payload are read in one query and compared with the incoming
+values by their typed value (so ``"50000"`` and ``"50000.0"`` are equal, and
+so are ``None`` and ``""``). Only changed fields are written, and the audit
+log records the compact ``{field_name: [old, new]}`` form of the changes.
+An update that changes nothing writes nothing and is not audited.
+"""
+from . import schema_cache
+from .field_types import to_json_value
+from .models import EmployeeFieldValue
+
+
+def typed_value(field, value):
+    """Value of a field as compared by diffs: typed, with empty values as None"""
+    if value is None or value == '':
+        return None
+    if field.field_type == 'file':
+        return str(value)
+    return to_json_value(field.field_type, str(value))
+
+
+class Changeset:
+    """Changes an update would make to an employee, see diff()"""
+
+    def __init__(self, employee):
+        self.employee = employee
+        self.attributes = {}    # name: (old, new)
+        self.fields = []        # (field, stored EmployeeFieldValue or None, new value, old typed, new typed)
+
+    def __bool__(self):
+        return bool(self.attributes or self.fields)
+
+    def as_audit(self):
+        """``{name: [old, new]}`` of every changed attribute and field"""
+        changes = {name: [_audit_value(old), _audit_value(new)] for name, (old, new) in self.attributes.items()}
+        for field, _, _, old, new in self.fields:
+            changes[field.field_name] = [old, new]
+        return changes
+
+    def apply(self):
+        """Write the changed attributes and field values, then refresh the denormalized copies"""
+        if not self:
+            return
+        employee = self.employee
+        for name, (_, new) in self.attributes.items():
+            setattr(employee, name, new)
+        employee.save()
+
+        for field, field_value, value, _, _ in self.fields:
+            if field_value is None:
+                field_value = EmployeeFieldValue(employee=employee, field=field)
+            if field.field_type == 'file' and value:
+                field_value.file_value = value
+                field_value.value = None
+            else:
+                field_value.value = None if value is None else str(value)
+                field_value.file_value = None
+            if field_value.pk is None:
+                field_value.save()
+            else:
+                field_value.save(update_fields=['value', 'file_value', 'updated_at'])
+        employee.sync_field_values()
+
+
+def _audit_value(value):
+    return getattr(value, 'pk', value)
+
+
+def diff(employee, field_values_data=None, attributes=None):
+    """Changeset of an update of ``employee``
+
+    ``field_values_data`` maps field ids to new values (fields of other
+    templates are ignored), ``attributes`` maps Employee attributes such as
+    ``is_active`` or ``form_template`` to new values.
+    """
+    changeset = Changeset(employee)
+    for name, new in (attributes or {}).items():
+        old = getattr(employee, name)
+        if _audit_value(old) != _audit_value(new):
+            changeset.attributes[name] = (old, new)
+
+    if not field_values_data:
+        return changeset
+    form_template = changeset.attributes.get('form_template', (None, employee.form_template))[1]
+    schema = schema_cache.get_schema(form_template)
+    incoming = {}
+    for field_id, value in field_values_data.items():
+        field = schema.field(field_id)
+        if field is not None:
+            incoming[field.id] = (field, value)
+    if not incoming:
+        return changeset
+
+    stored = {
+        field_value.field_id: field_value
+        for field_value in EmployeeFieldValue.objects.filter(employee=employee, field_id__in=incoming)
+    }
+    for field_id, (field, value) in incoming.items():
+        field_value = stored.get(field_id)
+        old = None
+        if field_value is not None:
+            old = typed_value(field, field_value.file_value.name if field.field_type == 'file' else field_value.value)
+        new = typed_value(field, value)
+        if old != new:
+            changeset.fields.append((field, field_value, value, old, new))
+    return changeset
@@ -0,0 +1,83 @@
+"""Counter caches of employees per form template
+
+FormTemplate.employee_count and active_employee_count are adjusted with
+``F()`` updates from the Employee post_save and post_delete signals, so they
+stay correct under concurrent writes. The per-user dashboard statistics
+(dashboard.stats) are adjusted from the same transitions. Writes that bypass
+signals (queryset ``update()``/``bulk_create()``) must call ``adjust()``
+themselves, and ``reconcile()`` (the ``reconcile_employee_counts`` command)
+repairs any drift.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def counted_state(employee):
+    """``(form_template_id, is_active)`` of an employee as last loaded or saved"""
+    state = employee.__dict__
+    if 'form_template_id' not in state or 'is_active' not in state:
+        return None
+    return state['form_template_id'], state['is_active']
+
+
+def adjust(form_template_id, total=0, active=0):
+    """Add to the employee counters of a form template"""
+    from .models import FormTemplate
+
+    if total or active:
+        FormTemplate.objects.filter(pk=form_template_id).update(
+            employee_count=F('employee_count') + total,
+            active_employee_count=F('active_employee_count') + active,
+        )
+
+
+def employee_saved(employee, created):
+    from dashboard import stats
+
+    previous = getattr(employee, '_counted_state', None)
+    current = counted_state(employee)
+    if created:
+        adjust(employee.form_template_id, total=1, active=int(bool(employee.is_active)))
+        stats.employee_added(employee)
+    elif previous is not None and current is not None and previous != current:
+        old_template_id, was_active = previous
+        new_template_id, is_active = current
+        if old_template_id != new_template_id:
+            adjust(old_template_id, total=-1, active=-int(bool(was_active)))
+            adjust(new_template_id, total=1, active=int(bool(is_active)))
+        else:
+            adjust(new_template_id, active=int(bool(is_active)) - int(bool(was_active)))
+        stats.adjust(employee.created_by_id, active_employees=int(bool(is_active)) - int(bool(was_active)))
+    employee._counted_state = current
+
+
+def employee_deleted(employee):
+    from dashboard import stats
+
+    state = getattr(employee, '_counted_state', None) or counted_state(employee)
+    if state is not None:
+        form_template_id, is_active = state
+        adjust(form_template_id, total=-1, active=-int(bool(is_active)))
+        stats.employee_removed(employee, is_active)
+
+
+def reconcile(form_templates=None):
+    """Recompute the counters from the employees table, returns the number of templates fixed"""
+    from .models import Employee, FormTemplate
+
+    if form_templates is None:
+        form_templates = FormTemplate.objects.all()
+    counts = (
+        Employee.objects.filter(form_template=OuterRef('pk')).order_by()
+        .values('form_template')
+        .annotate(total=Count('pk'), active=Count('pk', filter=Q(is_active=True)))
+    )
+    total = Coalesce(Subquery(counts.values('total'), output_field=IntegerField()), Value(0))
+    active = Coalesce(Subquery(counts.values('active'), output_field=IntegerField()), Value(0))
+    drifted = form_templates.annotate(actual_total=total, actual_active=active).filter(
+        ~Q(employee_count=F('actual_total')) | ~Q(active_employee_count=F('actual_active'))
+    )
+    drifted_ids = list(drifted.values_list('pk', flat=True))
+    if drifted_ids:
+        FormTemplate.objects.filter(pk__in=drifted_ids).update(employee_count=total, active_employee_count=active)
+    return len(drifted_ids)
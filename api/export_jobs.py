@@ -0,0 +1,215 @@
+"""Background employee export jobs
+
+``POST /api/exports/`` queues an ExportJob instead of streaming the export
+from the request thread. Jobs run on a bounded thread pool and write their
+file under ``MEDIA_ROOT/exports/``. Jobs over ``PARTITION_ROWS`` employees
+are split into id ranges exported concurrently by a process pool, and the
+partial files are concatenated in order behind a single header.
+
+Each job records a fingerprint of its parameters and a watermark of the
+exported data (employee count, highest id and latest change). A request for
+the same export while the watermark is unchanged returns the finished, or
+still running, job instead of exporting again.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from . import export_worker, exports
+from .models import Employee, EmployeeFieldValue, ExportJob
+
+
+DEFAULTS = {
+    'MAX_WORKERS': 2,           # jobs running concurrently, per process
+    'PROCESSES': 2,             # processes exporting the partitions of a job, 0 to export in the job's thread
+    'PARTITION_ROWS': 50000,    # jobs with more employees are split into id ranges
+    'MAX_WAIT': 30,             # longest long-poll of a job's status, in seconds
+}
+
+EXPORT_DIR = 'exports'
+
+_executor = None
+_process_pool = None
+_lock = threading.Lock()
+# Jobs queued or running in this process
+_active = set()
+
+
+def _setting(name):
+    return getattr(settings, 'EXPORT_JOBS', {}).get(name, DEFAULTS[name])
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_setting('MAX_WORKERS'), thread_name_prefix='export-job')
+        return _executor
+
+
+def _get_process_pool():
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            # Spawned, not forked: children must not share the parent's database connections
+            _process_pool = ProcessPoolExecutor(
+                max_workers=_setting('PROCESSES'),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=export_worker.init,
+            )
+        return _process_pool
+
+
+def job_queryset(job):
+    """Employees exported by a job"""
+    return exports.filter_queryset(
+        Employee.objects.filter(created_by_id=job.user_id),
+        job.filters.get('search'), job.form_template_id, job.filters.get('is_active'),
+        form_template=job.form_template,
+    )
+
+
+def fingerprint(user, export_format, form_template, filters):
+    payload = json.dumps([user.pk, export_format, getattr(form_template, 'pk', None), filters], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def watermark(user, form_template=None):
+    """Summary of a user's employees that changes whenever their export could"""
+    employees = Employee.objects.filter(created_by=user)
+    field_values = EmployeeFieldValue.objects.filter(employee__created_by=user)
+    if form_template is not None:
+        employees = employees.filter(form_template=form_template)
+        field_values = field_values.filter(employee__form_template=form_template)
+    state = employees.aggregate(count=Count('id'), last_id=Max('id'), updated=Max('updated_at'))
+    values_updated = field_values.aggregate(updated=Max('updated_at'))['updated']
+    parts = [state['count'], state['last_id'] or 0]
+    parts += [moment.timestamp() if moment else 0 for moment in (state['updated'], values_updated)]
+    if form_template is not None:
+        parts.append(form_template.schema_version)
+    return ':'.join(str(part) for part in parts)
+
+
+def submit(user, export_format='csv', form_template=None, filters=None):
+    """Queue an export, returns ``(job, reused)``
+
+    A finished job with the same parameters and watermark whose file still
+    exists, or such a job still queued or running in this process, is
+    returned instead of queueing a new one.
+    """
+    filters = filters or {}
+    job_fingerprint = fingerprint(user, export_format, form_template, filters)
+    job_watermark = watermark(user, form_template)
+    candidates = ExportJob.objects.filter(
+        user=user, fingerprint=job_fingerprint, watermark=job_watermark,
+    ).exclude(status='failed').order_by('-created_at')
+    for job in candidates[:5]:
+        if job.status == 'done' and job.file and os.path.exists(job.file.path):
+            return job, True
+        if not job.is_finished and job.pk in _active:
+            return job, True
+
+    job = ExportJob.objects.create(
+        user=user, export_format=export_format, form_template=form_template, filters=filters,
+        fingerprint=job_fingerprint, watermark=job_watermark,
+    )
+    with _lock:
+        _active.add(job.pk)
+    transaction.on_commit(lambda: _get_executor().submit(run, job.pk))
+    return job, False
+
+
+def wait(job, timeout):
+    """Reload a job until it finishes or ``timeout`` seconds pass"""
+    deadline = time.monotonic() + min(timeout, _setting('MAX_WAIT'))
+    while not job.is_finished and time.monotonic() < deadline:
+        time.sleep(0.5)
+        job.refresh_from_db()
+    return job
+
+
+def partitions(queryset):
+    """Id ranges ``(low, high)`` to export separately, highest first"""
+    state = queryset.aggregate(count=Count('id'), low=Min('id'), high=Max('id'))
+    count = state['count']
+    parts = 1
+    if _setting('PROCESSES') and count > _setting('PARTITION_ROWS'):
+        parts = min(_setting('PROCESSES'), -(-count // _setting('PARTITION_ROWS')))
+    if not count:
+        return [(0, 0)]
+    low, high = state['low'], state['high']
+    step = -(-(high - low + 1) // parts)
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)][::-1]
+
+
+def export_partition(job_id, low, high, path):
+    """Write the rows of a job with ids in ``[low, high]`` to ``path``, returns the row count"""
+    try:
+        job = ExportJob.objects.select_related('form_template').get(pk=job_id)
+        queryset = job_queryset(job).filter(id__gte=low, id__lte=high)
+        count = 0
+        with open(path, 'w', encoding='utf-8', newline='') as out:
+            for line in exports.stream(queryset, job.export_format, job.form_template, header=False):
+                out.write(line)
+                count += 1
+        return count
+    finally:
+        connection.close()
+
+
+def run(job_id):
+    """Produce the file of a queued job"""
+    part_paths = []
+    try:
+        job = ExportJob.objects.select_related('form_template').get(pk=job_id)
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        name = f"{EXPORT_DIR}/employees_{job.pk}.{exports.EXTENSIONS[job.export_format]}"
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ranges = partitions(job_queryset(job))
+        part_paths = [f"{path}.part{index}" for index in range(len(ranges))]
+        if len(ranges) > 1:
+            pool = _get_process_pool()
+            futures = [
+                pool.submit(export_worker.export_partition, job.pk, low, high, part_path)
+                for (low, high), part_path in zip(ranges, part_paths)
+            ]
+            counts = [future.result() for future in futures]
+        else:
+            counts = [export_partition(job.pk, *ranges[0], part_paths[0])]
+
+        with open(path, 'w', encoding='utf-8', newline='') as out:
+            out.write(exports.header_line(job.export_format, job.form_template))
+            for part_path in part_paths:
+                with open(part_path, encoding='utf-8', newline='') as part:
+                    shutil.copyfileobj(part, out)
+                os.remove(part_path)
+
+        job.file.name = name
+        job.row_count = sum(counts)
+        job.partitions = len(ranges)
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['file', 'row_count', 'partitions', 'status', 'finished_at'])
+    except Exception as e:
+        ExportJob.objects.filter(pk=job_id).update(status='failed', error=str(e), finished_at=timezone.now())
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    finally:
+        with _lock:
+            _active.discard(job_id)
+        connection.close()
@@ -0,0 +1,17 @@
+"""Entry points of the export partition processes (see api.export_jobs)
+
+Spawned processes unpickle these before Django is set up, so this module must
+not import models at import time.
+"""
+
+
+def init():
+    import django
+
+    django.setup()
+
+
+def export_partition(job_id, low, high, path):
+    from .export_jobs import export_partition
+
+    return export_partition(job_id, low, high, path)
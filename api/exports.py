@@ -0,0 +1,188 @@
+"""Streaming employee exports
+
+Rows are read in keyset batches on ``(created_at, id)`` descending, each batch
+with one ``values_list()`` query over the employee table: display names and
+field values come from the denormalized ``display_name`` and
+``values_snapshot`` columns, so no per-row queries or prefetches are needed.
+Every format is a generator over the same stream of lightweight ExportRow
+objects, for ``StreamingHttpResponse``; memory stays bounded by one batch
+and the first bytes are sent before the last rows are read.
+
+Formats:
+
+* ``csv``: fixed columns plus all field values as one JSON column keyed by label
+* ``wide``: one column per field of a single form template, in field order
+* ``ndjson``: one JSON object per line with typed values keyed by field_name
+"""
+import csv
+import json
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from . import projections, schema_cache, search_index
+
+
+BATCH_SIZE = 1000
+
+FORMATS = ('csv', 'wide', 'ndjson')
+
+CSV_HEADER = ['Employee UUID', 'Name', 'Form Template', 'Created At', 'Active']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'wide': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXTENSIONS = {
+    'csv': 'csv',
+    'wide': 'csv',
+    'ndjson': 'ndjson',
+}
+
+
+class ExportRow:
+    """One exported employee, built from a values_list() row"""
+    __slots__ = ('id', 'employee_id', 'display_name', 'template_id', 'template_name', 'created_at', 'is_active', 'values')
+
+    COLUMNS = ('id', 'employee_id', 'display_name', 'form_template_id', 'form_template__name',
+               'created_at', 'is_active', 'values_snapshot')
+
+    def __init__(self, row):
+        (self.id, self.employee_id, self.display_name, self.template_id, self.template_name,
+         self.created_at, self.is_active, self.values) = row
+        if self.values is None:
+            self.values = {}
+
+    @property
+    def name(self):
+        return self.display_name or f"Employee {self.employee_id}"
+
+    def display_value(self, field_name):
+        """Value of a field for spreadsheet cells, '' when missing"""
+        entry = self.values.get(field_name)
+        if entry is None:
+            return ''
+        value = entry.get('value')
+        if value is None or value == '':
+            return default_storage.url(entry['file_value']) if entry.get('file_value') else ''
+        if isinstance(value, bool):
+            return 'Yes' if value else 'No'
+        return value
+
+    def fixed_columns(self):
+        return [
+            str(self.employee_id),
+            self.name,
+            self.template_name,
+            self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'Yes' if self.is_active else 'No',
+        ]
+
+
+def filter_queryset(employees, search=None, form_template_id=None, is_active=None, form_template=None):
+    """Apply the employee list filters (search text, template id, 'true'/'false' status)"""
+    matches = search_index.filter_queryset(employees, search) if search else None
+    if matches is not None:
+        employees = matches | employees.filter(employee_id__icontains=search)
+    elif search and form_template is not None:
+        # Single template: match against its wide projection table
+        sql, params = projections.matching_ids_sql(form_template, terms=[search])
+        employees = employees.filter(Q(id__in=RawSQL(sql, params)) | Q(employee_id__icontains=search))
+    elif search:
+        employees = employees.filter(
+            Q(field_values__value__icontains=search) |
+            Q(employee_id__icontains=search)
+        ).distinct()
+    if form_template_id:
+        employees = employees.filter(form_template_id=form_template_id)
+    if is_active in ['true', 'false']:
+        employees = employees.filter(is_active=(is_active == 'true'))
+    return employees
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, batch_size=BATCH_SIZE):
+    """Yield ExportRow objects, newest first, with one query per batch"""
+    queryset = queryset.order_by('-created_at', '-id').values_list(*ExportRow.COLUMNS)
+    after = Q()
+    while True:
+        batch = [ExportRow(row) for row in queryset.filter(after)[:batch_size]]
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last = batch[-1]
+        after = Q(created_at__lt=last.created_at) | Q(created_at=last.created_at, id__lt=last.id)
+
+
+def header_line(export_format, form_template=None):
+    """First line of an export, '' for formats without a header"""
+    if export_format == 'ndjson':
+        return ''
+    if export_format == 'wide':
+        columns = CSV_HEADER + [field.field_label for field in schema_cache.get_schema(form_template).fields]
+    else:
+        columns = CSV_HEADER + ['Field Values (JSON)']
+    return csv.writer(Echo()).writerow(columns)
+
+
+def csv_rows(queryset, batch_size=BATCH_SIZE, header=True):
+    """Yield the lines of the CSV export with all field values in one JSON column"""
+    writer = csv.writer(Echo())
+    if header:
+        yield header_line('csv')
+    for row in iter_rows(queryset, batch_size):
+        field_map = {entry['label']: row.display_value(name) for name, entry in row.values.items()}
+        yield writer.writerow(row.fixed_columns() + [json.dumps(field_map, ensure_ascii=False)])
+
+
+def wide_rows(queryset, form_template, batch_size=BATCH_SIZE, header=True):
+    """Yield the lines of the CSV export with one column per field of a form template"""
+    fields = schema_cache.get_schema(form_template).fields
+    names = [field.field_name for field in fields]
+    writer = csv.writer(Echo())
+    if header:
+        yield header_line('wide', form_template)
+    for row in iter_rows(queryset.filter(form_template=form_template), batch_size):
+        yield writer.writerow(row.fixed_columns() + [row.display_value(name) for name in names])
+
+
+def ndjson_rows(queryset, batch_size=BATCH_SIZE):
+    """Yield one JSON line per employee with typed field values"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in iter_rows(queryset, batch_size):
+        yield encoder.encode({
+            'id': row.id,
+            'employee_id': row.employee_id,
+            'employee_name': row.name,
+            'form_template': row.template_id,
+            'form_template_name': row.template_name,
+            'created_at': row.created_at,
+            'is_active': row.is_active,
+            'values': {
+                name: entry.get('value') if entry.get('value') is not None else entry.get('file_value')
+                for name, entry in row.values.items()
+            },
+        }) + '\n'
+
+
+def stream(queryset, export_format='csv', form_template=None, batch_size=BATCH_SIZE, header=True):
+    """Generator of the requested export format, ``wide`` needs a form template
+
+    ``header=False`` leaves out the CSV header line, for partial exports that
+    are concatenated.
+    """
+    if export_format == 'wide':
+        return wide_rows(queryset, form_template, batch_size, header)
+    if export_format == 'ndjson':
+        return ndjson_rows(queryset, batch_size)
+    return csv_rows(queryset, batch_size, header)
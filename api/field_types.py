@@ -0,0 +1,77 @@
+"""Conversion of stored (text) field values to typed values based on field_type"""
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+
+TRUE_VALUES = {'true', 'on', 'yes', '1', 'checked'}
+FALSE_VALUES = {'false', 'off', 'no', '0', ''}
+
+
+def parse_number(value):
+    """Parse a stored number value, returns None if it is not numeric"""
+    if value is None:
+        return None
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        return None
+    if not number.is_finite():
+        return None
+    return number
+
+
+def parse_date(value):
+    """Parse a stored ISO date (or datetime) value, returns None if it is not a date"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        return None
+
+
+def parse_bool(value):
+    """Parse a stored checkbox value, returns None for multi-option selections"""
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return None
+    lowered = str(value).strip().lower()
+    if lowered in TRUE_VALUES:
+        return True
+    if lowered in FALSE_VALUES:
+        return False
+    return None
+
+
+def to_json_value(field_type, value):
+    """Convert a stored value to a JSON-friendly typed value for the given field type"""
+    if value is None:
+        return None
+    if field_type == 'number':
+        number = parse_number(value)
+        if number is None:
+            return value or None
+        return int(number) if number == number.to_integral_value() else float(number)
+    if field_type == 'date':
+        parsed = parse_date(value)
+        if parsed is None:
+            return value or None
+        return parsed.isoformat()
+    if field_type == 'checkbox':
+        parsed = parse_bool(value)
+        return value if parsed is None else parsed
+    return value
+
+
+def typed_columns(field_type, value, options=None):
+    """Values of the typed shadow columns of an EmployeeFieldValue"""
+    columns = {'value_number': None, 'value_date': None, 'value_bool': None}
+    if field_type == 'number':
+        number = parse_number(value)
+        columns['value_number'] = float(number) if number is not None else None
+    elif field_type == 'date':
+        columns['value_date'] = parse_date(value)
+    elif field_type == 'checkbox' and not options:
+        columns['value_bool'] = parse_bool(value)
+    return columns
@@ -0,0 +1,115 @@
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .field_types import parse_bool, parse_date, parse_number
+from .models import EmployeeFieldValue, FormField
+
+
+RANGE_LOOKUPS = ['exact', 'gt', 'gte', 'lt', 'lte', 'in']
+TEXT_LOOKUPS = ['exact', 'iexact', 'icontains', 'istartswith', 'in']
+
+
+def _parse_float(value):
+    number = parse_number(value)
+    return float(number) if number is not None else None
+
+
+def field_value_column(field):
+    """Typed EmployeeFieldValue column and value parser used to filter a form field"""
+    if field.field_type == 'number':
+        return 'value_number', _parse_float
+    if field.field_type == 'date':
+        return 'value_date', parse_date
+    if field.field_type == 'checkbox' and not field.options:
+        return 'value_bool', parse_bool
+    return 'value', str
+
+
+def field_value_exists(fields, lookup, raw_value):
+    """``EXISTS`` over EmployeeFieldValue for a condition on same-named form fields
+
+    ``fields`` are the FormFields sharing the field name (one per template).
+    Number, date and checkbox fields are compared on the typed (indexed)
+    shadow columns, other fields on the raw value. Returns ``(expression,
+    negate)``; raises ValueError with a user-facing message for invalid input.
+    """
+    field_name = fields[0].field_name
+    columns = {field_value_column(field)[0] for field in fields}
+    if len(columns) > 1:
+        raise ValueError(f"Field '{field_name}' has different types across templates, filter by form template")
+    column, parse = field_value_column(fields[0])
+
+    values = EmployeeFieldValue.objects.filter(employee=OuterRef('pk'), field_id__in=[field.id for field in fields])
+    if lookup == 'isnull':
+        is_null = parse_bool(raw_value)
+        if is_null is None:
+            raise ValueError("Expected true or false")
+        return Exists(values.filter(**{f'{column}__isnull': False})), is_null
+
+    allowed = TEXT_LOOKUPS if column == 'value' else RANGE_LOOKUPS
+    if lookup not in allowed:
+        raise ValueError(f"Unsupported lookup '{lookup}', use one of: {', '.join(allowed + ['isnull'])}")
+    if lookup == 'in':
+        raw_values = raw_value if isinstance(raw_value, (list, tuple)) else str(raw_value).split(',')
+        value = [parse(item) for item in raw_values]
+        invalid = [item for item, parsed in zip(raw_values, value) if parsed is None]
+    else:
+        value = parse(raw_value)
+        invalid = [raw_value] if value is None else []
+    if invalid:
+        raise ValueError(f"Invalid value {invalid[0]!r} for a {fields[0].field_type} field")
+    return Exists(values.filter(**{f'{column}__{lookup}': value})), False
+
+
+class FieldValueFilterBackend(BaseFilterBackend):
+    """Filter employees on dynamic field values
+
+    Query parameters look like ``f.<field_name>__<lookup>=<value>``, e.g.
+    ``?f.salary__gte=50000&f.hire_date__lt=2024-01-01``. Every condition
+    becomes an ``EXISTS`` subquery on EmployeeFieldValue (see
+    field_value_exists) and all conditions must hold.
+    """
+    prefix = 'f.'
+
+    def parse(self, query_params):
+        conditions = []
+        for key, value in query_params.items():
+            if not key.startswith(self.prefix):
+                continue
+            field_name, _, lookup = key[len(self.prefix):].partition('__')
+            conditions.append((field_name, lookup or 'exact', value))
+        return conditions
+
+    def filter_queryset(self, request, queryset, view):
+        conditions = self.parse(request.query_params)
+        if not conditions:
+            return queryset
+
+        # Only the requesting user's templates: other users' fields must not change the result or the errors
+        fields = FormField.objects.filter(
+            field_name__in={name for name, _, _ in conditions}, form_template__created_by=request.user,
+        )
+        form_template_id = request.query_params.get('form_template')
+        if form_template_id:
+            fields = fields.filter(form_template_id=form_template_id)
+        fields_by_name = {}
+        for field in fields:
+            fields_by_name.setdefault(field.field_name, []).append(field)
+
+        errors = {}
+        for field_name, lookup, raw_value in conditions:
+            key = f"{self.prefix}{field_name}__{lookup}"
+            if field_name not in fields_by_name:
+                errors[key] = f"Unknown field '{field_name}'"
+                continue
+            try:
+                exists, negate = field_value_exists(fields_by_name[field_name], lookup, raw_value)
+            except ValueError as e:
+                errors[key] = str(e)
+                continue
+            queryset = queryset.filter(~exists if negate else exists)
+
+        if errors:
+            raise ValidationError(errors)
+        return queryset
@@ -0,0 +1,342 @@
+"""In-process trigram index for typo-tolerant employee lookup
+
+Field values of text-like fields are split into words. Each distinct word gets
+a term id, and two inverted indexes are kept as compact ``array('I')`` posting
+lists:
+
+* trigram -> term ids containing it, used to find words similar to the query
+* term id -> sorted employee ids having that word
+
+Term ids of words no employee has any more are freed and reused, so
+``MAX_TERMS`` bounds the live vocabulary rather than every word ever seen.
+A search scans the posting lists of the rarest trigrams of each query word
+up to ``MAX_SCAN_POSTINGS`` entries and only probes the longer ones for the
+words found so far, and ranks only the employees it is given as candidates.
+
+Similarity is the trigram Jaccard coefficient (as in PostgreSQL's pg_trgm).
+The index is built lazily (or in the background at process startup, see
+``warm_in_background``), updated incrementally from Employee.sync_field_values()
+once the writing transaction commits, so rolled back writes never reach it,
+and periodically catches up with writes made by other processes using
+EmployeeFieldValue.updated_at.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# Field types whose values are worth fuzzy matching
+INDEXED_FIELD_TYPES = ('text', 'email', 'textarea', 'select', 'radio')
+
+DEFAULTS = {
+    'MAX_TERMS': 2_000_000,       # distinct words kept, bounds memory
+    'MAX_TERM_LENGTH': 32,        # longer words are truncated
+    'MAX_TERMS_PER_EMPLOYEE': 64,
+    'MAX_SCAN_POSTINGS': 200_000, # trigram postings counted per query word, longer lists are probed
+    'THRESHOLD': 0.2,             # minimum word similarity
+    'REFRESH_INTERVAL': 5,        # seconds between catch-up queries
+    'WARM_ON_STARTUP': True,      # build in the background when the WSGI/ASGI app loads
+}
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _setting(name):
+    return getattr(settings, 'EMPLOYEE_FUZZY_INDEX', {}).get(name, DEFAULTS[name])
+
+
+def tokenize(text):
+    """Distinct lowercase words of a text, in order of appearance"""
+    max_length = _setting('MAX_TERM_LENGTH')
+    words = []
+    seen = set()
+    for word in _WORD_RE.findall((text or '').lower()):
+        word = word[:max_length]
+        if len(word) > 1 and word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _insort(postings, value):
+    index = bisect_left(postings, value)
+    if index == len(postings) or postings[index] != value:
+        postings.insert(index, value)
+
+
+def _discard(postings, value):
+    index = bisect_left(postings, value)
+    if index < len(postings) and postings[index] == value:
+        del postings[index]
+
+
+class TrigramIndex:
+    """Trigram inverted index mapping similar words to employee ids"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.built = False
+        self.truncated = False
+        self._term_ids = {}
+        self._term_words = []
+        self._term_gram_counts = array('H')
+        self._term_employees = []
+        self._free_terms = []
+        self._grams = {}
+        self._employee_terms = {}
+        self._watermark = None
+        self._last_refresh = 0.0
+
+    def __len__(self):
+        return len(self._employee_terms)
+
+    def _term_id(self, word):
+        term_id = self._term_ids.get(word)
+        if term_id is not None:
+            return term_id
+        if len(self._term_ids) >= _setting('MAX_TERMS'):
+            if not self.truncated:
+                logger.warning("Fuzzy index reached MAX_TERMS, new words are not indexed until others are removed")
+            self.truncated = True
+            return None
+        grams = trigrams(word)
+        if self._free_terms:
+            term_id = self._free_terms.pop()
+            self._term_words[term_id] = word
+            self._term_gram_counts[term_id] = len(grams)
+        else:
+            term_id = len(self._term_employees)
+            self._term_words.append(word)
+            self._term_gram_counts.append(len(grams))
+            self._term_employees.append(array('I'))
+        self._term_ids[word] = term_id
+        for gram in grams:
+            _insort(self._grams.setdefault(gram, array('I')), term_id)
+        return term_id
+
+    def _free_term(self, term_id):
+        """Forget a word no employee has any more, its id is reused by the next new word"""
+        word = self._term_words[term_id]
+        del self._term_ids[word]
+        self._term_words[term_id] = None
+        for gram in trigrams(word):
+            postings = self._grams[gram]
+            _discard(postings, term_id)
+            if not postings:
+                del self._grams[gram]
+        self._free_terms.append(term_id)
+
+    def _set_terms(self, employee_id, words):
+        previous = self._employee_terms.pop(employee_id, ())
+        term_ids = array('I')
+        for word in words[:_setting('MAX_TERMS_PER_EMPLOYEE')]:
+            term_id = self._term_id(word)
+            if term_id is not None:
+                _insort(self._term_employees[term_id], employee_id)
+                term_ids.append(term_id)
+        kept = set(term_ids)
+        for term_id in previous:
+            if term_id not in kept:
+                postings = self._term_employees[term_id]
+                _discard(postings, employee_id)
+                if not postings:
+                    self._free_term(term_id)
+        if term_ids:
+            self._employee_terms[employee_id] = term_ids
+
+    def update_employee(self, employee_id, texts):
+        """Replace the indexed words of an employee"""
+        words = tokenize(' '.join(text for text in texts if text))
+        with self._lock:
+            if self.built:
+                self._set_terms(employee_id, words)
+
+    def remove_employee(self, employee_id):
+        with self._lock:
+            if self.built:
+                self._set_terms(employee_id, [])
+
+    def _load(self, values):
+        """Index ``(employee_id, value)`` pairs ordered by employee_id"""
+        current_id = None
+        texts = []
+        for employee_id, value in values:
+            if employee_id != current_id:
+                if current_id is not None:
+                    self._set_terms(current_id, tokenize(' '.join(texts)))
+                current_id = employee_id
+                texts = []
+            if value:
+                texts.append(value)
+        if current_id is not None:
+            self._set_terms(current_id, tokenize(' '.join(texts)))
+
+    def _indexed_values(self, employee_ids=None):
+        from .models import EmployeeFieldValue
+
+        values = EmployeeFieldValue.objects.filter(field__field_type__in=INDEXED_FIELD_TYPES)
+        if employee_ids is not None:
+            values = values.filter(employee_id__in=employee_ids)
+        return values.order_by('employee_id').values_list('employee_id', 'value')
+
+    def build(self):
+        """(Re)build the whole index from the database"""
+        with self._lock:
+            started = time.monotonic()
+            self._clear()
+            self._watermark = timezone.now()
+            self._load(self._indexed_values().iterator(chunk_size=5000))
+            self.built = True
+            self._last_refresh = time.monotonic()
+            logger.info("Fuzzy index built: %d employees, %d terms in %.2fs",
+                        len(self._employee_terms), len(self._term_ids), time.monotonic() - started)
+
+    def refresh(self, force=False):
+        """Re-index employees whose field values changed since the last build/refresh"""
+        from .models import EmployeeFieldValue
+
+        with self._lock:
+            if not self.built:
+                self.build()
+                return
+            if not force and time.monotonic() - self._last_refresh < _setting('REFRESH_INTERVAL'):
+                return
+            watermark = timezone.now()
+            changed = list(
+                EmployeeFieldValue.objects.filter(updated_at__gte=self._watermark)
+                .values_list('employee_id', flat=True).distinct()
+            )
+            for start in range(0, len(changed), 500):
+                chunk = changed[start:start + 500]
+                for employee_id in chunk:
+                    self._set_terms(employee_id, [])
+                self._load(self._indexed_values(chunk).iterator())
+            self._watermark = watermark
+            self._last_refresh = time.monotonic()
+
+    def search(self, text, limit=100, threshold=None, employee_ids=None):
+        """Employees ranked by similarity to the text
+
+        Returns ``[(employee_id, similarity), ...]``, best first. The score of
+        an employee is the average over the query words of the best matching
+        indexed word. ``employee_ids`` is the set of employees that may be
+        returned, applied before ranking so the matches of other employees
+        never take their place.
+        """
+        if threshold is None:
+            threshold = _setting('THRESHOLD')
+        words = tokenize(text)
+        if not words:
+            return []
+        self.refresh()
+
+        max_scan = _setting('MAX_SCAN_POSTINGS')
+        scores = Counter()
+        with self._lock:
+            for word in words:
+                grams = trigrams(word)
+                postings_by_length = sorted(
+                    (self._grams[gram] for gram in grams if gram in self._grams), key=len,
+                )
+                shared_counts = Counter()
+                scanned = 0
+                probed = []
+                for postings in postings_by_length:
+                    if scanned and scanned + len(postings) > max_scan:
+                        probed.append(postings)
+                        continue
+                    shared_counts.update(postings)
+                    scanned += len(postings)
+                # Common trigrams only add to the words already found by the rarer ones
+                for postings in probed:
+                    for term_id in list(shared_counts):
+                        position = bisect_left(postings, term_id)
+                        if position < len(postings) and postings[position] == term_id:
+                            shared_counts[term_id] += 1
+
+                best = {}
+                for term_id, shared in shared_counts.items():
+                    similarity = shared / (len(grams) + self._term_gram_counts[term_id] - shared)
+                    if similarity < threshold:
+                        continue
+                    for employee_id in self._term_employees[term_id]:
+                        if employee_ids is not None and employee_id not in employee_ids:
+                            continue
+                        if similarity > best.get(employee_id, 0.0):
+                            best[employee_id] = similarity
+                scores.update(best)
+
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(employee_id, score / len(words)) for employee_id, score in ranked]
+
+    def stats(self):
+        with self._lock:
+            posting_bytes = sum(p.buffer_info()[1] * p.itemsize for p in self._grams.values())
+            posting_bytes += sum(p.buffer_info()[1] * p.itemsize for p in self._term_employees)
+            posting_bytes += sum(p.buffer_info()[1] * p.itemsize for p in self._employee_terms.values())
+            return {
+                'built': self.built,
+                'truncated': self.truncated,
+                'employees': len(self._employee_terms),
+                'terms': len(self._term_ids),
+                'trigrams': len(self._grams),
+                'posting_bytes': posting_bytes,
+            }
+
+
+index = TrigramIndex()
+
+
+def update_employee(employee):
+    """Refresh the indexed words of an employee from its values_snapshot when the transaction commits"""
+    employee_id = employee.pk
+    texts = [
+        entry.get('value') for entry in (employee.values_snapshot or {}).values()
+        if entry.get('type') in INDEXED_FIELD_TYPES and isinstance(entry.get('value'), str)
+    ]
+    transaction.on_commit(lambda: index.update_employee(employee_id, texts))
+
+
+def remove_employee(employee_id):
+    transaction.on_commit(lambda: index.remove_employee(employee_id))
+
+
+def search(text, limit=100, employee_ids=None):
+    return index.search(text, limit=limit, employee_ids=employee_ids)
+
+
+def warm_in_background():
+    """Build the index in a daemon thread so the first fuzzy search is fast"""
+    if not _setting('WARM_ON_STARTUP'):
+        return
+
+    def build():
+        from django.db import connection
+
+        try:
+            index.refresh()
+        except Exception:
+            logger.exception("Could not build the fuzzy index")
+        finally:
+            connection.close()
+
+    threading.Thread(target=build, name='fuzzy-index-warmup', daemon=True).start()
@@ -0,0 +1,126 @@
+"""Streaming CSV import of employees
+
+Used by the ``import_employees`` command and ``POST /api/employees/import/``.
+The file is read row by row; the header is mapped to the fields of the form
+template by field_name or field_label (case-insensitive), and an optional
+``is_active`` column sets the status. Rows are validated and written in
+chunks through ``bulk.create_employees()``, each chunk in its own transaction,
+so memory stays bounded and an interrupted import can be resumed by skipping
+the rows of the chunks already committed (``ImportProgress.rows``).
+"""
+import csv
+import time
+
+from . import bulk, schema_cache
+from .field_types import parse_bool
+
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFileError(ValueError):
+    """Raised when the file cannot be imported at all, e.g. an unmappable header"""
+
+
+class ImportProgress:
+    """Running totals of an import, ``rows`` is the number of data rows committed"""
+
+    def __init__(self, rows=0):
+        self.rows = rows
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.unmapped_columns = []
+        self.started = time.monotonic()
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return round(self.processed / elapsed, 1) if elapsed else 0.0
+
+    @property
+    def processed(self):
+        return self.created + self.failed
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'unmapped_columns': self.unmapped_columns,
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def map_columns(schema, header):
+    """Map header columns to fields, returns ``({column index: field}, is_active index, unmapped columns)``"""
+    fields = {}
+    for field in schema:
+        fields.setdefault(field.field_name.strip().lower(), field)
+        fields.setdefault(field.field_label.strip().lower(), field)
+    mapping = {}
+    status_column = None
+    unmapped = []
+    for index, column in enumerate(header):
+        key = column.strip().lower()
+        if key in ('is_active', 'active'):
+            status_column = index
+        elif key in fields:
+            mapping[index] = fields[key]
+        else:
+            unmapped.append(column)
+    return mapping, status_column, unmapped
+
+
+def import_csv(form_template, lines, user, start_row=0, chunk_size=CHUNK_SIZE, ip_address=None, on_chunk=None):
+    """Import employees from an iterable of CSV lines, returns the ImportProgress
+
+    The first ``start_row`` data rows are skipped. ``on_chunk(progress)`` is
+    called after every committed chunk.
+    """
+    schema = schema_cache.get_schema(form_template)
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        raise ImportFileError('The file is empty')
+    mapping, status_column, unmapped = map_columns(schema, header)
+    if not mapping:
+        raise ImportFileError('No column matches a field of the form template')
+
+    progress = ImportProgress(start_row)
+    progress.unmapped_columns = unmapped
+    chunk = []
+    row_number = start_row
+    for row_number, row in enumerate(reader, start=1):
+        if row_number <= start_row or not any(cell.strip() for cell in row):
+            continue
+        item = {'field_values_data': {
+            str(field.id): row[index].strip() for index, field in mapping.items() if index < len(row)
+        }}
+        if status_column is not None and status_column < len(row):
+            is_active = parse_bool(row[status_column])
+            if is_active is not None:
+                item['is_active'] = is_active
+        chunk.append((row_number, item))
+        if len(chunk) >= chunk_size:
+            _write_chunk(form_template, chunk, row_number, user, ip_address, progress, on_chunk)
+            chunk = []
+    if chunk or row_number > progress.rows:
+        _write_chunk(form_template, chunk, row_number, user, ip_address, progress, on_chunk)
+    return progress
+
+
+def _write_chunk(form_template, chunk, last_row, user, ip_address, progress, on_chunk):
+    created, errors = [], []
+    if chunk:
+        created, errors = bulk.create_employees(form_template, [item for _, item in chunk], user, ip_address)
+    progress.rows = last_row
+    progress.created += len(created)
+    progress.failed += len(errors)
+    for error in errors:
+        if len(progress.errors) < MAX_REPORTED_ERRORS:
+            progress.errors.append({'row': chunk[error['index']][0], 'errors': error['errors']})
+    if on_chunk:
+        on_chunk(progress)
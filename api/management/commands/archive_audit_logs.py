@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import audit_archive
+
+
+class Command(BaseCommand):
+    help = "Move audit log rows older than the retention period to compressed daily archive segments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Retention period in days (default: AUDIT_ARCHIVE["RETENTION_DAYS"])')
+
+    def handle(self, *args, **options):
+        def on_day(day, count):
+            self.stdout.write(f"{day}: archived {count} rows")
+
+        moved = audit_archive.archive(options['days'], on_day=on_day)
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} audit log rows to {audit_archive.archive_dir()}"))
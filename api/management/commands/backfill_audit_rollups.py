@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api import audit_archive, audit_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the hourly audit log rollups behind /api/audit-logs/histogram/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None,
+                            help='First day to recompute, YYYY-MM-DD (default: day of the oldest audit log row)')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every day, including all archived segments')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            day = parse_date(options['since'])
+            if day is None:
+                raise CommandError(f"Invalid date: {options['since']}")
+            since, _ = audit_archive._day_bounds(day)
+        written = audit_rollups.backfill(since, everything=options['all'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} audit rollup rows"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.models import FormTemplate
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored employee display names from each template's name field"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, action='append', dest='templates',
+                            help='Only backfill the given form template id (repeatable)')
+
+    def handle(self, *args, **options):
+        templates = FormTemplate.objects.all()
+        if options['templates']:
+            templates = templates.filter(id__in=options['templates'])
+
+        total = 0
+        for form_template in templates.iterator():
+            updated = form_template.sync_employee_display_names()
+            total += updated
+            self.stdout.write(f"{form_template.name}: {updated} employees updated")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled display names for {total} employees"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.field_types import typed_columns
+from api.models import EmployeeFieldValue, FormField
+
+
+class Command(BaseCommand):
+    help = "Fill the typed value_number/value_date/value_bool columns of existing field values"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        columns = ['value_number', 'value_date', 'value_bool']
+        total = 0
+        for field in FormField.objects.filter(field_type__in=['number', 'date', 'checkbox']).iterator():
+            batch = []
+            values = EmployeeFieldValue.objects.filter(field=field).only('id', 'value', *columns)
+            for field_value in values.iterator(chunk_size=chunk_size):
+                for column, typed in typed_columns(field.field_type, field_value.value, field.options).items():
+                    setattr(field_value, column, typed)
+                batch.append(field_value)
+                if len(batch) >= chunk_size:
+                    EmployeeFieldValue.objects.bulk_update(batch, columns)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                EmployeeFieldValue.objects.bulk_update(batch, columns)
+                total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled typed columns of {total} field values"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import projections
+from api.models import FormTemplate
+
+
+class Command(BaseCommand):
+    help = "Compare the per-template wide projection tables with the field values"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, action='append', dest='templates',
+                            help='Only check the given form template id (repeatable)')
+        parser.add_argument('--repair', action='store_true', help='Rebuild projections that are out of sync')
+        parser.add_argument('--limit', type=int, default=20, help='Maximum problems to print per template')
+
+    def handle(self, *args, **options):
+        templates = FormTemplate.objects.all()
+        if options['templates']:
+            templates = templates.filter(id__in=options['templates'])
+
+        inconsistent = []
+        for form_template in templates.iterator():
+            problems = projections.check_consistency(form_template)
+            if not problems:
+                self.stdout.write(f"{form_template.name}: OK")
+                continue
+
+            inconsistent.append(form_template)
+            self.stdout.write(self.style.WARNING(f"{form_template.name}: {len(problems)} problems"))
+            for employee_id, problem in problems[:options['limit']]:
+                self.stdout.write(f"  employee {employee_id}: {problem}")
+            if options['repair']:
+                projections.rebuild(form_template)
+                self.stdout.write(f"  rebuilt {projections.table_name(form_template.id)}")
+
+        if inconsistent and not options['repair']:
+            raise CommandError(f"{len(inconsistent)} projections are out of sync, run with --repair to rebuild them")
+        self.stdout.write(self.style.SUCCESS("Projections checked"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import audit
+
+
+class Command(BaseCommand):
+    help = "Write audit events left in the journal by processes that exited before flushing them"
+
+    def handle(self, *args, **options):
+        written = audit.replay_journals()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} audit log entries from {audit.journal_dir()}"))
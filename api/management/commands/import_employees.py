@@ -0,0 +1,64 @@
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api import imports
+from api.models import FormTemplate
+
+
+class Command(BaseCommand):
+    help = "Import employees of a form template from a CSV file, resumable after an interruption"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row of field names or labels')
+        parser.add_argument('--template', type=int, required=True, help='Form template id')
+        parser.add_argument('--user', required=True, help='Username recorded as the creator')
+        parser.add_argument('--chunk-size', type=int, default=imports.CHUNK_SIZE,
+                            help='Rows written per transaction')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the rows committed by a previous run, as recorded in <path>.progress')
+
+    def handle(self, *args, **options):
+        form_template = FormTemplate.objects.filter(id=options['template']).first()
+        if form_template is None:
+            raise CommandError(f"Form template {options['template']} does not exist")
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        state_path = f"{options['path']}.progress"
+        start_row = 0
+        if options['resume'] and os.path.exists(state_path):
+            with open(state_path) as state_file:
+                start_row = json.load(state_file)['rows']
+            self.stdout.write(f"Resuming after row {start_row}")
+
+        def on_chunk(progress):
+            # Written after the chunk's transaction committed
+            with open(state_path, 'w') as state_file:
+                json.dump({'template': form_template.id, 'rows': progress.rows}, state_file)
+            self.stdout.write(
+                f"Row {progress.rows}: {progress.created} created, {progress.failed} failed, "
+                f"{progress.rows_per_second} rows/s"
+            )
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as lines:
+                progress = imports.import_csv(
+                    form_template, lines, user, start_row=start_row,
+                    chunk_size=options['chunk_size'], on_chunk=on_chunk,
+                )
+        except (OSError, imports.ImportFileError) as e:
+            raise CommandError(str(e))
+
+        if progress.unmapped_columns:
+            self.stdout.write(self.style.WARNING(f"Ignored columns: {', '.join(progress.unmapped_columns)}"))
+        for error in progress.errors:
+            self.stdout.write(self.style.ERROR(f"Row {error['row']}: {'; '.join(error['errors'])}"))
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {progress.created} employees, {progress.failed} rows failed ({progress.rows_per_second} rows/s)"
+        ))
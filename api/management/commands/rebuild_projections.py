@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api import projections
+from api.models import FormTemplate
+
+
+class Command(BaseCommand):
+    help = "Drop and repopulate the per-template wide projection tables from the field values"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, action='append', dest='templates',
+                            help='Only rebuild the given form template id (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        templates = FormTemplate.objects.all()
+        if options['templates']:
+            templates = templates.filter(id__in=options['templates'])
+
+        for form_template in templates.iterator():
+            count = projections.rebuild(form_template, chunk_size=options['chunk_size'])
+            self.stdout.write(f"{form_template.name}: {count} rows in {projections.table_name(form_template.id)}")
+
+        self.stdout.write(self.style.SUCCESS("Projections rebuilt"))
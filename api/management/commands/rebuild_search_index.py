@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import search_index
+
+
+class Command(BaseCommand):
+    help = "Drop and repopulate the FTS5 employee search index"
+
+    def handle(self, *args, **options):
+        if not search_index.available():
+            raise CommandError("The database does not support FTS5, searches use icontains lookups instead")
+        count = search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} employees in {search_index.TABLE}"))
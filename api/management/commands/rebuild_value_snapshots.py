@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.models import FormTemplate
+
+
+class Command(BaseCommand):
+    help = "Rewrite the stored values_snapshot (and display name) of every employee"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, action='append', dest='templates',
+                            help='Only rebuild the given form template id (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        templates = FormTemplate.objects.all()
+        if options['templates']:
+            templates = templates.filter(id__in=options['templates'])
+
+        total = 0
+        for form_template in templates.iterator():
+            rebuilt = form_template.rebuild_employee_snapshots(chunk_size=options['chunk_size'])
+            total += rebuilt
+            self.stdout.write(f"{form_template.name}: {rebuilt} employees rebuilt")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt value snapshots for {total} employees"))
@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from dashboard import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the incrementally maintained dashboard statistics of every user (run periodically)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only reconcile the given user id (repeatable)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        drifted = stats.reconcile(users.iterator())
+        self.stdout.write(self.style.SUCCESS(f"Reconciled dashboard stats, {drifted} users were out of sync"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api import counters
+from api.models import FormTemplate
+
+
+class Command(BaseCommand):
+    help = "Recompute the employee counters of form templates from the employees table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, action='append', dest='templates',
+                            help='Only reconcile the given form template id (repeatable)')
+
+    def handle(self, *args, **options):
+        templates = FormTemplate.objects.all()
+        if options['templates']:
+            templates = templates.filter(id__in=options['templates'])
+
+        fixed = counters.reconcile(templates)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled employee counts, {fixed} templates were out of sync"))
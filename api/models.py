@@ -1,8 +1,11 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 
+from .field_types import to_json_value, typed_columns
+
 
 class UserProfile(models.Model):
     """Extended user profile model"""
@@ -38,6 +41,15 @@ class FormTemplate(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    name_field = models.ForeignKey(
+        'FormField', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Field whose value is used as the employee display name"
+    )
+    # Bumped whenever the fields change, invalidates cached compiled schemas (see schema_cache)
+    schema_version = models.PositiveIntegerField(default=1, editable=False)
+    # Counter caches maintained by api.counters
+    employee_count = models.IntegerField(default=0, editable=False)
+    active_employee_count = models.IntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-created_at']
@@ -45,6 +57,51 @@ class FormTemplate(models.Model):
     def __str__(self):
         return self.name
 
+    def bump_schema_version(self):
+        """Invalidate compiled schemas of this template cached by any process"""
+        from django.db.models import F
+
+        FormTemplate.objects.filter(pk=self.pk).update(schema_version=F('schema_version') + 1)
+        self.refresh_from_db(fields=['schema_version'])
+
+    def resolve_name_field(self):
+        """Get the field used for employee display names"""
+        if self.name_field_id:
+            return self.name_field
+        return self.fields.filter(field_name__icontains='name').order_by('order', 'created_at').first()
+
+    def sync_employee_display_names(self):
+        """Recompute the stored display name of every employee on this template"""
+        from django.db.models import OuterRef, Subquery, Value
+        from django.db.models.functions import Coalesce, Substr
+
+        name_field = self.resolve_name_field()
+        if name_field is None:
+            return self.employees.update(display_name='')
+        name_value = EmployeeFieldValue.objects.filter(
+            employee=OuterRef('pk'), field=name_field
+        ).values('value')[:1]
+        return self.employees.update(
+            display_name=Coalesce(Substr(Subquery(name_value), 1, DISPLAY_NAME_MAX_LENGTH), Value(''))
+        )
+
+    def rebuild_employee_snapshots(self, chunk_size=500):
+        """Rewrite values_snapshot and display_name of every employee on this template"""
+        from django.db.models import Prefetch
+
+        fields = list(self.fields.all())
+        field_values = EmployeeFieldValue.objects.select_related('field')
+        employees = self.employees.prefetch_related(Prefetch('field_values', queryset=field_values))
+        count = 0
+        for employee in employees.iterator(chunk_size=chunk_size):
+            employee.form_template = self
+            employee.sync_field_values(field_values=employee.field_values.all(), fields=fields)
+            count += 1
+        return count
+
+
+DISPLAY_NAME_MAX_LENGTH = 255
+
 
 class FormField(models.Model):
     """Individual fields within a form template"""
@@ -79,6 +136,11 @@ class Employee(models.Model):
     password = models.CharField(max_length=128, blank=True, null=True)  # Will store hashed password
     is_employee_active = models.BooleanField(default=True)
     last_login = models.DateTimeField(blank=True, null=True)
+
+    # Denormalized value of the template's name field, kept in sync by sync_field_values()
+    display_name = models.CharField(max_length=DISPLAY_NAME_MAX_LENGTH, blank=True, default='', db_index=True)
+    # Typed copy of the field values keyed by field_name, rewritten by sync_field_values()
+    values_snapshot = models.JSONField(default=dict, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -86,17 +148,86 @@ class Employee(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's employees on (created_at, id)
+            models.Index(fields=['created_by', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Employee {self.employee_id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from .counters import counted_state
+
+        instance = super().from_db(db, field_names, values)
+        # Template and status as loaded, compared on save to maintain the template counters
+        instance._counted_state = counted_state(instance)
+        return instance
+
     @property
     def employee_name(self):
-        """Get employee name from dynamic fields"""
-        name_field = self.field_values.filter(field__field_name__icontains='name').first()
-        if name_field:
-            return name_field.value
+        """Get employee name from the stored display name"""
+        if self.display_name:
+            return self.display_name
         return f"Employee {self.employee_id}"
+
+    def sync_field_values(self, field_values=None, fields=None, save=True):
+        """Refresh values_snapshot and display_name from the stored field values"""
+        if field_values is None:
+            field_values = self.field_values.select_related('field')
+        from . import schema_cache
+
+        schema = schema_cache.get_schema(self.form_template)
+        name_field_id = getattr(schema.name_field, 'id', None)
+        if fields is None:
+            fields = schema.fields
+
+        snapshot = {}
+        display_name = ''
+        for fv in sorted(field_values, key=lambda fv: (fv.field.order, fv.field.created_at)):
+            field = fv.field
+            snapshot[field.field_name] = {
+                'id': fv.id,
+                'field': field.id,
+                'label': field.field_label,
+                'type': field.field_type,
+                'order': field.order,
+                'value': to_json_value(field.field_type, fv.value),
+                'file_value': fv.file_value.name or None,
+            }
+            if field.id == name_field_id:
+                display_name = (fv.value or '')[:DISPLAY_NAME_MAX_LENGTH]
+
+        self.values_snapshot = snapshot
+        self.display_name = display_name
+        if save and self.pk:
+            from . import fuzzy_index, projections, search_index
+
+            Employee.objects.filter(pk=self.pk).update(values_snapshot=snapshot, display_name=display_name)
+            projections.sync_employee(self, fields=fields)
+            search_index.index_employee(self.pk)
+            fuzzy_index.update_employee(self)
+        return snapshot
+
+    @classmethod
+    def bulk_sync_field_values(cls, form_template, employees, field_values):
+        """sync_field_values() for many employees of one template in a few queries
+
+        ``field_values`` maps employee pk to its EmployeeFieldValue rows (with
+        their field set).
+        """
+        from . import fuzzy_index, projections, schema_cache, search_index
+
+        fields = schema_cache.get_schema(form_template).fields
+        for employee in employees:
+            employee.form_template = form_template
+            employee.sync_field_values(field_values=field_values.get(employee.pk, []), fields=fields, save=False)
+        cls.objects.bulk_update(employees, ['values_snapshot', 'display_name'], batch_size=500)
+        projections.sync_employees(form_template, employees, fields)
+        search_index.index_employees([employee.pk for employee in employees])
+        for employee in employees:
+            fuzzy_index.update_employee(employee)
     
     def set_password(self, raw_password):
         """Set password for employee"""
@@ -115,15 +246,36 @@ class EmployeeFieldValue(models.Model):
     field = models.ForeignKey(FormField, on_delete=models.CASCADE, related_name='employee_values')
     value = models.TextField(blank=True, null=True)
     file_value = models.FileField(upload_to='employee_files/', blank=True, null=True)
+    # Typed copies of value for range filters, filled from field.field_type on save
+    value_number = models.FloatField(blank=True, null=True)
+    value_date = models.DateField(blank=True, null=True)
+    value_bool = models.BooleanField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['employee', 'field']
+        indexes = [
+            models.Index(fields=['field', 'value_number']),
+            models.Index(fields=['field', 'value_date']),
+            models.Index(fields=['field', 'value_bool']),
+        ]
 
     def __str__(self):
         return f"{self.employee.employee_name} - {self.field.field_label}: {self.value}"
 
+    def set_typed_values(self):
+        """Fill the typed shadow columns from value according to the field type"""
+        for column, typed in typed_columns(self.field.field_type, self.value, self.field.options).items():
+            setattr(self, column, typed)
+
+    def save(self, *args, **kwargs):
+        self.set_typed_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'value_number', 'value_date', 'value_bool'}
+        super().save(*args, **kwargs)
+
 
 class AuditLog(models.Model):
     """Audit trail for employee operations"""
@@ -138,13 +290,74 @@ class AuditLog(models.Model):
     action = models.CharField(max_length=10, choices=ACTION_TYPES)
     performed_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     changes = models.JSONField(blank=True, null=True, help_text="Field changes made")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, rows may be inserted later by the buffered writer (api.audit)
+    timestamp = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination on (timestamp, id)
+            models.Index(fields=['timestamp', 'id']),
+        ]
 
     def __str__(self):
         performed_by_name = self.performed_by.username if self.performed_by else "System"
-        return f"{self.action.title()} {self.employee.employee_name} by {performed_by_name}"
\ No newline at end of file
+        return f"{self.action.title()} {self.employee.employee_name} by {performed_by_name}"
+
+
+class AuditLogRollup(models.Model):
+    """Number of audit log entries per hour and action for the owner of the employees, see api.audit_rollups"""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='audit_rollups')
+    hour = models.DateTimeField()
+    action = models.CharField(max_length=10, choices=AuditLog.ACTION_TYPES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['hour']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'hour', 'action'], name='unique_audit_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 {self.action} x{self.count}"
+
+
+class ExportJob(models.Model):
+    """Employee export produced in the background, see api.export_jobs"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    export_format = models.CharField(max_length=10, default='csv')
+    form_template = models.ForeignKey(FormTemplate, on_delete=models.CASCADE, null=True, blank=True)
+    filters = models.JSONField(default=dict, blank=True, help_text="search and is_active filters")
+    # Hash of user, format, template and filters; with the watermark it identifies reusable artifacts
+    fingerprint = models.CharField(max_length=64)
+    watermark = models.CharField(max_length=100, help_text="State of the exported employees when the job was queued")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='exports/', blank=True, null=True)
+    row_count = models.PositiveIntegerField(default=0)
+    partitions = models.PositiveIntegerField(default=1)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'fingerprint', 'watermark']),
+        ]
+
+    def __str__(self):
+        return f"{self.export_format} export {self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
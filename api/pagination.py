@@ -0,0 +1,124 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """Page number pagination with opt-in keyset (cursor) pagination
+
+    Requests with ``?pagination=cursor`` (or a ``cursor`` parameter) are
+    paginated on the view's ``keyset_ordering``, e.g. ``('-created_at', '-id')``:
+    each page is a range scan after the last row of the previous one, so deep
+    pages cost the same as the first and no ``COUNT(*)`` is run (pass
+    ``count=true`` to get it anyway). Responses carry opaque ``next`` and
+    ``previous`` cursors that stay stable while rows are inserted.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def use_keyset(self, request, view):
+        if getattr(view, 'keyset_ordering', None) is None:
+            return False
+        params = request.query_params
+        return self.cursor_query_param in params or params.get(self.mode_query_param) == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.use_keyset(request, view)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = [name.lstrip('-') for name in view.keyset_ordering]
+        self.descending = view.keyset_ordering[0].startswith('-')
+        self.model = queryset.model
+        self.count = queryset.count() if request.query_params.get(self.count_query_param) == 'true' else None
+
+        position, reverse = self.decode_cursor(request)
+        # Walking backwards reverses the ordering, the page is flipped afterwards
+        descending = self.descending != reverse
+        order_by = [f"-{name}" if descending else name for name in self.ordering]
+        if position is not None:
+            queryset = queryset.filter(self.after(position, descending))
+        loaded, deferred = queryset.query.deferred_loading
+        if not deferred:
+            # Querysets restricted with only() still need the cursor columns
+            queryset = queryset.only(*loaded, *self.ordering)
+        rows = list(queryset.order_by(*order_by)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page_rows = rows
+        return rows
+
+    def after(self, position, descending):
+        """Rows strictly after ``position`` in the (possibly reversed) ordering"""
+        lookup = 'lt' if descending else 'gt'
+        q = Q()
+        for index, name in enumerate(self.ordering):
+            equal = {self.ordering[i]: position[i] for i in range(index)}
+            q |= Q(**equal, **{f"{name}__{lookup}": position[index]})
+        return q
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        # isoformat() keeps the microseconds that DjangoJSONEncoder would drop
+        values = [getattr(row, name) for name in self.ordering]
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page_rows:
+            return None
+        return self.encode_cursor(self.page_rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.page_rows:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page_rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
@@ -0,0 +1,339 @@
+"""Per-template wide table projections of employee field values
+
+For every FormTemplate a real table ``api_employee_projection_<template id>``
+is kept with one typed column per FormField (``f_<field id>``) and one row per
+employee. The EmployeeFieldValue rows stay the source of truth; the projection
+is rewritten from Employee.values_snapshot on every employee write so reporting
+queries can filter a single narrow table instead of self-joining the EAV rows.
+
+A column whose field changed type (e.g. text to number) is dropped and added
+again with the new type by ensure_table(), and refilled from the EAV rows.
+"""
+from django.db import connection, transaction
+
+from .field_types import parse_bool, parse_date, parse_number, to_json_value
+
+
+TABLE_PREFIX = 'api_employee_projection_'
+KEY_COLUMN = 'employee_id'
+
+# Django field class whose database column type is used for each kind of value
+COLUMN_FIELD_CLASSES = {
+    'number': 'FloatField',
+    'date': 'DateField',
+    'bool': 'BooleanField',
+    'text': 'TextField',
+}
+
+# Kind of each column known to exist per template table, filled lazily from introspection
+_known_columns = {}
+
+
+def table_name(form_template_id):
+    return f"{TABLE_PREFIX}{form_template_id}"
+
+
+def column_name(field):
+    return f"f_{field.id}"
+
+
+def column_kind(field):
+    """Kind of typed column used for a form field"""
+    if field.field_type in ('number', 'date'):
+        return field.field_type
+    if field.field_type == 'checkbox' and not field.options:
+        return 'bool'
+    return 'text'
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _column_type(field):
+    return connection.data_types[COLUMN_FIELD_CLASSES[column_kind(field)]]
+
+
+def column_value(field, raw_value):
+    """Convert a stored field value to the value written to its projection column"""
+    kind = column_kind(field)
+    if kind == 'number':
+        number = parse_number(raw_value)
+        return float(number) if number is not None else None
+    if kind == 'date':
+        return connection.ops.adapt_datefield_value(parse_date(raw_value))
+    if kind == 'bool':
+        return parse_bool(raw_value)
+    if raw_value in (None, ''):
+        return None
+    return str(raw_value)
+
+
+def _normalize(field, value):
+    """Normalize a value read back from a projection column for comparisons"""
+    if value is None:
+        return None
+    kind = column_kind(field)
+    if kind == 'number':
+        return float(value)
+    if kind == 'date':
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    if kind == 'bool':
+        return bool(value)
+    return str(value)
+
+
+def _existing_columns(cursor, form_template_id):
+    """``{column: kind}`` of a projection table, None if it does not exist"""
+    table = table_name(form_template_id)
+    if table not in connection.introspection.table_names(cursor):
+        return None
+    kinds = {field_class: kind for kind, field_class in COLUMN_FIELD_CLASSES.items()}
+    introspection = connection.introspection
+    return {
+        col.name: kinds.get(introspection.get_field_type(col.type_code, col))
+        for col in introspection.get_table_description(cursor, table)
+    }
+
+
+def _index_name(table, field):
+    return f"{table}_{column_name(field)}_idx"
+
+
+def ensure_table(form_template, fields=None):
+    """Create the projection table of a template, add columns for new fields and retype changed ones"""
+    if fields is None:
+        fields = list(form_template.fields.all())
+    wanted = {column_name(field): column_kind(field) for field in fields}
+    known = _known_columns.get(form_template.id)
+    if known is not None and wanted.items() <= known.items():
+        return
+
+    table = table_name(form_template.id)
+    with connection.cursor() as cursor:
+        existing = _existing_columns(cursor, form_template.id)
+        if existing is None:
+            columns = [f"{_qn(KEY_COLUMN)} {connection.data_types['BigIntegerField']} NOT NULL PRIMARY KEY"]
+            columns += [f"{_qn(column_name(field))} {_column_type(field)} NULL" for field in fields]
+            cursor.execute(f"CREATE TABLE {_qn(table)} ({', '.join(columns)})")
+            existing = {KEY_COLUMN: None}
+            new_fields = fields
+            retyped = []
+        else:
+            retyped = [
+                field for field in fields
+                if column_name(field) in existing and existing[column_name(field)] != column_kind(field)
+            ]
+            for field in retyped:
+                cursor.execute(f"DROP INDEX IF EXISTS {_qn(_index_name(table, field))}")
+                cursor.execute(f"ALTER TABLE {_qn(table)} DROP COLUMN {_qn(column_name(field))}")
+            new_fields = [field for field in fields if column_name(field) not in existing] + retyped
+            for field in new_fields:
+                cursor.execute(
+                    f"ALTER TABLE {_qn(table)} ADD COLUMN {_qn(column_name(field))} {_column_type(field)} NULL"
+                )
+
+        # Range-filterable columns get an index
+        for field in new_fields:
+            if column_kind(field) in ('number', 'date'):
+                index = _index_name(table, field)
+                cursor.execute(f"CREATE INDEX {_qn(index)} ON {_qn(table)} ({_qn(column_name(field))})")
+
+    if retyped:
+        _refill_columns(form_template, retyped)
+
+    # A rolled back transaction also rolls back the DDL, only remember committed columns
+    columns = {**existing, **wanted}
+    transaction.on_commit(lambda: _known_columns.__setitem__(form_template.id, columns))
+
+
+def drop_table(form_template_id):
+    _known_columns.pop(form_template_id, None)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {_qn(table_name(form_template_id))}")
+
+
+def _write_rows(form_template_id, fields, rows):
+    if not rows:
+        return
+    columns = [KEY_COLUMN] + [column_name(field) for field in fields]
+    placeholders = ', '.join(['%s'] * len(columns))
+    table = _qn(table_name(form_template_id))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {_qn(KEY_COLUMN)} IN ({', '.join(['%s'] * len(rows))})",
+            [row[0] for row in rows]
+        )
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(_qn(col) for col in columns)}) VALUES ({placeholders})",
+            rows
+        )
+
+
+def _snapshot_row(employee, fields):
+    snapshot = employee.values_snapshot or {}
+    row = [employee.pk]
+    for field in fields:
+        entry = snapshot.get(field.field_name) or {}
+        raw_value = entry.get('value')
+        if raw_value is None:
+            raw_value = entry.get('file_value')
+        row.append(column_value(field, raw_value))
+    return row
+
+
+def sync_employee(employee, fields=None):
+    """Rewrite the projection row of an employee from its values_snapshot"""
+    sync_employees(employee.form_template, [employee], fields)
+
+
+def sync_employees(form_template, employees, fields=None):
+    """Rewrite the projection rows of employees of one template from their values_snapshot"""
+    if fields is None:
+        fields = list(form_template.fields.all())
+    ensure_table(form_template, fields)
+    _write_rows(form_template.id, fields, [_snapshot_row(employee, fields) for employee in employees])
+
+
+def delete_employee(employee_id, form_template_id):
+    """Remove the projection row of a deleted employee"""
+    table = table_name(form_template_id)
+    with connection.cursor() as cursor:
+        if form_template_id not in _known_columns and table not in connection.introspection.table_names(cursor):
+            return
+        cursor.execute(f"DELETE FROM {_qn(table)} WHERE {_qn(KEY_COLUMN)} = %s", [employee_id])
+
+
+def _source_rows(form_template, fields, employee_ids):
+    """Build projection rows for a chunk of employees from the EAV source of truth"""
+    from .models import EmployeeFieldValue
+
+    fields_by_id = {field.id: field for field in fields}
+    positions = {field.id: index + 1 for index, field in enumerate(fields)}
+    rows = {employee_id: [employee_id] + [None] * len(fields) for employee_id in employee_ids}
+    values = EmployeeFieldValue.objects.filter(employee_id__in=employee_ids).values_list(
+        'employee_id', 'field_id', 'value', 'file_value'
+    )
+    for employee_id, field_id, value, file_value in values:
+        field = fields_by_id.get(field_id)
+        if field is None:
+            continue
+        raw_value = to_json_value(field.field_type, value)
+        if raw_value is None:
+            raw_value = file_value or None
+        rows[employee_id][positions[field_id]] = column_value(field, raw_value)
+    return [rows[employee_id] for employee_id in employee_ids]
+
+
+def _refill_columns(form_template, fields, chunk_size=500):
+    """Rewrite the columns of some fields in the existing rows from the EAV rows"""
+    assignments = ', '.join(f"{_qn(column_name(field))} = %s" for field in fields)
+    sql = f"UPDATE {_qn(table_name(form_template.id))} SET {assignments} WHERE {_qn(KEY_COLUMN)} = %s"
+    for employee_ids in _employee_id_chunks(form_template, chunk_size):
+        rows = _source_rows(form_template, fields, employee_ids)
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [row[1:] + [row[0]] for row in rows])
+
+
+def _employee_id_chunks(form_template, chunk_size):
+    ids = form_template.employees.order_by('id').values_list('id', flat=True)
+    chunk = []
+    for employee_id in ids.iterator(chunk_size=chunk_size):
+        chunk.append(employee_id)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rebuild(form_template, chunk_size=500):
+    """Drop and repopulate the projection table of a template from the EAV rows"""
+    fields = list(form_template.fields.all())
+    count = 0
+    with transaction.atomic():
+        drop_table(form_template.id)
+        ensure_table(form_template, fields)
+        for employee_ids in _employee_id_chunks(form_template, chunk_size):
+            _write_rows(form_template.id, fields, _source_rows(form_template, fields, employee_ids))
+            count += len(employee_ids)
+    return count
+
+
+def check_consistency(form_template, chunk_size=500):
+    """Compare the projection of a template with the EAV rows
+
+    Returns a list of ``(employee_id, problem)`` tuples, empty when the
+    projection is consistent.
+    """
+    fields = list(form_template.fields.all())
+    table = table_name(form_template.id)
+    problems = []
+    with connection.cursor() as cursor:
+        existing = _existing_columns(cursor, form_template.id)
+    if existing is None:
+        return [(None, 'projection table is missing')]
+    missing_columns = [field.field_name for field in fields if column_name(field) not in existing]
+    if missing_columns:
+        return [(None, f"missing columns for fields: {', '.join(missing_columns)}")]
+    retyped_columns = [field.field_name for field in fields if existing[column_name(field)] != column_kind(field)]
+    if retyped_columns:
+        return [(None, f"columns of another type for fields: {', '.join(retyped_columns)}")]
+
+    columns = ', '.join(_qn(col) for col in [KEY_COLUMN] + [column_name(field) for field in fields])
+    for employee_ids in _employee_id_chunks(form_template, chunk_size):
+        expected = {row[0]: row for row in _source_rows(form_template, fields, employee_ids)}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {columns} FROM {_qn(table)} WHERE {_qn(KEY_COLUMN)} IN ({', '.join(['%s'] * len(employee_ids))})",
+                employee_ids
+            )
+            actual = {row[0]: row for row in cursor.fetchall()}
+        for employee_id in employee_ids:
+            if employee_id not in actual:
+                problems.append((employee_id, 'row is missing'))
+                continue
+            for index, field in enumerate(fields, start=1):
+                want = _normalize(field, expected[employee_id][index])
+                got = _normalize(field, actual[employee_id][index])
+                if want != got:
+                    problems.append((employee_id, f"{field.field_name}: expected {want!r}, found {got!r}"))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {_qn(KEY_COLUMN)} FROM {_qn(table)} WHERE {_qn(KEY_COLUMN)} NOT IN "
+            f"(SELECT id FROM {_qn(form_template.employees.model._meta.db_table)} WHERE form_template_id = %s)",
+            [form_template.id]
+        )
+        problems.extend((row[0], 'orphaned row') for row in cursor.fetchall())
+    return problems
+
+
+def _like_pattern(term):
+    """``LIKE`` pattern matching ``term`` anywhere, with its wildcards escaped"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def matching_ids_sql(form_template, terms=()):
+    """SQL selecting the ids of employees matching search terms
+
+    An employee matches when any of ``terms`` is found case-insensitively in
+    any of its non-boolean columns; ``%`` and ``_`` in a term match
+    themselves. Returns ``(sql, params)`` suitable for ``RawSQL`` / ``id__in``.
+    """
+    fields = list(form_template.fields.all())
+    ensure_table(form_template, fields)
+
+    sql = f"SELECT {_qn(KEY_COLUMN)} FROM {_qn(table_name(form_template.id))}"
+    if not terms:
+        return sql, []
+    clauses = []
+    params = []
+    term_columns = [field for field in fields if column_kind(field) != 'bool']
+    for term in terms:
+        for field in term_columns:
+            clauses.append(f"UPPER(CAST({_qn(column_name(field))} AS TEXT)) LIKE UPPER(%s) ESCAPE '\\'")
+            params.append(_like_pattern(term))
+    sql += f" WHERE {' OR '.join(clauses)}" if clauses else " WHERE 1 = 0"
+    return sql, params
@@ -0,0 +1,227 @@
+"""Execution engine for SavedSearch.search_query
+
+A saved search query is JSON parsed into a small AST and compiled into a
+single Employee query: boolean nodes become Q combinations and field
+predicates become ``EXISTS`` subqueries over EmployeeFieldValue, so no joins
+or ``DISTINCT`` are needed. Supported nodes::
+
+    {"and": [<node>, ...]}            all children match
+    {"or": [<node>, ...]}             any child matches
+    {"not": <node>}                   child does not match
+    {"field": "salary", "op": "gte", "value": 50000}
+    {"template": 3} / {"template": [3, 4]}
+    {"status": "active"} / {"status": "inactive"}
+    {"text": "john"}                  full-text match on any field value
+
+For convenience a flat object such as ``{"search": "john", "form_template": 3,
+"is_active": true}`` is read as an "and" of the corresponding nodes.
+"""
+from django.db.models import Exists, OuterRef, Q
+
+from . import search_index
+from .filters import field_value_exists
+from .models import Employee, EmployeeFieldValue, FormField
+
+
+MAX_DEPTH = 10
+MAX_NODES = 100
+
+
+class QueryError(ValueError):
+    """Raised for invalid saved search queries"""
+
+
+class Node:
+    def field_names(self):
+        return set()
+
+    def compile(self, fields_by_name):
+        raise NotImplementedError
+
+
+class BoolNode(Node):
+    def __init__(self, operator, children):
+        self.operator = operator
+        self.children = children
+
+    def field_names(self):
+        return set().union(*(child.field_names() for child in self.children))
+
+    def compile(self, fields_by_name):
+        compiled = [child.compile(fields_by_name) for child in self.children]
+        q = compiled[0]
+        for child in compiled[1:]:
+            q = q & child if self.operator == 'and' else q | child
+        return q
+
+
+class NotNode(Node):
+    def __init__(self, child):
+        self.child = child
+
+    def field_names(self):
+        return self.child.field_names()
+
+    def compile(self, fields_by_name):
+        return ~self.child.compile(fields_by_name)
+
+
+class FieldNode(Node):
+    def __init__(self, field_name, lookup, value, path):
+        self.field_name = field_name
+        self.lookup = lookup
+        self.value = value
+        self.path = path
+
+    def field_names(self):
+        return {self.field_name}
+
+    def compile(self, fields_by_name):
+        fields = fields_by_name.get(self.field_name)
+        if not fields:
+            raise QueryError(f"{self.path}: unknown field '{self.field_name}'")
+        try:
+            exists, negate = field_value_exists(fields, self.lookup, self.value)
+        except ValueError as e:
+            raise QueryError(f"{self.path}: {e}")
+        return ~Q(exists) if negate else Q(exists)
+
+
+class TemplateNode(Node):
+    def __init__(self, template_ids):
+        self.template_ids = template_ids
+
+    def compile(self, fields_by_name):
+        return Q(form_template_id__in=self.template_ids)
+
+
+class StatusNode(Node):
+    def __init__(self, is_active):
+        self.is_active = is_active
+
+    def compile(self, fields_by_name):
+        return Q(is_active=self.is_active)
+
+
+class TextNode(Node):
+    def __init__(self, text):
+        self.text = text
+
+    def compile(self, fields_by_name):
+        if search_index.ensure_index():
+            from django.db.models.expressions import RawSQL
+
+            match_query = search_index.build_match_query(self.text)
+            if match_query is None:
+                return Q(pk__in=[])
+            return Q(id__in=RawSQL(*search_index.matching_ids_sql(match_query)))
+        return Q(Exists(EmployeeFieldValue.objects.filter(employee=OuterRef('pk'), value__icontains=self.text)))
+
+
+def _parse_ids(value, path):
+    ids = value if isinstance(value, list) else [value]
+    try:
+        return [int(item) for item in ids]
+    except (TypeError, ValueError):
+        raise QueryError(f"{path}: expected a form template id or a list of ids")
+
+
+def parse(data, path='query', depth=0, counter=None):
+    """Parse saved search JSON into an AST, raises QueryError when invalid"""
+    if counter is None:
+        counter = [0]
+    counter[0] += 1
+    if counter[0] > MAX_NODES:
+        raise QueryError(f"query has more than {MAX_NODES} nodes")
+    if depth > MAX_DEPTH:
+        raise QueryError(f"{path}: nested deeper than {MAX_DEPTH} levels")
+    if not isinstance(data, dict):
+        raise QueryError(f"{path}: expected an object")
+
+    if 'and' in data or 'or' in data:
+        operator = 'and' if 'and' in data else 'or'
+        children = data[operator]
+        if not isinstance(children, list) or not children:
+            raise QueryError(f"{path}.{operator}: expected a non-empty list")
+        return BoolNode(operator, [
+            parse(child, f"{path}.{operator}[{index}]", depth + 1, counter) for index, child in enumerate(children)
+        ])
+    if 'not' in data:
+        return NotNode(parse(data['not'], f"{path}.not", depth + 1, counter))
+    if 'field' in data:
+        if not isinstance(data['field'], str) or ('value' not in data and data.get('op') != 'isnull'):
+            raise QueryError(f"{path}: field predicates need a field name and a value")
+        return FieldNode(data['field'], data.get('op', 'exact'), data.get('value', True), path)
+    if 'template' in data:
+        return TemplateNode(_parse_ids(data['template'], f"{path}.template"))
+    if 'status' in data:
+        if data['status'] not in ('active', 'inactive'):
+            raise QueryError(f"{path}.status: expected 'active' or 'inactive'")
+        return StatusNode(data['status'] == 'active')
+    if 'text' in data:
+        return TextNode(str(data['text']))
+
+    # Flat shorthand: {"search": ..., "form_template": ..., "is_active": ...}
+    children = []
+    if data.get('search'):
+        children.append(TextNode(str(data['search'])))
+    if data.get('form_template'):
+        children.append(TemplateNode(_parse_ids(data['form_template'], f"{path}.form_template")))
+    if data.get('is_active') is not None:
+        children.append(StatusNode(bool(data['is_active'])))
+    if not children:
+        raise QueryError(f"{path}: expected one of and, or, not, field, template, status, text")
+    return BoolNode('and', children)
+
+
+def compile_query(node, user):
+    """Compile an AST into a Q object, resolving field names of the user's templates in one query"""
+    fields_by_name = {}
+    names = node.field_names()
+    if names:
+        for field in FormField.objects.filter(field_name__in=names, form_template__created_by=user):
+            fields_by_name.setdefault(field.field_name, []).append(field)
+    return node.compile(fields_by_name)
+
+
+def employee_queryset(search_query, user):
+    """Employees of a user matching a saved search query"""
+    q = compile_query(parse(search_query), user)
+    return (
+        Employee.objects.filter(created_by=user).filter(q)
+        .select_related('form_template', 'created_by')
+        .order_by('-created_at')
+    )
+
+
+def explain(queryset):
+    """Query plan and cost estimate of a queryset
+
+    PostgreSQL reports the planner's total cost. SQLite has no cost model, so
+    the plan steps are classified into full table scans and index searches.
+    """
+    from django.db import connection
+
+    if connection.vendor == 'postgresql':
+        import json
+
+        plan = json.loads(queryset.explain(format='json'))
+        return {
+            'vendor': connection.vendor,
+            'plan': plan,
+            'estimated_cost': plan[0]['Plan']['Total Cost'],
+            'estimated_rows': plan[0]['Plan']['Plan Rows'],
+        }
+
+    # SQLite rows are "<id> <parent> <notused> <detail>"
+    steps = [line.split(' ', 3)[-1] for line in queryset.explain().splitlines()]
+    scans = [step for step in steps if step.startswith('SCAN') and not ('CONSTANT ROW' in step or 'VIRTUAL TABLE' in step)]
+    return {
+        'vendor': connection.vendor,
+        'plan': steps,
+        'estimated_cost': {
+            'full_scans': len(scans),
+            'index_searches': sum(1 for step in steps if step.startswith('SEARCH')),
+            'temp_b_trees': sum(1 for step in steps if 'TEMP B-TREE' in step),
+        },
+    }
@@ -0,0 +1,84 @@
+"""Process-level cache of compiled form template schemas
+
+A compiled schema holds the ordered fields of a FormTemplate with lookups by
+id and field_name. It is tagged with FormTemplate.schema_version, which is
+bumped (see FormTemplate.bump_schema_version()) whenever fields are added or
+reordered or the template is updated, so a cached schema is reused for as
+long as the version of the template instance at hand matches. The cached
+FormField instances are shared between requests and must not be modified.
+"""
+import threading
+
+
+class CompiledSchema:
+    """Ordered fields of a form template with lookups by id and name"""
+    __slots__ = ('template_id', 'version', 'fields', 'by_id', 'by_name', 'name_field')
+
+    def __init__(self, form_template, fields):
+        self.template_id = form_template.pk
+        self.version = form_template.schema_version
+        self.fields = tuple(fields)
+        self.by_id = {field.id: field for field in self.fields}
+        self.by_name = {field.field_name: field for field in self.fields}
+        if form_template.name_field_id:
+            self.name_field = self.by_id.get(form_template.name_field_id)
+        else:
+            self.name_field = next((field for field in self.fields if 'name' in field.field_name.lower()), None)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def field(self, field_id):
+        """Field of this template by id (int or string), None if it does not belong to it"""
+        try:
+            return self.by_id.get(int(field_id))
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def required_fields(self):
+        return [field for field in self.fields if field.is_required]
+
+
+_schemas = {}
+_lock = threading.Lock()
+
+
+def get_schema(form_template):
+    """Compiled schema of a FormTemplate instance or id, None if the template does not exist
+
+    Passing an instance costs no query when the schema is cached, passing an
+    id costs one primary key lookup of the current version.
+    """
+    from .models import FormTemplate
+
+    if not isinstance(form_template, FormTemplate):
+        try:
+            form_template = FormTemplate.objects.filter(pk=form_template).only('schema_version', 'name_field').first()
+        except (TypeError, ValueError):
+            return None
+        if form_template is None:
+            return None
+
+    schema = _schemas.get(form_template.pk)
+    if schema is not None and schema.version == form_template.schema_version:
+        return schema
+
+    schema = CompiledSchema(form_template, form_template.fields.order_by('order', 'created_at'))
+    with _lock:
+        cached = _schemas.get(schema.template_id)
+        if cached is None or cached.version <= schema.version:
+            _schemas[schema.template_id] = schema
+    return schema
+
+
+def invalidate(template_id=None):
+    """Forget the cached schema of a template, or of all templates"""
+    with _lock:
+        if template_id is None:
+            _schemas.clear()
+        else:
+            _schemas.pop(template_id, None)
@@ -0,0 +1,175 @@
+"""SQLite FTS5 full-text index over employee field values
+
+The ``api_employee_search`` virtual table holds one document per employee
+(rowid = Employee.id) made of all its field values. It is refreshed from
+Employee.sync_field_values() and on employee deletion. When the database is
+not SQLite or was built without FTS5, ``available()`` is False and callers
+fall back to ``icontains`` lookups.
+"""
+import re
+
+from django.db import DatabaseError, connection, transaction
+
+
+TABLE = 'api_employee_search'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+_available = None
+_index_ready = False
+
+
+def available():
+    """Whether the database supports FTS5"""
+    global _available
+    if _available is None:
+        _available = False
+        if connection.vendor == 'sqlite':
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(body)")
+                    cursor.execute("DROP TABLE temp.fts5_probe")
+                _available = True
+            except DatabaseError:
+                pass
+    return _available
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _document_sql(where):
+    from .models import EmployeeFieldValue
+
+    values_table = _qn(EmployeeFieldValue._meta.db_table)
+    return (
+        f"INSERT INTO {_qn(TABLE)} (rowid, body) "
+        f"SELECT employee_id, group_concat(value, ' ') FROM {values_table} "
+        f"WHERE value IS NOT NULL AND value != ''{where} GROUP BY employee_id"
+    )
+
+
+def ensure_index():
+    """Create the FTS5 table, populating it when it did not exist yet"""
+    if _index_ready:
+        return True
+    if not available():
+        return False
+    with connection.cursor() as cursor:
+        exists = TABLE in connection.introspection.table_names(cursor)
+        if not exists:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {_qn(TABLE)} USING fts5("
+                f"body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+            cursor.execute(_document_sql(''))
+    # A rolled back transaction also drops the table, only remember a committed one
+    transaction.on_commit(_mark_ready)
+    return True
+
+
+def _mark_ready():
+    global _index_ready
+    _index_ready = True
+
+
+def index_employee(employee_id):
+    """Rewrite the search document of an employee from its field values"""
+    index_employees([employee_id])
+
+
+def index_employees(employee_ids):
+    """Rewrite the search documents of several employees"""
+    if not employee_ids or not ensure_index():
+        return
+    for start in range(0, len(employee_ids), 500):
+        chunk = list(employee_ids[start:start + 500])
+        placeholders = ', '.join(['%s'] * len(chunk))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {_qn(TABLE)} WHERE rowid IN ({placeholders})", chunk)
+            cursor.execute(_document_sql(f' AND employee_id IN ({placeholders})'), chunk)
+
+
+def remove_employee(employee_id):
+    if not ensure_index():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {_qn(TABLE)} WHERE rowid = %s", [employee_id])
+
+
+def rebuild():
+    """Drop and repopulate the whole index, returns the number of documents"""
+    global _index_ready
+    if not available():
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {_qn(TABLE)}")
+        _index_ready = False
+        ensure_index()
+        cursor.execute(f"SELECT count(*) FROM {_qn(TABLE)}")
+        return cursor.fetchone()[0]
+
+
+def build_match_query(text):
+    """Translate user search text to an FTS5 MATCH expression
+
+    Quoted text is matched as a phrase, every other word as a prefix, and all
+    parts must match. Returns None when the text has no searchable words.
+    """
+    parts = []
+    for phrase, word in _TERM_RE.findall(text or ''):
+        tokens = _WORD_RE.findall(phrase or word)
+        if not tokens:
+            continue
+        if phrase:
+            parts.append('"' + ' '.join(tokens) + '"')
+        else:
+            parts.extend(f'"{token}"*' for token in tokens)
+    return ' '.join(parts) or None
+
+
+def build_any_match_query(terms):
+    """MATCH expression for employees matching any of the given search texts"""
+    queries = [query for query in (build_match_query(term) for term in terms) if query]
+    if not queries:
+        return None
+    return ' OR '.join(f'({query})' for query in queries)
+
+
+def matching_ids_sql(match_query):
+    """``(sql, params)`` selecting the ids of employees matching a MATCH expression"""
+    return f"SELECT rowid FROM {_qn(TABLE)} WHERE {_qn(TABLE)} MATCH %s", [match_query]
+
+
+def rank_sql(match_query):
+    """``(sql, params)`` for a bm25 rank annotation (lower is better) on Employee querysets"""
+    from .models import Employee
+
+    return (
+        f"SELECT rank FROM {_qn(TABLE)} WHERE {_qn(TABLE)} MATCH %s "
+        f"AND rowid = {_qn(Employee._meta.db_table)}.{_qn('id')}"
+    ), [match_query]
+
+
+def filter_queryset(queryset, text, rank=False):
+    """Restrict an Employee queryset to full-text matches of a text or any of a list of texts
+
+    Returns None when full-text search is unavailable so callers can fall back
+    to ``icontains``. With ``rank=True`` the result is ordered by relevance.
+    """
+    if not ensure_index():
+        return None
+    from django.db.models.expressions import RawSQL
+
+    if isinstance(text, str):
+        match_query = build_match_query(text)
+    else:
+        match_query = build_any_match_query(text)
+    if match_query is None:
+        return queryset.none()
+    queryset = queryset.filter(id__in=RawSQL(*matching_ids_sql(match_query)))
+    if rank:
+        queryset = queryset.annotate(search_rank=RawSQL(*rank_sql(match_query))).order_by('search_rank', '-created_at')
+    return queryset
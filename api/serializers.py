@@ -2,7 +2,10 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from .models import UserProfile, FormTemplate, FormField, Employee, EmployeeFieldValue, AuditLog
+from django.core.files.storage import default_storage
+from django.db import transaction
+from .models import UserProfile, FormTemplate, FormField, Employee, EmployeeFieldValue, AuditLog, ExportJob
+from . import changesets, projections, schema_cache
 from dashboard.models import DashboardSettings, SavedSearch, Notification
 
 
@@ -85,32 +88,55 @@ class FormTemplateSerializer(serializers.ModelSerializer):
     """Serializer for form templates"""
     fields = FormFieldSerializer(many=True, read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
-    employee_count = serializers.SerializerMethodField()
 
     class Meta:
         model = FormTemplate
-        fields = ['id', 'name', 'description', 'created_by', 'created_by_username', 'created_at', 'updated_at', 'is_active', 'fields', 'employee_count']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'description', 'created_by', 'created_by_username', 'created_at', 'updated_at', 'is_active', 'name_field', 'fields', 'employee_count', 'active_employee_count']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'employee_count', 'active_employee_count']
+
+    def validate_name_field(self, value):
+        if value is not None and self.instance is not None and value.form_template_id != self.instance.id:
+            raise serializers.ValidationError("Name field must belong to this form template")
+        return value
 
-    def get_employee_count(self, obj):
-        return obj.employees.count()
+    def update(self, instance, validated_data):
+        old_name_field_id = instance.name_field_id
+        instance = super().update(instance, validated_data)
+        instance.bump_schema_version()
+        if instance.name_field_id != old_name_field_id:
+            instance.sync_employee_display_names()
+        return instance
 
 
 class FormTemplateCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating form templates with fields"""
     fields_data = FormFieldSerializer(many=True, write_only=True)
+    name_field_name = serializers.CharField(write_only=True, required=False)
 
     class Meta:
         model = FormTemplate
-        fields = ['name', 'description', 'fields_data']
+        fields = ['name', 'description', 'fields_data', 'name_field_name']
+
+    def validate(self, attrs):
+        name_field_name = attrs.get('name_field_name')
+        if name_field_name and name_field_name not in [f['field_name'] for f in attrs.get('fields_data', [])]:
+            raise serializers.ValidationError({'name_field_name': "Must match the field_name of one of the fields"})
+        return attrs
 
     def create(self, validated_data):
         fields_data = validated_data.pop('fields_data')
+        name_field_name = validated_data.pop('name_field_name', None)
         form_template = FormTemplate.objects.create(**validated_data)
         
         for field_data in fields_data:
-            FormField.objects.create(form_template=form_template, **field_data)
+            field = FormField.objects.create(form_template=form_template, **field_data)
+            if field.field_name == name_field_name:
+                form_template.name_field = field
         
+        if form_template.name_field_id:
+            form_template.save(update_fields=['name_field'])
+        
+        projections.ensure_table(form_template)
         return form_template
 
 
@@ -127,7 +153,13 @@ class EmployeeFieldValueSerializer(serializers.ModelSerializer):
 
 
 class EmployeeSerializer(serializers.ModelSerializer):
-    """Serializer for employees"""
+    """Serializer for employees
+
+    Pass ``use_snapshot=True`` in the context to render field_values from
+    Employee.values_snapshot instead of the EmployeeFieldValue rows, so the
+    queryset needs no field value joins. A ``fields`` set in the context (see
+    requested_fields()) restricts the output to those fields.
+    """
     field_values = EmployeeFieldValueSerializer(many=True, read_only=True)
     form_template_name = serializers.CharField(source='form_template.name', read_only=True)
     created_by_username = serializers.SerializerMethodField()
@@ -138,9 +170,80 @@ class EmployeeSerializer(serializers.ModelSerializer):
         fields = ['id', 'employee_id', 'username', 'form_template', 'form_template_name', 'created_by', 'created_by_username', 'created_at', 'updated_at', 'is_active', 'is_employee_active', 'last_login', 'field_values', 'employee_name']
         read_only_fields = ['id', 'employee_id', 'created_at', 'updated_at', 'last_login']
 
+    # Nested fields left out of a ?fields= selection unless listed in ?expand=
+    expandable_fields = ['field_values']
+
+    # Columns (and related columns) read by each field, used by optimize_queryset()
+    field_sources = {
+        'form_template': ['form_template'],
+        'form_template_name': ['form_template', 'form_template__name'],
+        'created_by': ['created_by'],
+        'created_by_username': ['created_by', 'created_by__username'],
+        'field_values': ['values_snapshot'],
+        'employee_name': ['display_name', 'employee_id'],
+    }
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        if self.context.get('use_snapshot') and 'field_values' in fields:
+            fields['field_values'] = serializers.SerializerMethodField(method_name='get_snapshot_field_values')
+        return fields
+
+    @classmethod
+    def requested_fields(cls, request):
+        """Fields selected with ``?fields=a,b`` and ``?expand=field_values``, None for all fields"""
+        selected = request.query_params.get('fields')
+        if selected is None:
+            return None
+        names = {name.strip() for name in selected.split(',')}
+        names |= {name.strip() for name in request.query_params.get('expand', '').split(',')}
+        return {'id'} | (names & set(cls.Meta.fields))
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields, use_snapshot=True):
+        """Limit joins, prefetches and loaded columns of a queryset to the given fields"""
+        if fields is None:
+            return queryset
+        columns = []
+        for name in fields:
+            columns.extend(cls.field_sources.get(name, [name]))
+        if 'field_values' in fields and not use_snapshot:
+            columns.remove('values_snapshot')
+            queryset = queryset.prefetch_related('field_values__field')
+        queryset = queryset.select_related(None)
+        related = sorted({column.split('__')[0] for column in columns if '__' in column})
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
     def get_created_by_username(self, obj):
         return obj.created_by.username if obj.created_by else None
 
+    def get_snapshot_field_values(self, obj):
+        entries = sorted((obj.values_snapshot or {}).items(), key=lambda item: item[1].get('order', 0))
+        request = self.context.get('request')
+
+        def file_url(name):
+            # Absolute like the FileField output of field_values
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return [
+            {
+                'id': entry['id'],
+                'field': entry['field'],
+                'field_name': field_name,
+                'field_label': entry['label'],
+                'field_type': entry['type'],
+                'value': entry['value'],
+                'file_value': file_url(entry['file_value']) if entry.get('file_value') else None,
+            }
+            for field_name, entry in entries
+        ]
+
 
 class EmployeeCreateUpdateSerializer(serializers.ModelSerializer):
     """Serializer for creating/updating employees"""
@@ -150,62 +253,41 @@ class EmployeeCreateUpdateSerializer(serializers.ModelSerializer):
         model = Employee
         fields = ['form_template', 'field_values_data', 'is_active']
 
+    @transaction.atomic
     def create(self, validated_data):
         field_values_data = validated_data.pop('field_values_data', {})
         employee = Employee.objects.create(**validated_data)
+        schema = schema_cache.get_schema(employee.form_template)
         
         # Create field values
         if field_values_data:
             for field_id, value in field_values_data.items():
-                try:
-                    field = FormField.objects.get(id=field_id)
-                    if field.field_type == 'file' and value:
-                        # Handle file upload
-                        EmployeeFieldValue.objects.create(
-                            employee=employee,
-                            field=field,
-                            file_value=value
-                        )
-                    else:
-                        EmployeeFieldValue.objects.create(
-                            employee=employee,
-                            field=field,
-                            value=value
-                        )
-                except FormField.DoesNotExist:
+                field = schema.field(field_id)
+                if field is None:
                     continue
+                if field.field_type == 'file' and value:
+                    # Handle file upload
+                    EmployeeFieldValue.objects.create(
+                        employee=employee,
+                        field=field,
+                        file_value=value
+                    )
+                else:
+                    EmployeeFieldValue.objects.create(
+                        employee=employee,
+                        field=field,
+                        value=value
+                    )
         
+        employee.sync_field_values()
         return employee
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         field_values_data = validated_data.pop('field_values_data', {})
-        
-        # Update employee
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Update field values
-        if field_values_data:
-            for field_id, value in field_values_data.items():
-                try:
-                    field = FormField.objects.get(id=field_id)
-                    field_value, created = EmployeeFieldValue.objects.get_or_create(
-                        employee=instance,
-                        field=field
-                    )
-                    
-                    if field.field_type == 'file' and value:
-                        field_value.file_value = value
-                        field_value.value = None
-                    else:
-                        field_value.value = value
-                        field_value.file_value = None
-                    
-                    field_value.save()
-                except FormField.DoesNotExist:
-                    continue
-        
+        # Only the changed attributes and fields are written, see perform_update() for the audit
+        self.changeset = changesets.diff(instance, field_values_data, validated_data)
+        self.changeset.apply()
         return instance
 
 
@@ -220,6 +302,26 @@ class AuditLogSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'timestamp']
 
 
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Serializer for background export jobs"""
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ['id', 'export_format', 'form_template', 'filters', 'status', 'row_count', 'partitions', 'error',
+                  'created_at', 'started_at', 'finished_at', 'download_url']
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != 'done':
+            return None
+        from django.urls import reverse
+
+        url = reverse('export-job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 class DashboardSettingsSerializer(serializers.ModelSerializer):
     """Serializer for dashboard settings"""
     class Meta:
@@ -235,6 +337,15 @@ class SavedSearchSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'search_query', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+    def validate_search_query(self, value):
+        from .saved_search import QueryError, parse
+
+        try:
+            parse(value)
+        except QueryError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
 
 class NotificationSerializer(serializers.ModelSerializer):
     """Serializer for notifications"""
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import audit_rollups, counters, fuzzy_index, projections, search_index
+from .models import AuditLog, Employee, FormTemplate
+
+
+@receiver(post_save, sender=Employee)
+def count_saved_employee(sender, instance, created, **kwargs):
+    counters.employee_saved(instance, created)
+
+
+@receiver(post_delete, sender=Employee)
+def remove_employee_indexes(sender, instance, **kwargs):
+    projections.delete_employee(instance.pk, instance.form_template_id)
+    search_index.remove_employee(instance.pk)
+    fuzzy_index.remove_employee(instance.pk)
+    counters.employee_deleted(instance)
+
+
+@receiver(post_delete, sender=FormTemplate)
+def drop_template_projection(sender, instance, **kwargs):
+    projections.drop_table(instance.pk)
+
+
+@receiver(post_save, sender=AuditLog)
+def count_audit_log(sender, instance, created, **kwargs):
+    if created:
+        audit_rollups.add([instance])
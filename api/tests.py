@@ -1,3 +1,1039 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import date, datetime, timezone as dt_timezone
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models.expressions import RawSQL
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from dashboard import stats
+
+from . import (
+    audit, audit_archive, audit_rollups, bulk, export_jobs, fuzzy_index, imports, projections, schema_cache, search_index,
+)
+from .models import AuditLog, AuditLogRollup, Employee, EmployeeFieldValue, ExportJob, FormField, FormTemplate, UserProfile
+
+
+STAFF_FIELDS = [
+    ('full_name', 'text', 'Full Name'),
+    ('salary', 'number', 'Salary'),
+    ('hire_date', 'date', 'Hired'),
+    ('department', 'text', 'Department'),
+]
+
+
+def create_user(username):
+    user = User.objects.create_user(username, password='test-pass-123')
+    UserProfile.objects.create(user=user)
+    return user
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def create_template(client, name='Staff', fields=STAFF_FIELDS):
+    response = client.post('/api/form-templates/', {
+        'name': name,
+        'fields_data': [
+            {'field_name': field_name, 'field_type': field_type, 'field_label': label, 'order': order}
+            for order, (field_name, field_type, label) in enumerate(fields)
+        ],
+        'name_field_name': fields[0][0],
+    }, format='json')
+    assert response.status_code == 201, response.content
+    return FormTemplate.objects.filter(name=name).latest('id')
+
+
+class EmployeeMixin:
+    """A user with a staff template, and helpers to create its employees through the API"""
+
+    def setUp(self):
+        # Tables created by an earlier test were rolled back with it
+        projections._known_columns.clear()
+        search_index._index_ready = False
+        # Ids of rolled back templates are reused with their versions starting over
+        schema_cache.invalidate()
+        self.user = create_user('owner')
+        self.client = api_client(self.user)
+        self.template = create_template(self.client)
+        self.fields = {field.field_name: field for field in self.template.fields.all()}
+
+    def values(self, **values):
+        return {str(self.fields[name].id): value for name, value in values.items()}
+
+    def create_employee(self, full_name, salary='50000', hire_date='2024-01-01', department='Engineering'):
+        response = self.client.post('/api/employees/', {
+            'form_template': self.template.id,
+            'field_values_data': self.values(full_name=full_name, salary=salary, hire_date=hire_date, department=department),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Employee.objects.filter(created_by=self.user).latest('id')
+
+
+@override_settings(AUDIT_LOG={'MODE': 'sync'})
+class EmployeeTestCase(EmployeeMixin, TestCase):
+    pass
+
+
+class ProjectionSearchTests(EmployeeTestCase):
+    def matching_names(self, term):
+        sql, params = projections.matching_ids_sql(self.template, terms=[term])
+        return sorted(Employee.objects.filter(id__in=RawSQL(sql, params)).values_list('display_name', flat=True))
+
+    def test_projection_row_follows_field_values(self):
+        employee = self.create_employee('Ada Lovelace', salary='72000')
+        self.assertEqual(projections.check_consistency(self.template), [])
+        self.client.patch(f'/api/employees/{employee.id}/', {
+            'field_values_data': self.values(salary='80000'),
+        }, format='json')
+        self.assertEqual(projections.check_consistency(self.template), [])
+
+    def test_like_wildcards_in_terms_match_literally(self):
+        self.create_employee('a_b')
+        self.create_employee('axb')
+        self.create_employee('Percent', department='9%z')
+        self.create_employee('Other', department='9yz')
+        self.assertEqual(self.matching_names('a_b'), ['a_b'])
+        self.assertEqual(self.matching_names('9%'), ['Percent'])
+        self.assertEqual(self.matching_names('A_B'), ['a_b'])
+
+    def test_changed_field_type_retypes_its_column(self):
+        self.create_employee('Ada', department='42')
+        self.create_employee('Grace', department='7')
+        department = self.fields['department']
+        FormField.objects.filter(pk=department.pk).update(field_type='number')
+        template = FormTemplate.objects.get(pk=self.template.pk)
+        template.bump_schema_version()
+        self.assertEqual(projections.check_consistency(template), [(None, 'columns of another type for fields: department')])
+
+        projections.ensure_table(template)
+        self.assertEqual(projections.check_consistency(template), [])
+        table, column = projections.table_name(template.id), projections.column_name(department)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT employee_id FROM "{table}" WHERE "{column}" > 10')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [Employee.objects.get(display_name='Ada').id])
+        self.create_employee('Alan', department='11')
+        self.assertEqual(projections.check_consistency(template), [])
+
+
+class FullTextSearchTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        if not search_index.available():
+            self.skipTest('SQLite was built without FTS5')
+
+    def search(self, text):
+        response = self.client.get('/api/employees/search/', {'search_terms': text})
+        self.assertEqual(response.status_code, 200)
+        return sorted(employee['employee_name'] for employee in response.data)
+
+    def test_words_match_as_prefixes_and_quoted_text_as_phrase(self):
+        self.create_employee('Grace Hopper', department='Compilers')
+        self.create_employee('Alan Turing', department='Cryptanalysis')
+        self.assertEqual(self.search('hop'), ['Grace Hopper'])
+        self.assertEqual(self.search('crypt'), ['Alan Turing'])
+        self.assertEqual(self.search('"grace hopper"'), ['Grace Hopper'])
+        self.assertEqual(self.search('"hopper grace"'), [])
+
+    def test_updates_and_deletions_reach_the_index(self):
+        employee = self.create_employee('Grace Hopper', department='Compilers')
+        self.client.patch(f'/api/employees/{employee.id}/', {
+            'field_values_data': self.values(department='Navy'),
+        }, format='json')
+        self.assertEqual(self.search('navy'), ['Grace Hopper'])
+        self.assertEqual(self.search('compilers'), [])
+        self.client.delete(f'/api/employees/{employee.id}/')
+        self.assertEqual(self.search('navy'), [])
+
+    def test_other_users_employees_are_not_found(self):
+        other = api_client(create_user('other'))
+        template = create_template(other, name='Other staff')
+        field = template.fields.get(field_name='full_name')
+        other.post('/api/employees/', {'form_template': template.id, 'field_values_data': {str(field.id): 'Grace Brewster'}}, format='json')
+        self.create_employee('Grace Hopper')
+        self.assertEqual(self.search('grace'), ['Grace Hopper'])
+
+
+class FuzzySearchTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        fuzzy_index.index.build()
+
+    def fuzzy(self, text, limit=50):
+        response = self.client.get('/api/employees/search/', {'fuzzy': text, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return [(employee['employee_name'], employee['similarity']) for employee in response.data]
+
+    def test_misspelled_name_finds_employee(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_employee('Jonathan Smith')
+            self.create_employee('Maria Garcia')
+        results = self.fuzzy('Jonatan')
+        self.assertEqual([name for name, _ in results], ['Jonathan Smith'])
+        self.assertGreater(results[0][1], 0.2)
+
+    def test_rolled_back_update_is_not_indexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            employee = self.create_employee('Zebediah Quill')
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.client.patch(f'/api/employees/{employee.id}/', {
+                    'field_values_data': self.values(full_name='Bartholomew Quill'),
+                }, format='json')
+                raise RuntimeError
+        self.assertEqual(self.fuzzy('Bartholomew'), [])
+        self.assertEqual([name for name, _ in self.fuzzy('Zebedia')], ['Zebediah Quill'])
+
+    def test_better_matches_of_other_users_do_not_hide_own_employees(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_employee('Jonathan Smith')
+        other = api_client(create_user('other'))
+        other_template = create_template(other)
+        name_field = other_template.fields.get(field_name='full_name')
+        with self.captureOnCommitCallbacks(execute=True):
+            other.post('/api/employees/bulk/', {'form_template': other_template.id, 'employees': [
+                {'field_values_data': {str(name_field.id): 'Jonh'}} for _ in range(30)
+            ]}, format='json')
+        self.assertEqual([name for name, _ in self.fuzzy('Jonh', limit=5)], ['Jonathan Smith'])
+
+    @override_settings(EMPLOYEE_FUZZY_INDEX={'MAX_TERMS': 4, 'MAX_SCAN_POSTINGS': 1})
+    def test_words_no_employee_has_are_freed(self):
+        fuzzy_index.index.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            employee = self.create_employee('Zebediah Quill', department='Finance')
+        for name in ('Bartholomew Quill', 'Cornelius Quill', 'Desdemona Quill'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/api/employees/{employee.id}/', {
+                    'field_values_data': self.values(full_name=name),
+                }, format='json')
+        self.assertEqual(fuzzy_index.index.stats()['terms'], 3)
+        self.assertEqual(self.fuzzy('Zebediah'), [])
+        self.assertEqual([name for name, _ in self.fuzzy('Desdemona')], ['Desdemona Quill'])
+
+
+class OtherUserFieldTestCase(EmployeeTestCase):
+    """Another user has a ``salary`` field of a different type"""
+
+    def setUp(self):
+        super().setUp()
+        other = api_client(create_user('other'))
+        create_template(other, name='Other staff', fields=[('full_name', 'text', 'Name'), ('salary', 'text', 'Salary band')])
+        self.create_employee('Low', salary='40000')
+        self.create_employee('High', salary='90000')
+
+
+class FieldValueFilterTests(OtherUserFieldTestCase):
+    def names(self, params):
+        response = self.client.get('/api/employees/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(employee['employee_name'] for employee in response.data['results'])
+
+    def test_range_filter_ignores_other_users_fields(self):
+        self.assertEqual(self.names({'f.salary__gte': '60000'}), ['High'])
+        self.assertEqual(self.names({'f.hire_date__lt': '2025-01-01'}), ['High', 'Low'])
+
+    def test_invalid_value_and_unknown_field_are_rejected(self):
+        self.assertEqual(self.client.get('/api/employees/', {'f.salary__gte': 'lots'}).status_code, 400)
+        response = self.client.get('/api/employees/', {'f.bonus__gte': '1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unknown field 'bonus'", str(response.data))
+
+
+class SavedSearchTests(OtherUserFieldTestCase):
+    def test_run_and_explain_ignore_other_users_fields(self):
+        response = self.client.post('/api/saved-searches/', {
+            'name': 'Well paid',
+            'search_query': {'and': [{'field': 'salary', 'op': 'gte', 'value': 60000}, {'status': 'active'}]},
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        run = self.client.get(f"/api/saved-searches/{response.data['id']}/run/")
+        self.assertEqual(run.status_code, 200, run.content)
+        self.assertEqual([employee['employee_name'] for employee in run.data['results']], ['High'])
+        self.assertEqual(self.client.get(f"/api/saved-searches/{response.data['id']}/explain/").status_code, 200)
+
+    def test_invalid_query_is_rejected(self):
+        response = self.client.post('/api/saved-searches/', {
+            'name': 'Broken', 'search_query': {'status': 'retired'},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employees = [self.create_employee(f'Employee {index}') for index in range(7)]
+
+    def walk(self, url, params=None):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.data)
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_cover_every_row_once(self):
+        pages = self.walk('/api/employees/', {'pagination': 'cursor', 'page_size': 3})
+        ids = [employee['id'] for page in pages for employee in page['results']]
+        self.assertEqual(ids, [employee.id for employee in reversed(self.employees)])
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        self.assertNotIn('count', pages[0])
+
+    def test_previous_cursor_returns_the_previous_page(self):
+        first = self.client.get('/api/employees/', {'pagination': 'cursor', 'page_size': 3}).data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([row['id'] for row in back['results']], [row['id'] for row in first['results']])
+
+    def test_pages_are_stable_while_rows_are_inserted(self):
+        first = self.client.get('/api/employees/', {'pagination': 'cursor', 'page_size': 3}).data
+        self.create_employee('Newcomer')
+        second = self.client.get(first['next']).data
+        self.assertEqual([row['id'] for row in second['results']], [employee.id for employee in self.employees[3:0:-1]])
+
+    def test_audit_log_cursor_and_invalid_cursor(self):
+        pages = self.walk('/api/audit-logs/', {'pagination': 'cursor', 'page_size': 4, 'count': 'true'})
+        self.assertEqual(pages[0]['count'], 7)
+        self.assertEqual(sum(len(page['results']) for page in pages), 7)
+        self.assertEqual(self.client.get('/api/audit-logs/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+class DashboardBootstrapTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('Ada', 'Grace'):
+            self.create_employee(name)
+        self.browser = Client()
+        self.browser.force_login(self.user)
+
+    def test_bootstrap_endpoint(self):
+        data = self.client.get('/api/dashboard/bootstrap/').data
+        self.assertEqual(set(data), {'stats', 'recent_employees', 'form_templates', 'recent_activity'})
+        self.assertEqual([row['employee_name'] for row in data['recent_employees']], ['Grace', 'Ada'])
+        self.assertEqual(set(data['recent_employees'][0]), {
+            'id', 'employee_id', 'employee_name', 'form_template_name', 'created_at', 'is_active',
+        })
+        self.assertEqual([template['name'] for template in data['form_templates']], ['Staff'])
+        self.assertEqual(len(data['recent_activity']), 2)
+        self.assertEqual(api_client(create_user('other')).get('/api/dashboard/bootstrap/').data['recent_employees'], [])
+
+    @override_settings(DASHBOARD_EMBED_BOOTSTRAP=True)
+    def test_dashboard_page_embeds_the_bootstrap_response(self):
+        page = self.browser.get('/dashboard/').content.decode()
+        embedded = re.search(r'<script id="dashboard-bootstrap" type="application/json">(.*?)</script>', page, re.S)
+        self.assertIsNotNone(embedded)
+        self.assertEqual(json.loads(embedded.group(1)), json.loads(self.client.get('/api/dashboard/bootstrap/').content))
+
+    def test_dashboard_page_without_embedding(self):
+        with override_settings(DASHBOARD_EMBED_BOOTSTRAP=False):
+            self.assertNotIn('id="dashboard-bootstrap"', self.browser.get('/dashboard/').content.decode())
+
+
+class SparseFieldsTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employees = [
+            self.create_employee(name, salary=salary)
+            for name, salary in (('Ada', '51000'), ('Grace', '52000'), ('Alan', '53000'))
+        ]
+
+    def list(self, **params):
+        response = self.client.get('/api/employees/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['results']
+
+    def test_fields_select_the_output_and_always_include_id(self):
+        rows = self.list(fields='id,employee_name')
+        self.assertEqual([set(row) for row in rows], [{'id', 'employee_name'}] * 3)
+        self.assertEqual([row['employee_name'] for row in rows], ['Alan', 'Grace', 'Ada'])
+        self.assertEqual([set(row) for row in self.list(fields='bogus')], [{'id'}] * 3)
+        self.assertIn('field_values', self.list()[0])
+
+        response = self.client.get(f'/api/employees/{self.employees[0].id}/', {'fields': 'employee_name,form_template_name'})
+        self.assertEqual(response.data, {'id': self.employees[0].id, 'employee_name': 'Ada', 'form_template_name': 'Staff'})
+
+    def test_expand_adds_field_values(self):
+        rows = self.list(fields='employee_name', expand='field_values')
+        self.assertEqual(set(rows[0]), {'id', 'employee_name', 'field_values'})
+        values = {item['field_name']: item['value'] for item in rows[0]['field_values']}
+        self.assertEqual(values['salary'], 53000)
+
+    def test_selected_columns_only_with_cursor_pages(self):
+        params = {'pagination': 'cursor', 'page_size': 2, 'fields': 'employee_name,created_by_username'}
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/api/employees/', params).data
+        self.assertEqual([set(row) for row in first['results']], [{'id', 'employee_name', 'created_by_username'}] * 2)
+        employee_queries = [query['sql'] for query in queries.captured_queries if 'FROM "api_employee"' in query['sql']]
+        self.assertTrue(employee_queries)
+        self.assertFalse(any('values_snapshot' in sql for sql in employee_queries))
+
+        second = self.client.get(first['next']).data
+        self.assertEqual([row['employee_name'] for row in first['results'] + second['results']], ['Alan', 'Grace', 'Ada'])
+        self.assertEqual(second['results'][0]['created_by_username'], 'owner')
+
+
+class EmployeeListTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employees = [self.create_employee(f'Employee {index}') for index in range(5)]
+        self.client.patch(f'/api/employees/{self.employees[0].id}/', {'is_active': False}, format='json')
+        self.active_ids = [employee.id for employee in reversed(self.employees[1:])]
+        self.public = APIClient()
+
+    def test_pages(self):
+        response = self.public.get('/api/employee/list/', {'page_size': 3})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(set(response.data), {'employees', 'count', 'next', 'previous'})
+        self.assertEqual(response.data['count'], 4)
+        self.assertIsNone(response.data['previous'])
+        second = self.public.get(response.data['next']).data
+        self.assertIsNone(second['next'])
+        self.assertEqual([row['id'] for row in response.data['employees'] + second['employees']], self.active_ids)
+
+    def test_cursor_pages(self):
+        response = self.public.get('/api/employee/list/', {'pagination': 'cursor', 'page_size': 3})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(set(response.data), {'employees', 'next', 'previous'})
+        second = self.public.get(response.data['next']).data
+        self.assertEqual([row['id'] for row in response.data['employees'] + second['employees']], self.active_ids)
+        self.assertIsNone(second['next'])
+        back = self.public.get(second['previous']).data
+        self.assertEqual([row['id'] for row in back['employees']], self.active_ids[:3])
+        self.assertEqual(self.public.get('/api/employee/list/', {'pagination': 'cursor', 'count': 'true'}).data['count'], 4)
+        self.assertEqual(self.public.get('/api/employee/list/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def test_ndjson_stream(self):
+        response = self.public.get('/api/employee/list/', {'stream': 'ndjson', 'fields': 'employee_name', 'expand': 'field_values'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(self.active_ids))
+        self.assertEqual(set(rows[0]), {'id', 'employee_name', 'field_values'})
+        by_id = {row['id']: row for row in rows}
+        self.assertEqual(by_id[self.employees[1].id]['employee_name'], 'Employee 1')
+        values = {item['field_name']: item['value'] for item in by_id[self.employees[1].id]['field_values']}
+        self.assertEqual(values['salary'], 50000)
+
+
+class DashboardExportTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_employee('Ada', salary='51000', department='Research')
+        self.create_employee('Grace', salary='52000')
+        other = create_user('other')
+        other_client = api_client(other)
+        self.other_template = create_template(other_client)
+        other_client.post('/api/employees/', {'form_template': self.other_template.id, 'field_values_data': {
+            str(self.other_template.fields.get(field_name='full_name').id): 'Mallory',
+        }}, format='json')
+        self.browser = Client()
+        self.browser.force_login(self.user)
+
+    def export(self, **params):
+        response = self.browser.get('/employees/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+    def test_csv(self):
+        header, *rows = list(csv.reader(self.export()))
+        self.assertEqual(header, ['Employee UUID', 'Name', 'Form Template', 'Created At', 'Active', 'Field Values (JSON)'])
+        self.assertEqual([row[1:3] + [row[4]] for row in rows], [['Grace', 'Staff', 'Yes'], ['Ada', 'Staff', 'Yes']])
+        self.assertEqual(json.loads(rows[1][5]), {'Full Name': 'Ada', 'Salary': 51000, 'Hired': '2024-01-01', 'Department': 'Research'})
+
+    def test_wide(self):
+        header, *rows = list(csv.reader(self.export(format='wide', form_template=self.template.id)))
+        self.assertEqual(header[5:], ['Full Name', 'Salary', 'Hired', 'Department'])
+        self.assertEqual([row[5:] for row in rows], [
+            ['Grace', '52000', '2024-01-01', 'Engineering'], ['Ada', '51000', '2024-01-01', 'Research'],
+        ])
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export(format='ndjson', is_active='true')]
+        self.assertEqual([row['employee_name'] for row in rows], ['Grace', 'Ada'])
+        self.assertEqual(rows[1]['values'], {'full_name': 'Ada', 'salary': 51000, 'hire_date': '2024-01-01', 'department': 'Research'})
+
+    def test_exports_only_the_users_employees(self):
+        names = [json.loads(line)['employee_name'] for line in self.export(format='ndjson')]
+        self.assertNotIn('Mallory', names)
+        self.assertEqual(self.export(format='ndjson', form_template=self.other_template.id), [])
+        response = self.browser.get('/employees/export/', {'format': 'wide', 'form_template': self.other_template.id})
+        self.assertEqual(response.status_code, 400)
+
+
+class DashboardStatsTests(EmployeeTestCase):
+    def get_stats(self):
+        response = self.client.get('/api/dashboard/stats/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assert_in_sync(self):
+        data = self.get_stats()
+        computed = stats.compute(self.user)
+        self.assertEqual(data['total_employees'], computed['total_employees'])
+        self.assertEqual(data['active_employees'], computed['active_employees'])
+        self.assertEqual(data['recent_employees'], sum(computed['daily_created'].values()))
+        self.assertEqual(stats.reconcile([self.user]), 0)
+
+    def test_counters_follow_single_and_bulk_writes(self):
+        self.assertEqual(self.get_stats()['total_employees'], 0)
+        employees = [self.create_employee(f'Employee {index}') for index in range(3)]
+        self.assert_in_sync()
+
+        self.client.patch(f'/api/employees/{employees[0].id}/', {'is_active': False}, format='json')
+        self.client.delete(f'/api/employees/{employees[1].id}/')
+        self.assert_in_sync()
+
+        self.client.post('/api/employees/bulk/', {'form_template': self.template.id, 'employees': [
+            {'field_values_data': self.values(full_name='Bulk 1')},
+            {'field_values_data': self.values(full_name='Bulk 2'), 'is_active': False},
+        ]}, format='json')
+        self.client.post('/api/employees/bulk_deactivate/', {'ids': [employees[2].id]}, format='json')
+        data = self.get_stats()
+        self.assertEqual((data['total_employees'], data['active_employees']), (4, 1))
+        self.assert_in_sync()
+
+    def test_reconcile_repairs_drift(self):
+        self.get_stats()
+        self.create_employee('Ada')
+        stats.adjust(self.user.pk, total_employees=5)
+        self.assertEqual(stats.reconcile([self.user]), 1)
+        self.assertEqual(self.get_stats()['total_employees'], 1)
+
+
+@override_settings(AUDIT_LOG={'MODE': 'sync'})
+class BatchTests(EmployeeMixin, TransactionTestCase):
+    """Committed data, read-only sub-requests run on pool threads with their own connections"""
+
+    def batch(self, requests):
+        return self.client.post('/api/batch/', {'requests': requests}, format='json')
+
+    def test_sub_requests_run_in_order_with_the_batch_user(self):
+        employee = self.create_employee('Ada')
+        response = self.batch([
+            {'id': 'create', 'method': 'POST', 'path': '/api/employees/',
+             'body': {'form_template': self.template.id, 'field_values_data': self.values(full_name='Grace')}},
+            {'id': 'list', 'path': '/api/employees/?page_size=10'},
+            {'id': 'one', 'path': f'/api/employees/{employee.id}/'},
+            {'id': 'missing', 'path': '/api/nothing-here/'},
+            {'id': 'update', 'method': 'PATCH', 'path': f'/api/employees/{employee.id}/', 'body': {'is_active': False}},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        responses = {item['id']: item for item in response.data['responses']}
+        self.assertEqual([item['id'] for item in response.data['responses']], ['create', 'list', 'one', 'missing', 'update'])
+        self.assertEqual(responses['create']['status'], 201)
+        self.assertEqual(responses['list']['body']['count'], 2)
+        self.assertEqual(responses['one']['body']['employee_name'], 'Ada')
+        self.assertEqual(responses['missing']['status'], 404)
+        self.assertEqual(responses['update']['status'], 200)
+        self.assertFalse(Employee.objects.get(pk=employee.id).is_active)
+
+    def test_streamed_responses_are_item_errors(self):
+        self.create_employee('Ada')
+        response = self.batch([
+            {'id': 'stream', 'path': '/api/employee/list/?stream=ndjson'},
+            {'id': 'page', 'path': '/api/employee/list/'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        stream, page = response.data['responses']
+        self.assertEqual(stream['status'], 400)
+        self.assertEqual(set(stream['body']), {'error'})
+        self.assertEqual(page['status'], 200)
+        self.assertEqual(page['body']['count'], 1)
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{'path': '/api/batch/'}]).status_code, 400)
+        self.assertEqual(self.batch([{'path': '/api/employees/', 'method': 'TRACE'}]).status_code, 400)
+        with override_settings(API_BATCH={'MAX_REQUESTS': 2}):
+            self.assertEqual(self.batch([{'path': '/api/employees/'}] * 3).status_code, 400)
+
+
+class BulkCreateTests(EmployeeTestCase):
+    def bulk(self, employees):
+        response = self.client.post('/api/employees/bulk/', {'form_template': self.template.id, 'employees': employees}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def test_valid_items_are_created_with_their_denormalized_copies(self):
+        data = self.bulk([
+            {'field_values_data': self.values(full_name='Ada', salary='72000')},
+            {'field_values_data': self.values(full_name='Grace'), 'is_active': False},
+        ])
+        self.assertEqual([item['employee_name'] for item in data['created']], ['Ada', 'Grace'])
+        ada = Employee.objects.get(pk=data['created'][0]['id'])
+        self.assertEqual(ada.display_name, 'Ada')
+        self.assertEqual(ada.values_snapshot['salary']['value'], 72000)
+        self.assertEqual(EmployeeFieldValue.objects.get(employee=ada, field=self.fields['salary']).value_number, 72000)
+        self.template.refresh_from_db()
+        self.assertEqual((self.template.employee_count, self.template.active_employee_count), (2, 1))
+        self.assertEqual(AuditLog.objects.filter(action='create').count(), 2)
+
+    def test_invalid_items_are_reported_by_index(self):
+        data = self.bulk([
+            {},
+            {'field_value_data': self.values(full_name='Typo')},
+            {'field_values_data': self.values(full_name='Ada'), 'is_active': 'false'},
+            {'field_values_data': self.values(full_name='')},
+            {'field_values_data': self.values(full_name='Ada', salary='lots')},
+            {'field_values_data': {'999999': 'x'}},
+            {'field_values_data': self.values(full_name='Valid')},
+        ])
+        self.assertEqual([item['employee_name'] for item in data['created']], ['Valid'])
+        errors = {error['index']: error['errors'] for error in data['errors']}
+        self.assertEqual(sorted(errors), [0, 1, 2, 3, 4, 5])
+        self.assertIn("unsupported key 'field_value_data'", errors[1])
+        self.assertIn('is_active must be true or false', errors[2])
+        self.assertEqual(Employee.objects.count(), 1)
+
+
+class BulkUpdateTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employees = [self.create_employee(f'Employee {index}', department='Engineering') for index in range(5)]
+        AuditLog.objects.all().delete()
+
+    def bulk_update(self, payload):
+        response = self.client.post('/api/employees/bulk_update/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_changeset_applies_to_the_selected_ids(self):
+        ids = [employee.id for employee in self.employees[:3]]
+        data = self.bulk_update({'ids': ids, 'changes': {'field_values_data': self.values(department='Sales')}})
+        self.assertEqual(data, {'matched': 3, 'updated': 3})
+        for employee in Employee.objects.filter(id__in=ids):
+            self.assertEqual(employee.values_snapshot['department']['value'], 'Sales')
+        self.assertEqual(projections.check_consistency(self.template), [])
+        self.assertEqual(
+            list(AuditLog.objects.values_list('changes', flat=True)),
+            [{'department': ['Engineering', 'Sales']}] * 3,
+        )
+
+    def test_chunks_cover_every_employee(self):
+        matched, updated = bulk.update_employees(
+            Employee.objects.filter(created_by=self.user), False, {self.fields['department']: 'Ops'}, self.user, chunk_size=2,
+        )
+        self.assertEqual((matched, updated), (5, 5))
+        self.assertFalse(Employee.objects.filter(is_active=True).exists())
+        self.assertEqual(AuditLog.objects.count(), 5)
+
+    def test_saved_search_filter_and_deactivate_keep_counters(self):
+        response = self.client.post('/api/employees/bulk_deactivate/', {
+            'filter': {'field': 'full_name', 'op': 'in', 'value': ['Employee 0', 'Employee 1']},
+        }, format='json')
+        self.assertEqual(response.data, {'matched': 2, 'updated': 2})
+        self.template.refresh_from_db()
+        self.assertEqual((self.template.employee_count, self.template.active_employee_count), (5, 3))
+        # Already inactive: matched but not updated, and not audited
+        response = self.client.post('/api/employees/bulk_deactivate/', {'ids': [self.employees[0].id]}, format='json')
+        self.assertEqual(response.data, {'matched': 1, 'updated': 0})
+        self.assertEqual(AuditLog.objects.count(), 2)
+
+    def test_invalid_changes_are_rejected(self):
+        for changes in ({}, {'department': 'Ops'}, {'is_active': 'no'}, {'field_values_data': self.values(salary='lots')}):
+            response = self.client.post('/api/employees/bulk_update/', {'ids': [self.employees[0].id], 'changes': changes}, format='json')
+            self.assertEqual(response.status_code, 400, changes)
+
+    def test_other_users_employees_are_not_matched(self):
+        other = create_user('other')
+        response = api_client(other).post('/api/employees/bulk_deactivate/', {'ids': [self.employees[0].id]}, format='json')
+        self.assertEqual(response.data['matched'], 0)
+        self.assertTrue(Employee.objects.get(pk=self.employees[0].id).is_active)
+
+
+class ChangesetTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employee = self.create_employee('Ada', salary='51000.0')
+        AuditLog.objects.all().delete()
+
+    def patch(self, **values):
+        response = self.client.patch(f'/api/employees/{self.employee.id}/', {'field_values_data': self.values(**values)}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_update_audits_only_changed_fields(self):
+        self.patch(salary='52000', department='Engineering')
+        self.assertEqual(AuditLog.objects.get().changes, {'salary': [51000, 52000]})
+
+    def test_update_with_equal_typed_values_writes_nothing(self):
+        stored = EmployeeFieldValue.objects.get(employee=self.employee, field=self.fields['salary'])
+        self.patch(salary='51000', hire_date='2024-01-01')
+        self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(EmployeeFieldValue.objects.get(pk=stored.pk).updated_at, stored.updated_at)
+
+    def test_bulk_update_skips_unchanged_and_empty_values(self):
+        response = self.client.post('/api/employees/bulk/', {'form_template': self.template.id, 'employees': [
+            {'field_values_data': self.values(full_name='No hire date')},
+        ]}, format='json')
+        AuditLog.objects.all().delete()
+        ids = [self.employee.id, response.data['created'][0]['id']]
+        rows = EmployeeFieldValue.objects.count()
+
+        data = self.client.post('/api/employees/bulk_update/', {
+            'ids': [self.employee.id], 'changes': {'field_values_data': self.values(salary=51000)},
+        }, format='json').data
+        self.assertEqual(data, {'matched': 1, 'updated': 0})
+
+        data = self.client.post('/api/employees/bulk_update/', {
+            'ids': ids, 'changes': {'field_values_data': self.values(hire_date='')},
+        }, format='json').data
+        self.assertEqual(data, {'matched': 2, 'updated': 1})
+        self.assertEqual(EmployeeFieldValue.objects.count(), rows)
+        self.assertEqual(AuditLog.objects.get().changes, {'hire_date': ['2024-01-01', None]})
+
+
+class ImportTests(EmployeeTestCase):
+    CSV = (
+        "Full Name,salary,Hired,Active,Nickname\n"
+        "Ada,72000,2024-01-02,true,A\n"
+        "Grace,lots,2024-01-03,true,G\n"
+        "\n"
+        "Alan,65000,2024-01-04,false,T\n"
+        "Katherine,80000,2024-01-05,yes,K\n"
+        "Dorothy,,,no,D\n"
+    )
+
+    def test_upload_maps_columns_and_reports_row_errors(self):
+        response = self.client.post('/api/employees/import/', {
+            'form_template': self.template.id,
+            'file': SimpleUploadedFile('staff.csv', self.CSV.encode(), content_type='text/csv'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.data['rows'], response.data['created'], response.data['failed']), (6, 4, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(response.data['unmapped_columns'], ['Nickname'])
+        self.assertEqual(sorted(Employee.objects.filter(is_active=False).values_list('display_name', flat=True)), ['Alan', 'Dorothy'])
+        self.template.refresh_from_db()
+        self.assertEqual(self.template.employee_count, 4)
+
+    def test_chunks_commit_progress_and_resume_skips_committed_rows(self):
+        committed = []
+        progress = imports.import_csv(
+            self.template, self.CSV.splitlines(), self.user, chunk_size=2,
+            on_chunk=lambda progress: committed.append(progress.rows),
+        )
+        self.assertEqual(committed, [2, 5, 6])
+        self.assertEqual(progress.created, 4)
+
+        resumed = imports.import_csv(self.template, self.CSV.splitlines(), self.user, start_row=5)
+        self.assertEqual((resumed.rows, resumed.created), (6, 1))
+        self.assertEqual(Employee.objects.filter(display_name='Dorothy').count(), 2)
+
+    def test_unmappable_header_is_rejected(self):
+        with self.assertRaises(imports.ImportFileError):
+            imports.import_csv(self.template, ['Nickname,Shoe size', 'A,42'], self.user)
+        response = self.client.post('/api/employees/import/', {
+            'form_template': self.template.id, 'file': SimpleUploadedFile('empty.csv', b''),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportJobTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media, EXPORT_JOBS={'PROCESSES': 0}))
+        for name in ('Ada', 'Grace', 'Alan'):
+            self.create_employee(name)
+
+    def submit(self, *args):
+        # Jobs are run here rather than on the executor queued on commit
+        with self.captureOnCommitCallbacks(execute=False):
+            return export_jobs.submit(self.user, *args)
+
+    def test_run_writes_file_and_unchanged_watermark_reuses_it(self):
+        job, reused = self.submit('wide', self.template)
+        self.assertFalse(reused)
+        export_jobs.run(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.row_count, job.partitions), ('done', 3, 1))
+        with open(job.file.path, encoding='utf-8') as export:
+            lines = export.read().splitlines()
+        self.assertTrue(lines[0].endswith('Full Name,Salary,Hired,Department'))
+        self.assertEqual(len(lines), 4)
+
+        self.assertEqual(self.submit('wide', self.template), (job, True))
+        self.create_employee('Katherine')
+        newer, reused = self.submit('wide', self.template)
+        self.assertNotEqual(newer.pk, job.pk)
+        self.assertFalse(reused)
+
+    def test_api_queues_polls_and_downloads(self):
+        self.assertEqual(self.client.post('/api/exports/', {'format': 'wide'}, format='json').status_code, 400)
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post('/api/exports/', {'format': 'ndjson'}, format='json')
+        self.assertEqual(response.status_code, 202, response.content)
+        job_id = response.data['id']
+        self.assertEqual(self.client.get(f'/api/exports/{job_id}/download/').status_code, 409)
+
+        export_jobs.run(job_id)
+        response = self.client.get(f'/api/exports/{job_id}/')
+        self.assertEqual((response.data['status'], response.data['row_count']), ('done', 3))
+        self.assertTrue(response.data['download_url'].endswith(f'/api/exports/{job_id}/download/'))
+
+        response = self.client.get(f'/api/exports/{job_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        response.close()
+        self.assertEqual(sorted(row['employee_name'] for row in rows), ['Ada', 'Alan', 'Grace'])
+        self.assertEqual(api_client(create_user('other')).get(f'/api/exports/{job_id}/').status_code, 404)
+        self.assertEqual(ExportJob.objects.get(pk=job_id).status, 'done')
+
+
+class JournalReplayTests(EmployeeTestCase):
+    DEAD_PID = 999999999
+
+    def setUp(self):
+        super().setUp()
+        self.employee = self.create_employee('Ada')
+        AuditLog.objects.all().delete()
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(AUDIT_LOG={'MODE': 'sync', 'JOURNAL_DIR': self.directory}))
+
+    def write_journal(self, name, *actions, tail=''):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as journal:
+            for action in actions:
+                journal.write(json.dumps(audit._event(self.employee, action, self.user)) + '\n')
+            journal.write(tail)
+
+    def test_left_journals_are_replayed_once(self):
+        pid, live_pid = os.getpid(), os.getppid()
+        # A dead process that had this PID, a dead PID and a failed flush of a live process
+        self.write_journal(f'{pid}-0123456789ab.jsonl', 'create', tail='{"employee_id": ')
+        self.write_journal(f'{pid}-0123456789ab-1.flushing', 'update')
+        self.write_journal(f'{self.DEAD_PID}-0123456789ab.jsonl', 'view')
+        self.write_journal(f'{live_pid}-0123456789ab-3.failed', 'delete')
+        # Still being written
+        self.write_journal(f'{audit._process_name()}.jsonl', 'delete')
+        self.write_journal(f'{live_pid}-0123456789ab.jsonl', 'delete')
+
+        self.assertEqual(audit.replay_journals(), 4)
+        self.assertEqual(sorted(AuditLog.objects.values_list('action', flat=True)), ['create', 'delete', 'update', 'view'])
+        self.assertEqual(audit.replay_journals(), 0)
+        self.assertEqual(AuditLog.objects.count(), 4)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted([f'{audit._process_name()}.jsonl', f'{live_pid}-0123456789ab.jsonl']))
+
+    def test_journal_that_fails_to_replay_is_kept(self):
+        self.write_journal(f'{self.DEAD_PID}-0123456789ab.jsonl', 'create')
+        with open(os.path.join(self.directory, f'{self.DEAD_PID}-0123456789ab.jsonl'), 'a', encoding='utf-8') as journal:
+            journal.write(json.dumps({'employee_id': self.employee.pk}) + '\n')
+
+        with self.assertRaises(KeyError):
+            audit.replay_journals()
+        names = os.listdir(self.directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith(audit._process_name()) and names[0].endswith('.failed'))
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_buffered_events_wait_for_commit(self):
+        with override_settings(AUDIT_LOG={'MODE': 'buffered', 'JOURNAL_DIR': self.directory}):
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertIsNone(audit.record(self.employee, 'update', self.user))
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertFalse(AuditLog.objects.exists())
+
+
+class AuditArchiveTests(EmployeeTestCase):
+    DAY = date(2024, 3, 14)
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(AUDIT_ARCHIVE={'DIRECTORY': self.enterContext(tempfile.TemporaryDirectory())}))
+        self.employee = self.create_employee('Ada')
+        self.old_ids = [
+            AuditLog.objects.create(
+                employee=self.employee, action='update', performed_by=self.user, changes={'salary': [hour, hour + 1]},
+                timestamp=datetime(2024, 3, 14, hour, tzinfo=dt_timezone.utc),
+            ).id
+            for hour in (9, 10, 11)
+        ]
+
+    def archive_lines(self):
+        segment_path, _ = audit_archive.segment_paths(self.DAY)
+        with gzip.open(segment_path, 'rt', encoding='utf-8') as segment:
+            return segment.read().splitlines()
+
+    def test_archived_rows_round_trip(self):
+        self.assertEqual(audit_archive.archive(retention_days=30), 3)
+        self.assertFalse(AuditLog.objects.filter(id__in=self.old_ids).exists())
+        self.assertEqual(AuditLog.objects.get().action, 'create')
+
+        rows = audit_archive.search(owner=self.user.id)
+        self.assertEqual([row['id'] for row in rows], self.old_ids[::-1])
+        self.assertEqual(rows[0]['changes'], {'salary': [11, 12]})
+        self.assertEqual(audit_archive.read_index(self.DAY)['employees'], [self.employee.id])
+        self.assertEqual(audit_archive.search(owner=self.user.id, employee=self.employee.id + 1), [])
+
+        response = self.client.get('/api/audit-logs/archived/', {'since': '2024-03-14', 'until': '2024-03-14', 'limit': 2})
+        self.assertEqual([row['id'] for row in response.data['results']], self.old_ids[:0:-1])
+        response = self.client.get('/api/audit-logs/archived/', {'before': response.data['next_before']})
+        self.assertEqual([row['id'] for row in response.data['results']], self.old_ids[:1])
+
+    def test_archiving_a_day_again_does_not_duplicate_rows(self):
+        audit_archive.archive_day(self.DAY)
+        # A run interrupted after writing the segment leaves the rows in the table
+        AuditLog.objects.create(
+            id=self.old_ids[0], employee=self.employee, action='update',
+            timestamp=datetime(2024, 3, 14, 9, tzinfo=dt_timezone.utc),
+        )
+        self.assertEqual(audit_archive.archive_day(self.DAY), 1)
+        self.assertEqual(len(self.archive_lines()), 3)
+        index = audit_archive.read_index(self.DAY)
+        self.assertEqual((index['rows'], index['actions']), (3, {'update': 3}))
+        self.assertEqual(len(audit_archive.segment_rows(self.DAY)), 3)
+
+    def test_late_rows_are_merged_in_timestamp_order(self):
+        audit_archive.archive_day(self.DAY)
+        late = AuditLog.objects.create(
+            employee=self.employee, action='view', timestamp=datetime(2024, 3, 14, 10, 30, tzinfo=dt_timezone.utc),
+        ).id
+        self.assertEqual(audit_archive.archive_day(self.DAY), 1)
+        ids = [json.loads(line)['id'] for line in self.archive_lines()]
+        self.assertEqual(ids, [self.old_ids[0], self.old_ids[1], late, self.old_ids[2]])
+        self.assertEqual(audit_archive.read_index(self.DAY)['actions'], {'update': 3, 'view': 1})
+
+    def test_listing_pages_through_hot_and_archived_rows(self):
+        audit_archive.archive_day(self.DAY)
+        AuditLog.objects.create(employee=self.employee, action='view', timestamp=datetime(2024, 3, 15, tzinfo=dt_timezone.utc))
+        hot_ids = list(AuditLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+        seen, params = [], {'include_archived': 'true', 'limit': 2}
+        while True:
+            data = self.client.get('/api/audit-logs/', params).data
+            seen += [(item['id'], item['archived']) for item in data['results']]
+            if not data['next_before']:
+                break
+            params['before'] = data['next_before']
+        self.assertEqual(seen, [(log_id, False) for log_id in hot_ids] + [(log_id, True) for log_id in self.old_ids[::-1]])
+
+        other = api_client(create_user('other'))
+        self.assertEqual(other.get('/api/audit-logs/', {'include_archived': 'true'}).data['results'], [])
+
+
+class AuditRollupTests(EmployeeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(AUDIT_ARCHIVE={'DIRECTORY': self.enterContext(tempfile.TemporaryDirectory())}))
+        self.employee = self.create_employee('Ada')
+
+    def rollup_totals(self):
+        totals = {}
+        for action, count in AuditLogRollup.objects.filter(owner=self.user).values_list('action', 'count'):
+            totals[action] = totals.get(action, 0) + count
+        return totals
+
+    def log_at(self, *moments):
+        for moment in moments:
+            AuditLog.objects.create(employee=self.employee, action='update', timestamp=datetime(*moment, tzinfo=dt_timezone.utc))
+
+    def histogram(self, **params):
+        response = self.client.get('/api/audit-logs/histogram/', {'action': 'update', **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['count'] for item in response.data['results']]
+
+    def test_rollups_count_every_write_path(self):
+        response = self.client.post('/api/employees/bulk/', {'form_template': self.template.id, 'employees': [
+            {'field_values_data': self.values(full_name='Grace')}, {'field_values_data': self.values(full_name='Alan')},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.client.post('/api/employees/bulk_update/', {
+            'ids': list(Employee.objects.values_list('id', flat=True)), 'changes': {'field_values_data': self.values(salary=60000)},
+        }, format='json')
+        audit._write_events([audit._event(self.employee, 'view', self.user)])
+
+        self.assertEqual(self.rollup_totals(), {'create': 3, 'update': 3, 'view': 1})
+        self.assertEqual(sum(self.rollup_totals().values()), AuditLog.objects.count())
+
+    def test_histogram_fills_empty_buckets(self):
+        self.log_at((2024, 3, 14, 9, 10), (2024, 3, 14, 9, 50), (2024, 3, 14, 11, 5), (2024, 3, 15, 0, 30))
+        self.assertEqual(self.histogram(since='2024-03-14T09:00:00Z', until='2024-03-14T12:00:00Z'), [2, 0, 1, 0])
+        self.assertEqual(self.histogram(bucket='day', since='2024-03-13', until='2024-03-15'), [0, 3, 1])
+        response = self.client.get('/api/audit-logs/histogram/', {'bucket': 'day', 'since': '2024-03-13', 'until': '2024-03-15'})
+        self.assertEqual(response.data['total'], 4)
+
+    def test_backfill_repairs_drift_including_archived_days(self):
+        self.log_at((2024, 3, 14, 9, 10), (2024, 3, 14, 11, 5), (2024, 3, 15, 0, 30))
+        audit_archive.archive_day(date(2024, 3, 14))
+        AuditLogRollup.objects.update(count=99)
+
+        # Without --all only the days from the oldest row of the table are recomputed
+        self.assertEqual(audit_rollups.backfill(), 2)
+        self.assertEqual(self.histogram(bucket='day', since='2024-03-14', until='2024-03-15'), [2 * 99, 1])
+
+        call_command('backfill_audit_rollups', '--all', stdout=io.StringIO())
+        self.assertEqual(self.histogram(bucket='day', since='2024-03-14', until='2024-03-15'), [2, 1])
+        self.assertEqual(self.rollup_totals(), {'create': 1, 'update': 3})
+
+    def test_day_buckets_need_whole_hour_offsets(self):
+        with timezone.override('Asia/Kolkata'):
+            response = self.client.get('/api/audit-logs/histogram/', {'bucket': 'day'})
+            self.assertEqual(response.status_code, 400)
+            self.histogram(bucket='hour')
+        with timezone.override('America/New_York'):
+            self.histogram(bucket='day')
+
+
+class SchemaCacheTests(EmployeeTestCase):
+    def schema(self):
+        return schema_cache.get_schema(FormTemplate.objects.get(pk=self.template.pk))
+
+    def field_names(self):
+        return [field.field_name for field in self.schema().fields]
+
+    def test_field_and_template_changes_invalidate_cached_schema(self):
+        self.assertEqual(self.field_names(), ['full_name', 'salary', 'hire_date', 'department'])
+        response = self.client.post(f'/api/form-templates/{self.template.id}/add_field/', {
+            'field_name': 'email', 'field_type': 'email', 'field_label': 'Email', 'order': 9,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.field_names(), ['full_name', 'salary', 'hire_date', 'department', 'email'])
+
+        response = self.client.put(f'/api/form-templates/{self.template.id}/reorder_fields/', {'field_orders': [
+            {'id': self.fields['full_name'].id, 'order': 10}, {'id': self.fields['department'].id, 'order': 0},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.field_names()[0], 'department')
+
+        response = self.client.patch(f'/api/form-templates/{self.template.id}/', {
+            'name_field': self.fields['department'].id,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.schema().name_field.field_name, 'department')
+
+    def test_admin_field_edits_invalidate_cached_schema(self):
+        admin = Client()
+        admin.force_login(User.objects.create_superuser('admin', password='test-pass-123'))
+        department = self.fields['department']
+        self.assertEqual(self.schema().by_name['department'].field_label, 'Department')
+
+        response = admin.post(f'/admin/api/formfield/{department.id}/change/', {
+            'form_template': self.template.id, 'field_name': 'department', 'field_type': 'text',
+            'field_label': 'Team', 'order': 3, 'options': 'null', 'validation_rules': 'null',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.schema().by_name['department'].field_label, 'Team')
+
+        response = admin.post(f'/admin/api/formfield/{department.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.field_names(), ['full_name', 'salary', 'hire_date'])
+        response = self.client.post('/api/employees/', {
+            'form_template': self.template.id, 'field_values_data': {str(department.id): 'Engineering'},
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(EmployeeFieldValue.objects.filter(field_id=department.id).exists())
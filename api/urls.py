@@ -9,8 +9,10 @@ from .views_forms import FormTemplateViewSet
 from .views_employees import EmployeeViewSet, AuditLogViewSet
 from .views_dashboard import (
     DashboardSettingsView, SavedSearchViewSet, NotificationViewSet, 
-    FileUploadView, dashboard_stats
+    FileUploadView, dashboard_stats, dashboard_bootstrap
 )
+from .views_batch import BatchView
+from .views_exports import ExportJobViewSet
 from .views_employee_auth import (
     EmployeeRegistrationView, EmployeeLoginView, EmployeeChangePasswordView,
     employee_profile, employee_list
@@ -23,6 +25,7 @@ router.register(r'employees', EmployeeViewSet, basename='employee')
 router.register(r'audit-logs', AuditLogViewSet, basename='audit-log')
 router.register(r'saved-searches', SavedSearchViewSet, basename='saved-search')
 router.register(r'notifications', NotificationViewSet, basename='notification')
+router.register(r'exports', ExportJobViewSet, basename='export-job')
 
 urlpatterns = [
     # Admin/Manager Authentication endpoints
@@ -42,7 +45,11 @@ urlpatterns = [
     # Dashboard endpoints
     path('dashboard/settings/', DashboardSettingsView.as_view(), name='dashboard_settings'),
     path('dashboard/stats/', dashboard_stats, name='dashboard_stats'),
+    path('dashboard/bootstrap/', dashboard_bootstrap, name='dashboard_bootstrap'),
     path('dashboard/upload/', FileUploadView.as_view(), name='file_upload'),
+
+    # Batched requests
+    path('batch/', BatchView.as_view(), name='batch'),
     
     # Include router URLs
     path('', include(router.urls)),
@@ -0,0 +1,187 @@
+"""Batched API requests
+
+``POST /api/batch/`` runs several API requests in one round-trip::
+
+    {"requests": [
+        {"id": "logs", "method": "GET", "path": "/api/audit-logs/?employee=3"},
+        {"id": "employee", "method": "GET", "path": "/api/employees/3/"}
+    ]}
+
+Sub-requests are resolved against the URLconf and dispatched to the views
+in-process with the batch's already authenticated user. Runs of consecutive
+GET/HEAD sub-requests are executed concurrently on a bounded thread pool,
+other methods run one at a time in order, so writes see the effect of earlier
+sub-requests. Streamed responses (NDJSON lists, file downloads) are not
+buffered into the batch: such sub-requests get a 400 item error and have to
+be requested directly.
+"""
+import io
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_REQUESTS': 20,    # sub-requests per batch
+    'MAX_WORKERS': 4,      # threads running read-only sub-requests, shared by all batches
+}
+
+READ_ONLY_METHODS = ('GET', 'HEAD')
+ALLOWED_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _setting(name):
+    return getattr(settings, 'API_BATCH', {}).get(name, DEFAULTS[name])
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_setting('MAX_WORKERS'), thread_name_prefix='api-batch')
+        return _executor
+
+
+def _parse_items(data):
+    """Validate the batch payload, returns ``(items, errors)``"""
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, ['requests must be a non-empty list']
+    if len(items) > _setting('MAX_REQUESTS'):
+        return None, [f"a batch can hold at most {_setting('MAX_REQUESTS')} requests"]
+
+    errors = []
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            errors.append(f"requests[{index}]: expected an object with a path")
+            continue
+        method = str(item.get('method', 'GET')).upper()
+        if method not in ALLOWED_METHODS:
+            errors.append(f"requests[{index}]: unsupported method {method}")
+            continue
+        path = urlsplit(item['path'])
+        if not path.path.startswith('/api/') or path.path.rstrip('/') == '/api/batch':
+            errors.append(f"requests[{index}]: path must be an API endpoint other than /api/batch/")
+            continue
+        parsed.append({
+            'id': item.get('id', index),
+            'method': method,
+            'path': path.path,
+            'query': path.query,
+            'body': item.get('body'),
+        })
+    return parsed, errors
+
+
+class BatchView(APIView):
+    """Run several API requests in one round-trip"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        items, errors = _parse_items(request.data)
+        if errors:
+            return Response({'error': 'Invalid batch', 'details': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        started = time.monotonic()
+        results = [None] * len(items)
+        index = 0
+        while index < len(items):
+            if items[index]['method'] not in READ_ONLY_METHODS:
+                results[index] = self.run_item(items[index])
+                index += 1
+                continue
+            # Consecutive reads do not depend on each other, run them concurrently
+            end = index
+            while end < len(items) and items[end]['method'] in READ_ONLY_METHODS:
+                end += 1
+            futures = [_get_executor().submit(self.run_item_in_thread, item) for item in items[index:end]]
+            for offset, future in enumerate(futures):
+                results[index + offset] = future.result()
+            index = end
+
+        return Response({
+            'responses': results,
+            'duration_ms': round((time.monotonic() - started) * 1000, 2),
+        })
+
+    def build_request(self, item):
+        body = b''
+        if item['body'] is not None:
+            body = json.dumps(item['body']).encode()
+        environ = {
+            key: value for key, value in self.request.META.items()
+            if key.startswith('HTTP_') or key in ('REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'wsgi.url_scheme')
+        }
+        environ.update({
+            'REQUEST_METHOD': item['method'],
+            'PATH_INFO': item['path'],
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': item['query'],
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': io.BytesIO(body),
+        })
+        sub_request = WSGIRequest(environ)
+        # Authenticated once for the whole batch
+        sub_request.user = self.request.user
+        sub_request._force_auth_user = self.request.user
+        sub_request._force_auth_token = self.request.auth
+        return sub_request
+
+    def run_item(self, item):
+        started = time.monotonic()
+        try:
+            match = resolve(item['path'])
+        except Resolver404:
+            response_status, body = status.HTTP_404_NOT_FOUND, {'error': 'Not found'}
+        else:
+            try:
+                response = match.func(self.build_request(item), *match.args, **match.kwargs)
+                if response.streaming:
+                    # Closes the file or generator behind the stream
+                    response.close()
+                    response_status, body = status.HTTP_400_BAD_REQUEST, {
+                        'error': 'Streamed responses are not supported in a batch, request this path directly',
+                    }
+                else:
+                    if hasattr(response, 'render'):
+                        response.render()
+                    response_status = response.status_code
+                    body = getattr(response, 'data', None)
+                    if body is None and response.content:
+                        body = response.content.decode(response.charset or 'utf-8')
+            except Exception:
+                logger.exception("Batch sub-request %s %s failed", item['method'], item['path'])
+                response_status, body = status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'Request failed'}
+        return {
+            'id': item['id'],
+            'status': response_status,
+            'body': body,
+            'duration_ms': round((time.monotonic() - started) * 1000, 2),
+        }
+
+    def run_item_in_thread(self, item):
+        try:
+            return self.run_item(item)
+        finally:
+            # Pool threads get their own database connection, do not leave it open
+            connection.close()
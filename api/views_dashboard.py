@@ -9,8 +9,11 @@ import uuid
 
 from .models import Employee, AuditLog
 from .serializers import (
-    DashboardSettingsSerializer, SavedSearchSerializer, NotificationSerializer
+    DashboardSettingsSerializer, SavedSearchSerializer, NotificationSerializer, EmployeeSerializer,
+    FormTemplateSerializer, AuditLogSerializer
 )
+from .saved_search import QueryError, employee_queryset, explain
+from dashboard import stats
 from dashboard.models import DashboardSettings, SavedSearch, Notification,FormTemplate
 
 
@@ -43,6 +46,34 @@ class SavedSearchViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def _search_queryset(self, saved_search):
+        try:
+            return employee_queryset(saved_search.search_query, self.request.user), None
+        except QueryError as e:
+            return None, Response({'error': 'Invalid search query', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['get'])
+    def run(self, request, pk=None):
+        """Run a saved search and return the matching employees (paginated)"""
+        queryset, error = self._search_queryset(self.get_object())
+        if error:
+            return error
+        context = {**self.get_serializer_context(), 'use_snapshot': True}
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = EmployeeSerializer(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        serializer = EmployeeSerializer(queryset, many=True, context=context)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def explain(self, request, pk=None):
+        """Return the SQL, query plan and estimated cost of a saved search"""
+        queryset, error = self._search_queryset(self.get_object())
+        if error:
+            return error
+        return Response({'sql': str(queryset.query), **explain(queryset)})
+
 
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """Notification management (read-only for now)"""
@@ -51,7 +82,7 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        return Notification.objects.filter(user=self.request.user).select_related('related_employee')
 
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
@@ -86,15 +117,32 @@ class FileUploadView(APIView):
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     """Get dashboard statistics"""
-    user = request.user
-    
-    stats = {
-        'total_employees': Employee.objects.filter(created_by=user).count(),
-        'total_form_templates': FormTemplate.objects.filter(created_by=user).count(),
-        'active_employees': Employee.objects.filter(created_by=user, is_active=True).count(),
-        'recent_employees': Employee.objects.filter(created_by=user).order_by('-created_at')[:5].count(),
-        'unread_notifications': Notification.objects.filter(user=user, is_read=False).count(),
+    return Response(stats.as_dict(stats.get_stats(request.user)))
+
+
+# Fields shown by the dashboard's recent employees card
+BOOTSTRAP_EMPLOYEE_FIELDS = {'id', 'employee_id', 'employee_name', 'form_template_name', 'created_at', 'is_active'}
+
+
+def dashboard_bootstrap_data(user, limit=5):
+    """Stats, recent employees, form templates and recent activity for the dashboard page"""
+    employees = EmployeeSerializer.optimize_queryset(
+        Employee.objects.filter(created_by=user).order_by('-created_at'), BOOTSTRAP_EMPLOYEE_FIELDS
+    )[:limit]
+    form_templates = FormTemplate.objects.filter(created_by=user).select_related('created_by').prefetch_related('fields')[:limit]
+    activity = AuditLog.objects.filter(employee__created_by=user).select_related('employee', 'performed_by')[:limit]
+    return {
+        'stats': stats.as_dict(stats.get_stats(user)),
+        'recent_employees': EmployeeSerializer(
+            employees, many=True, context={'use_snapshot': True, 'fields': BOOTSTRAP_EMPLOYEE_FIELDS}
+        ).data,
+        'form_templates': FormTemplateSerializer(form_templates, many=True).data,
+        'recent_activity': AuditLogSerializer(activity, many=True).data,
     }
-    
-    return Response(stats)
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_bootstrap(request):
+    """Get everything the dashboard page shows in one request"""
+    return Response(dashboard_bootstrap_data(request.user))
@@ -1,14 +1,19 @@
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.db import transaction
 import json
 
-from .models import Employee, EmployeeFieldValue, FormField, AuditLog
+from .models import Employee, EmployeeFieldValue
+from . import audit, schema_cache
+from .pagination import KeysetPagination
 from .serializers import EmployeeSerializer
 
 
@@ -73,10 +78,10 @@ class EmployeeRegistrationView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Validate required fields from form template
-            form_fields = FormField.objects.filter(form_template_id=form_template_id, is_required=True)
+            schema = schema_cache.get_schema(form_template)
             validation_errors = []
             
-            for field in form_fields:
+            for field in schema.required_fields:
                 field_value = field_values.get(str(field.id), '')
                 if not field_value or (isinstance(field_value, str) and field_value.strip() == ''):
                     validation_errors.append(f"{field.field_label} is required")
@@ -92,7 +97,7 @@ class EmployeeRegistrationView(APIView):
                 # Create employee
                 employee = Employee.objects.create(
                     username=username,
-                    form_template_id=form_template_id,
+                    form_template=form_template,
                     is_employee_active=True,
                     created_by=request.user if hasattr(request, 'user') and request.user.is_authenticated else None
                 )
@@ -103,18 +108,19 @@ class EmployeeRegistrationView(APIView):
                 
                 # Create field values
                 for field_id, value in field_values.items():
-                    try:
-                        field = FormField.objects.get(id=field_id, form_template=form_template)
-                        EmployeeFieldValue.objects.create(
-                            employee=employee,
-                            field=field,
-                            value=str(value)
-                        )
-                    except FormField.DoesNotExist:
+                    field = schema.field(field_id)
+                    if field is None:
                         continue
+                    EmployeeFieldValue.objects.create(
+                        employee=employee,
+                        field=field,
+                        value=str(value)
+                    )
+                
+                employee.sync_field_values()
                 
                 # Create audit log
-                AuditLog.objects.create(
+                audit.record(
                     employee=employee,
                     action='create',
                     performed_by=request.user if hasattr(request, 'user') and request.user.is_authenticated else None,
@@ -122,7 +128,7 @@ class EmployeeRegistrationView(APIView):
                 )
             
             # Return success response
-            serializer = EmployeeSerializer(employee)
+            serializer = EmployeeSerializer(employee, context={'use_snapshot': True})
             return Response({
                 'message': 'Employee registered successfully',
                 'employee': serializer.data
@@ -154,7 +160,9 @@ class EmployeeLoginView(APIView):
             
             # Find employee by username
             try:
-                employee = Employee.objects.get(username=username, is_employee_active=True)
+                employee = Employee.objects.select_related('form_template', 'created_by').get(
+                    username=username, is_employee_active=True
+                )
             except Employee.DoesNotExist:
                 return Response({
                     'error': 'Invalid username or password'
@@ -171,7 +179,7 @@ class EmployeeLoginView(APIView):
             employee.save()
             
             # Create audit log
-            AuditLog.objects.create(
+            audit.record(
                 employee=employee,
                 action='view',
                 performed_by=None,  # Employee login doesn't have a User object
@@ -179,7 +187,7 @@ class EmployeeLoginView(APIView):
             )
             
             # Return employee data
-            serializer = EmployeeSerializer(employee)
+            serializer = EmployeeSerializer(employee, context={'use_snapshot': True})
             return Response({
                 'message': 'Login successful',
                 'employee': serializer.data
@@ -237,7 +245,7 @@ class EmployeeChangePasswordView(APIView):
             employee.save()
             
             # Create audit log
-            AuditLog.objects.create(
+            audit.record(
                 employee=employee,
                 action='update',
                 performed_by=None,  # Employee password change doesn't have a User object
@@ -260,8 +268,10 @@ class EmployeeChangePasswordView(APIView):
 def employee_profile(request, employee_id):
     """Get employee profile by ID"""
     try:
-        employee = Employee.objects.get(employee_id=employee_id, is_employee_active=True)
-        serializer = EmployeeSerializer(employee)
+        fields = EmployeeSerializer.requested_fields(request)
+        employees = EmployeeSerializer.optimize_queryset(Employee.objects.select_related('form_template', 'created_by'), fields)
+        employee = employees.get(employee_id=employee_id, is_employee_active=True)
+        serializer = EmployeeSerializer(employee, context={'use_snapshot': True, 'fields': fields})
         return Response(serializer.data)
     except Employee.DoesNotExist:
         return Response({
@@ -277,16 +287,42 @@ def employee_profile(request, employee_id):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def employee_list(request):
-    """Get list of active employees"""
+    """Get list of active employees, paginated or streamed as NDJSON with ?stream=ndjson"""
     try:
-        employees = Employee.objects.filter(is_employee_active=True, is_active=True)
-        serializer = EmployeeSerializer(employees, many=True)
+        fields = EmployeeSerializer.requested_fields(request)
+        context = {'use_snapshot': True, 'fields': fields}
+        employees = Employee.objects.filter(is_employee_active=True, is_active=True).select_related('form_template', 'created_by')
+        employees = EmployeeSerializer.optimize_queryset(employees, fields)
+        if request.query_params.get('stream') == 'ndjson':
+            return StreamingHttpResponse(_ndjson_rows(employees, context), content_type='application/x-ndjson')
+
+        # ?pagination=cursor pages on the same keyset as /api/employees/
+        view = request.parser_context['view']
+        view.keyset_ordering = ('-created_at', '-id')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(employees, request, view)
+        serializer = EmployeeSerializer(page, many=True, context=context)
+        data = {'employees': serializer.data}
+        count = paginator.count if paginator.keyset else paginator.page.paginator.count
+        if count is not None:
+            data['count'] = count
+        data['next'] = paginator.get_next_link()
+        data['previous'] = paginator.get_previous_link()
+        return Response(data)
+    except NotFound as e:
         return Response({
-            'employees': serializer.data,
-            'count': employees.count()
-        })
+            'error': 'Failed to fetch employees',
+            'details': str(e.detail)
+        }, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({
             'error': 'Failed to fetch employees',
             'details': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _ndjson_rows(employees, context, chunk_size=500):
+    """One JSON document per employee, read from the database in chunks"""
+    serializer = EmployeeSerializer(context=context)
+    for employee in employees.iterator(chunk_size=chunk_size):
+        yield json.dumps(serializer.to_representation(employee), cls=DjangoJSONEncoder) + '\n'
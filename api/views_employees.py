@@ -1,14 +1,23 @@
-from rest_framework import generics, status, viewsets, filters
+from rest_framework import generics, serializers, status, viewsets, filters
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.models import User
 from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
+from datetime import datetime, time, timedelta
+import io
 import uuid
 
 from .models import FormTemplate, FormField, Employee, EmployeeFieldValue, AuditLog
+from . import audit, audit_archive, audit_rollups, bulk, fuzzy_index, imports, projections, search_index
+from .filters import FieldValueFilterBackend
+from .pagination import KeysetPagination
+from .saved_search import QueryError, employee_queryset
 from .serializers import (
     EmployeeSerializer, EmployeeCreateUpdateSerializer, EmployeeFieldValueSerializer,
     AuditLogSerializer
@@ -19,24 +28,32 @@ class EmployeeViewSet(viewsets.ModelViewSet):
     """Employee CRUD operations"""
     serializer_class = EmployeeSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FieldValueFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['form_template', 'is_active', 'created_by']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        queryset = Employee.objects.filter(created_by=self.request.user)
+        queryset = Employee.objects.filter(created_by=self.request.user).select_related('form_template', 'created_by')
         
         # Dynamic search based on field values
         search_query = self.request.query_params.get('search', None)
         if search_query:
-            field_values = EmployeeFieldValue.objects.filter(
-                value__icontains=search_query,
-                employee__created_by=self.request.user
-            )
-            employee_ids = field_values.values_list('employee_id', flat=True)
-            queryset = queryset.filter(id__in=employee_ids)
-        
+            matches = search_index.filter_queryset(queryset, search_query)
+            if matches is not None:
+                queryset = matches
+            else:
+                field_values = EmployeeFieldValue.objects.filter(
+                    value__icontains=search_query,
+                    employee__created_by=self.request.user
+                )
+                employee_ids = field_values.values_list('employee_id', flat=True)
+                queryset = queryset.filter(id__in=employee_ids)
+
+        if self.action in ['list', 'retrieve']:
+            queryset = EmployeeSerializer.optimize_queryset(queryset, EmployeeSerializer.requested_fields(self.request))
         return queryset
 
     def get_serializer_class(self):
@@ -44,11 +61,19 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             return EmployeeCreateUpdateSerializer
         return EmployeeSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Reads render field values from the stored snapshot, no joins needed
+        context['use_snapshot'] = self.action in ['list', 'retrieve', 'search']
+        if context['use_snapshot']:
+            context['fields'] = EmployeeSerializer.requested_fields(self.request)
+        return context
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
         
         # Create audit log
-        AuditLog.objects.create(
+        audit.record(
             employee=serializer.instance,
             action='create',
             performed_by=self.request.user,
@@ -56,25 +81,21 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         )
 
     def perform_update(self, serializer):
-        old_values = {}
-        if self.action == 'update':
-            # Get old values for audit
-            old_values = {fv.field.field_name: fv.value for fv in serializer.instance.field_values.all()}
-        
         serializer.save()
         
-        # Create audit log
-        AuditLog.objects.create(
-            employee=serializer.instance,
-            action='update',
-            performed_by=self.request.user,
-            changes={'old_values': old_values},
-            ip_address=self.get_client_ip()
-        )
+        # Create audit log of the changed fields, no-op updates are not logged
+        if serializer.changeset:
+            audit.record(
+                employee=serializer.instance,
+                action='update',
+                performed_by=self.request.user,
+                changes=serializer.changeset.as_audit(),
+                ip_address=self.get_client_ip()
+            )
 
     def perform_destroy(self, instance):
         # Create audit log before deletion
-        AuditLog.objects.create(
+        audit.record(
             employee=instance,
             action='delete',
             performed_by=self.request.user,
@@ -90,6 +111,84 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             ip = self.request.META.get('REMOTE_ADDR')
         return ip
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many employees of one form template, reporting invalid items individually"""
+        employees = request.data.get('employees')
+        if not isinstance(employees, list) or not employees:
+            return Response({'error': 'employees must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(employees) > bulk.MAX_BULK_ITEMS:
+            return Response({'error': f'At most {bulk.MAX_BULK_ITEMS} employees can be created at once'}, status=status.HTTP_400_BAD_REQUEST)
+        form_template = FormTemplate.objects.filter(id=request.data.get('form_template'), created_by=request.user).first()
+        if form_template is None:
+            return Response({'error': 'Invalid form template'}, status=status.HTTP_400_BAD_REQUEST)
+
+        created, errors = bulk.create_employees(form_template, employees, request.user, self.get_client_ip())
+        return Response({
+            'created': [
+                {'index': index, 'id': employee.id, 'employee_id': employee.employee_id, 'employee_name': employee.employee_name}
+                for index, employee in created
+            ],
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_csv(self, request):
+        """Create employees of one form template from an uploaded CSV file"""
+        file = request.FILES.get('file')
+        if not file:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        form_template = FormTemplate.objects.filter(id=request.data.get('form_template'), created_by=request.user).first()
+        if form_template is None:
+            return Response({'error': 'Invalid form template'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_row = int(request.data.get('start_row', 0))
+        except (TypeError, ValueError):
+            return Response({'error': 'start_row must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+        try:
+            progress = imports.import_csv(form_template, lines, request.user, start_row=start_row,
+                                          ip_address=self.get_client_ip())
+        except (UnicodeDecodeError, imports.ImportFileError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(progress.as_dict(), status=status.HTTP_201_CREATED if progress.created else status.HTTP_200_OK)
+
+    def _bulk_targets(self, request):
+        """Employees selected by ``ids`` or a saved search ``filter`` query, returns ``(queryset, error)``"""
+        ids = request.data.get('ids')
+        query = request.data.get('filter')
+        if (ids is None) == (query is None):
+            return None, 'Provide either ids or filter'
+        if ids is not None:
+            if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
+                return None, 'ids must be a non-empty list of employee ids'
+            return Employee.objects.filter(created_by=request.user, id__in=ids), None
+        try:
+            return employee_queryset(query, request.user), None
+        except QueryError as e:
+            return None, f'Invalid filter: {e}'
+
+    def _bulk_update(self, request, changes):
+        queryset, error = self._bulk_targets(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        is_active, values, errors = bulk.validate_changes(changes, request.user)
+        if errors:
+            return Response({'error': 'Invalid changes', 'details': errors}, status=status.HTTP_400_BAD_REQUEST)
+        matched, updated = bulk.update_employees(queryset, is_active, values, request.user, self.get_client_ip())
+        return Response({'matched': matched, 'updated': updated})
+
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """Apply one changeset to the employees selected by ids or a filter"""
+        return self._bulk_update(request, request.data.get('changes'))
+
+    @action(detail=False, methods=['post'])
+    def bulk_deactivate(self, request):
+        """Deactivate the employees selected by ids or a filter"""
+        return self._bulk_update(request, {'is_active': False})
+
     @action(detail=True, methods=['get'])
     def field_values(self, request, pk=None):
         """Get field values for a specific employee"""
@@ -103,25 +202,68 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         """Advanced search for employees"""
         query_params = request.query_params
         form_template_id = query_params.get('form_template')
-        search_terms = query_params.get('search_terms', '').split(',')
+        search_terms = [term.strip() for term in query_params.get('search_terms', '').split(',') if term.strip()]
         
-        queryset = Employee.objects.filter(created_by=request.user)
+        queryset = Employee.objects.filter(created_by=request.user).select_related('form_template', 'created_by')
+        form_template = None
         
         if form_template_id:
             queryset = queryset.filter(form_template_id=form_template_id)
+            form_template = FormTemplate.objects.filter(id=form_template_id, created_by=request.user).first()
+        
+        queryset = EmployeeSerializer.optimize_queryset(queryset, EmployeeSerializer.requested_fields(request))
+
+        fuzzy = query_params.get('fuzzy', '').strip()
+        if fuzzy:
+            return self._fuzzy_search(queryset, fuzzy)
         
-        if search_terms:
+        matches = search_index.filter_queryset(queryset, search_terms, rank=True) if search_terms else None
+        if matches is not None:
+            queryset = matches
+        elif search_terms and form_template is not None:
+            # Single template: scan its wide projection table instead of joining the EAV rows
+            sql, params = projections.matching_ids_sql(form_template, terms=search_terms)
+            queryset = queryset.filter(id__in=RawSQL(sql, params))
+        elif search_terms:
             field_value_queries = Q()
             for term in search_terms:
-                if term.strip():
-                    field_value_queries |= Q(
-                        field_values__value__icontains=term.strip()
-                    )
+                field_value_queries |= Q(
+                    field_values__value__icontains=term
+                )
             queryset = queryset.filter(field_value_queries).distinct()
         
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    def _fuzzy_search(self, queryset, text):
+        """Typo-tolerant search ranked by trigram similarity"""
+        try:
+            limit = min(int(self.request.query_params.get('limit', 50)), 500)
+        except ValueError:
+            limit = 50
+        # Only the employees of the queryset are ranked, matches of other users never fill the limit
+        ranked = fuzzy_index.search(text, limit=limit, employee_ids=set(queryset.values_list('id', flat=True)))
+        scores = dict(ranked)
+        employees = sorted(queryset.filter(id__in=scores), key=lambda e: -scores[e.id])
+        data = self.get_serializer(employees, many=True).data
+        for employee, item in zip(employees, data):
+            item['similarity'] = round(scores[employee.id], 3)
+        return Response(data)
+
+
+def _parse_moment(value, end_of_day=False):
+    """Aware datetime from an ISO date or datetime, None when empty"""
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
 
 class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     """Audit log view (read-only)"""
@@ -131,7 +273,120 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['action', 'performed_by', 'employee']
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
-        return AuditLog.objects.filter(employee__created_by=self.request.user)
+        return AuditLog.objects.filter(employee__created_by=self.request.user).select_related('employee', 'performed_by')
+
+    def _archive_filters(self, params):
+        """Filters of an archive search from the query parameters, raises ValueError when invalid"""
+        before = None
+        if params.get('before'):
+            # An unencoded '+' of the UTC offset arrives as a space
+            timestamp, _, log_id = params['before'].replace(' ', '+').rpartition(',')
+            before = (_parse_moment(timestamp), int(log_id))
+        return {
+            'employee': int(params['employee']) if params.get('employee') else None,
+            'performed_by': int(params['performed_by']) if params.get('performed_by') else None,
+            'action': params.get('action') or None,
+            'since': _parse_moment(params.get('since')),
+            'until': _parse_moment(params.get('until'), end_of_day=True),
+            'before': before,
+        }
+
+    def list(self, request, *args, **kwargs):
+        """Audit logs; ``?include_archived=true`` adds the rows moved to the archive, newest first"""
+        if request.query_params.get('include_archived') != 'true':
+            return super().list(request, *args, **kwargs)
+        try:
+            search = self._archive_filters(request.query_params)
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid employee, performed_by, limit, since, until or before'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        logs = self.filter_queryset(self.get_queryset())
+        if search['since']:
+            logs = logs.filter(timestamp__gte=search['since'])
+        if search['until']:
+            logs = logs.filter(timestamp__lte=search['until'])
+        if search['before']:
+            timestamp, log_id = search['before']
+            logs = logs.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=log_id))
+        logs = list(logs.order_by('-timestamp', '-id')[:limit + 1])
+        results = {}
+        for log, item in zip(logs, self.get_serializer(logs, many=True).data):
+            results[log.id] = ((log.timestamp, log.id), {**item, 'archived': False})
+
+        # Rows archived by an interrupted run may still be in the table, those win
+        timestamp_field = serializers.DateTimeField()
+        for row in audit_archive.search(owner=request.user.id, limit=limit + 1, **search):
+            if row['id'] in results:
+                continue
+            timestamp = parse_datetime(row['timestamp'])
+            results[row['id']] = ((timestamp, row['id']), {
+                'id': row['id'], 'employee': row['employee'], 'employee_name': row['employee_name'],
+                'action': row['action'], 'performed_by': row['performed_by'],
+                'performed_by_username': row['performed_by_username'], 'changes': row['changes'],
+                'timestamp': timestamp_field.to_representation(timestamp), 'ip_address': row['ip_address'],
+                'archived': True,
+            })
+
+        ordered = sorted(results.values(), key=lambda result: result[0], reverse=True)
+        page = ordered[:limit]
+        next_before = None
+        if len(ordered) > limit:
+            timestamp, log_id = page[-1][0]
+            next_before = f"{timestamp.isoformat()},{log_id}"
+        return Response({'results': [item for _, item in page], 'next_before': next_before})
+
+    @action(detail=False, methods=['get'])
+    def archived(self, request):
+        """Search audit logs moved to the archive, by employee, action and time range"""
+        try:
+            search = self._archive_filters(request.query_params)
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid employee, performed_by, limit, since, until or before'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = audit_archive.search(owner=request.user.id, limit=limit, **search)
+        next_before = f"{results[-1]['timestamp']},{results[-1]['id']}" if len(results) == limit else None
+        for row in results:
+            del row['owner']
+        return Response({'results': results, 'next_before': next_before})
+
+    @action(detail=False, methods=['get'])
+    def histogram(self, request):
+        """Audit log entries per hour or day, from the hourly rollups"""
+        params = request.query_params
+        bucket = params.get('bucket', 'hour')
+        if bucket not in audit_rollups.BUCKETS:
+            return Response({'error': f"bucket must be one of {', '.join(audit_rollups.BUCKETS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        action_type = params.get('action') or None
+        if action_type is not None and action_type not in dict(AuditLog.ACTION_TYPES):
+            return Response({'error': 'Invalid action'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            until = _parse_moment(params.get('until'), end_of_day=True) or timezone.now()
+            since = _parse_moment(params.get('since')) or until - (timedelta(hours=47) if bucket == 'hour' else timedelta(days=29))
+        except ValueError:
+            return Response({'error': 'Invalid since or until'}, status=status.HTTP_400_BAD_REQUEST)
+        if since > until:
+            return Response({'error': 'since must be before until'}, status=status.HTTP_400_BAD_REQUEST)
+        if bucket == 'day' and not audit_rollups.day_buckets_supported(since, until):
+            return Response({'error': 'Day buckets need a time zone offset of whole hours, use hour buckets'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(audit_rollups.bucket_starts(since, until, bucket)) > audit_rollups.MAX_BUCKETS:
+            return Response({'error': f"At most {audit_rollups.MAX_BUCKETS} buckets, use a shorter range or day buckets"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = audit_rollups.histogram(request.user, bucket, since, until, action_type)
+        return Response({
+            'bucket': bucket,
+            'since': since,
+            'until': until,
+            'total': sum(count for _, count in results),
+            'results': [{'start': start, 'count': count} for start, count in results],
+        })
 
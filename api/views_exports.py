@@ -0,0 +1,66 @@
+import os
+
+from django.http import FileResponse
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from . import export_jobs, exports
+from .models import ExportJob, FormTemplate
+from .serializers import ExportJobSerializer
+
+
+class ExportJobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Background employee exports: queue, poll and download"""
+    serializer_class = ExportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        export_format = request.data.get('format', 'csv')
+        if export_format not in exports.FORMATS:
+            return Response({'error': f"format must be one of {', '.join(exports.FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        form_template = None
+        if request.data.get('form_template'):
+            form_template = FormTemplate.objects.filter(id=request.data['form_template'], created_by=request.user).first()
+            if form_template is None:
+                return Response({'error': 'Invalid form template'}, status=status.HTTP_400_BAD_REQUEST)
+        if export_format == 'wide' and form_template is None:
+            return Response({'error': 'The wide format needs a form_template'}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {}
+        if request.data.get('search'):
+            filters['search'] = str(request.data['search'])
+        is_active = request.data.get('is_active')
+        if isinstance(is_active, bool) or str(is_active).lower() in ('true', 'false'):
+            filters['is_active'] = str(is_active).lower()
+
+        job, reused = export_jobs.submit(request.user, export_format, form_template, filters)
+        data = self.get_serializer(job).data
+        data['reused'] = reused
+        return Response(data, status=status.HTTP_200_OK if job.status == 'done' else status.HTTP_202_ACCEPTED)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Job status, ``?wait=<seconds>`` holds the request until the job finishes"""
+        job = self.get_object()
+        try:
+            timeout = float(request.query_params.get('wait', 0))
+        except ValueError:
+            timeout = 0
+        if timeout > 0:
+            export_jobs.wait(job, timeout)
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the file of a finished job"""
+        job = self.get_object()
+        if job.status != 'done' or not job.file or not os.path.exists(job.file.path):
+            return Response({'error': 'Export is not ready'}, status=status.HTTP_409_CONFLICT)
+        return FileResponse(
+            open(job.file.path, 'rb'), as_attachment=True,
+            filename=os.path.basename(job.file.name), content_type=exports.CONTENT_TYPES[job.export_format],
+        )
@@ -9,6 +9,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 import uuid
 
 from .models import FormTemplate, FormField, Employee, EmployeeFieldValue, AuditLog
+from . import projections
 from .serializers import (
     FormTemplateSerializer, FormTemplateCreateSerializer, FormFieldSerializer,
     EmployeeSerializer, EmployeeCreateUpdateSerializer, EmployeeFieldValueSerializer,
@@ -51,7 +52,12 @@ class FormTemplateViewSet(viewsets.ModelViewSet):
         form_template = self.get_object()
         serializer = FormFieldSerializer(data=request.data)
         if serializer.is_valid():
+            old_name_field = form_template.resolve_name_field()
             serializer.save(form_template=form_template)
+            form_template.bump_schema_version()
+            projections.ensure_table(form_template)
+            if form_template.resolve_name_field() != old_name_field:
+                form_template.sync_employee_display_names()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -60,6 +66,7 @@ class FormTemplateViewSet(viewsets.ModelViewSet):
         """Reorder fields in form template"""
         form_template = self.get_object()
         field_orders = request.data.get('field_orders', [])
+        old_name_field = form_template.resolve_name_field()
         
         for field_data in field_orders:
             field_id = field_data.get('id')
@@ -71,5 +78,9 @@ class FormTemplateViewSet(viewsets.ModelViewSet):
             except FormField.DoesNotExist:
                 continue
         
+        form_template.bump_schema_version()
+        if form_template.resolve_name_field() != old_name_field:
+            form_template.sync_employee_display_names()
+        
         return Response({'message': 'Fields reordered successfully'})
 
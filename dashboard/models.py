@@ -20,6 +20,28 @@ class DashboardSettings(models.Model):
         return f"{self.user.username} Dashboard Settings"
 
 
+class DashboardStats(models.Model):
+    """Per-user dashboard statistics, maintained incrementally by dashboard.stats"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='dashboard_stats')
+    total_employees = models.IntegerField(default=0)
+    active_employees = models.IntegerField(default=0)
+    total_form_templates = models.IntegerField(default=0)
+    unread_notifications = models.IntegerField(default=0)
+    daily_created = models.JSONField(default=dict, blank=True, help_text="Employees created per day over the recent days")
+    reconciled_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} Dashboard Stats"
+
+    def recent_employees(self):
+        """Employees created in the last RECENT_DAYS days"""
+        from .stats import window_start
+
+        start = window_start().isoformat()
+        return sum(count for day, count in self.daily_created.items() if day >= start)
+
+
 class SavedSearch(models.Model):
     """Saved search queries for employees"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
@@ -56,4 +78,11 @@ class Notification(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"{self.user.username} - {self.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Read state as loaded, compared on save to maintain the unread counter
+        instance._was_read = instance.__dict__.get('is_read')
+        return instance
\ No newline at end of file
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import FormTemplate
+from . import stats
+from .models import Notification
+
+
+@receiver(post_save, sender=FormTemplate)
+def count_saved_form_template(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust(instance.created_by_id, total_form_templates=1)
+
+
+@receiver(post_delete, sender=FormTemplate)
+def count_deleted_form_template(sender, instance, **kwargs):
+    stats.adjust(instance.created_by_id, total_form_templates=-1)
+
+
+@receiver(post_save, sender=Notification)
+def count_saved_notification(sender, instance, created, **kwargs):
+    was_unread = False if created else getattr(instance, '_was_read', None) is False
+    stats.adjust(instance.user_id, unread_notifications=int(not instance.is_read) - int(was_unread))
+    instance._was_read = instance.is_read
+
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    if not getattr(instance, '_was_read', instance.is_read):
+        stats.adjust(instance.user_id, unread_notifications=-1)
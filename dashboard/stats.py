@@ -0,0 +1,129 @@
+"""Incrementally maintained per-user dashboard statistics
+
+Each user has one DashboardStats row, so the dashboard reads its numbers with
+a single primary key lookup. Counters are adjusted with ``F()`` updates from
+the employee (see api.counters), form template and notification write paths.
+Employees created recently are counted per day in ``daily_created`` so the
+"last 7 days" figure can be summed without a query. The row is computed in
+full on first read and by ``reconcile()`` (the ``reconcile_dashboard_stats``
+command), which repairs drift left by writes that bypass signals.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DashboardStats
+
+
+RECENT_DAYS = 7
+
+COUNTERS = ('total_employees', 'active_employees', 'total_form_templates', 'unread_notifications')
+
+
+def _day(moment):
+    return timezone.localtime(moment).date() if timezone.is_aware(moment) else moment.date()
+
+
+def window_start():
+    """First day counted in recent_employees"""
+    return timezone.localdate() - timedelta(days=RECENT_DAYS - 1)
+
+
+def adjust(user_id, **deltas):
+    """Add to the counters of a user, users whose stats were never read are skipped"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if user_id is None or not deltas:
+        return
+    DashboardStats.objects.filter(pk=user_id).update(**{name: F(name) + delta for name, delta in deltas.items()})
+
+
+def count_created(user_id, created_at, delta):
+    """Add to the number of employees a user created on the day of ``created_at``"""
+    day = _day(created_at)
+    if user_id is None or day < window_start():
+        return
+    with transaction.atomic():
+        stats = DashboardStats.objects.select_for_update().filter(pk=user_id).first()
+        if stats is None:
+            return
+        start = window_start().isoformat()
+        daily = {key: count for key, count in stats.daily_created.items() if key >= start}
+        daily[day.isoformat()] = max(daily.get(day.isoformat(), 0) + delta, 0)
+        stats.daily_created = daily
+        stats.save(update_fields=['daily_created'])
+
+
+def employee_added(employee):
+    adjust(employee.created_by_id, total_employees=1, active_employees=int(bool(employee.is_active)))
+    count_created(employee.created_by_id, employee.created_at, 1)
+
+
+def employee_removed(employee, was_active):
+    adjust(employee.created_by_id, total_employees=-1, active_employees=-int(bool(was_active)))
+    if employee.created_at:
+        count_created(employee.created_by_id, employee.created_at, -1)
+
+
+def compute(user):
+    """Statistics of a user computed from the source tables"""
+    from api.models import Employee, FormTemplate
+    from .models import Notification
+
+    employees = Employee.objects.filter(created_by=user)
+    daily = (
+        employees.filter(created_at__date__gte=window_start())
+        .annotate(day=TruncDate('created_at')).order_by()
+        .values('day').annotate(count=Count('pk'))
+    )
+    return {
+        'total_employees': employees.count(),
+        'active_employees': employees.filter(is_active=True).count(),
+        'total_form_templates': FormTemplate.objects.filter(created_by=user).count(),
+        'unread_notifications': Notification.objects.filter(user=user, is_read=False).count(),
+        'daily_created': {row['day'].isoformat(): row['count'] for row in daily},
+    }
+
+
+def reconcile_user(user):
+    """Recompute the stats row of a user, returns it"""
+    values = compute(user)
+    values['reconciled_at'] = timezone.now()
+    stats, created = DashboardStats.objects.update_or_create(user=user, defaults=values)
+    return stats
+
+
+def reconcile(users):
+    """Recompute the stats of the given users, returns the number of rows that had drifted"""
+    drifted = 0
+    for user in users:
+        existing = DashboardStats.objects.filter(pk=user.pk).first()
+        stats = reconcile_user(user)
+        if existing is None or any(getattr(existing, name) != getattr(stats, name) for name in COUNTERS) \
+                or existing.recent_employees() != stats.recent_employees():
+            drifted += 1
+    return drifted
+
+
+def get_stats(user):
+    """Stats row of a user, computed in full the first time"""
+    stats = DashboardStats.objects.filter(pk=user.pk).first()
+    if stats is not None:
+        return stats
+    try:
+        with transaction.atomic():
+            return reconcile_user(user)
+    except IntegrityError:
+        return DashboardStats.objects.get(pk=user.pk)
+
+
+def as_dict(stats):
+    return {
+        'total_employees': stats.total_employees,
+        'total_form_templates': stats.total_form_templates,
+        'active_employees': stats.active_employees,
+        'recent_employees': stats.recent_employees(),
+        'unread_notifications': stats.unread_notifications,
+    }
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, update_session_auth_hash
@@ -6,11 +7,11 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.files.uploadedfile import UploadedFile
-from django.db.models import Q
-from django.http import HttpResponse
-import csv
+from django.db import transaction
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from datetime import datetime
 from api.models import UserProfile, FormTemplate, FormField, Employee, EmployeeFieldValue, AuditLog
+from api import audit, changesets, exports, projections, schema_cache
 import json
 
 
@@ -24,7 +25,12 @@ def home(request):
 @login_required
 def dashboard(request):
     """Main dashboard view"""
-    return render(request, 'dashboard/dashboard.html')
+    context = {}
+    if getattr(settings, 'DASHBOARD_EMBED_BOOTSTRAP', False):
+        from api.views_dashboard import dashboard_bootstrap_data
+
+        context['bootstrap'] = dashboard_bootstrap_data(request.user)
+    return render(request, 'dashboard/dashboard.html', context)
 
 
 def login_view(request):
@@ -84,6 +90,8 @@ def form_builder(request):
                 options=field.get('options') or None,
             )
 
+        projections.ensure_table(form_template)
+
         messages.success(request, 'Form template created successfully')
         return redirect('form_builder')
 
@@ -99,16 +107,11 @@ def employee_management(request):
     form_template_id = request.GET.get('form_template')
     is_active = request.GET.get('is_active')
 
-    employees = Employee.objects.all().select_related('form_template').prefetch_related('field_values')
-    if q:
-        employees = employees.filter(
-            Q(field_values__value__icontains=q) |
-            Q(employee_id__icontains=q)
-        ).distinct()
-    if form_template_id:
-        employees = employees.filter(form_template_id=form_template_id)
-    if is_active in ['true', 'false']:
-        employees = employees.filter(is_active=(is_active == 'true'))
+    form_template = FormTemplate.objects.filter(id=form_template_id).first() if form_template_id else None
+    employees = exports.filter_queryset(
+        Employee.objects.all().select_related('form_template'), q, form_template_id, is_active,
+        form_template=form_template,
+    )
 
     employees = employees.order_by('-created_at')[:50]
     form_templates = FormTemplate.objects.order_by('name')
@@ -125,44 +128,27 @@ def employee_management(request):
 
 @login_required
 def employee_export(request):
-    """Export employees as CSV (Excel-compatible), honoring current filters"""
-    q = request.GET.get('search')
+    """Export the user's employees as CSV (Excel-compatible) or NDJSON, honoring current filters"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.FORMATS:
+        return HttpResponseBadRequest(f"Unknown export format, expected one of {', '.join(exports.FORMATS)}")
     form_template_id = request.GET.get('form_template')
-    is_active = request.GET.get('is_active')
-
-    employees = Employee.objects.all().select_related('form_template').prefetch_related('field_values__field')
-    if q:
-        employees = employees.filter(
-            Q(field_values__value__icontains=q) |
-            Q(employee_id__icontains=q)
-        ).distinct()
+    form_template = None
     if form_template_id:
-        employees = employees.filter(form_template_id=form_template_id)
-    if is_active in ['true', 'false']:
-        employees = employees.filter(is_active=(is_active == 'true'))
-
-    response = HttpResponse(content_type='text/csv')
-    filename = f"employees_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+        form_template = FormTemplate.objects.filter(id=form_template_id, created_by=request.user).first()
+    employees = exports.filter_queryset(
+        Employee.objects.filter(created_by=request.user), request.GET.get('search'), form_template_id,
+        request.GET.get('is_active'), form_template=form_template,
+    )
+    if export_format == 'wide' and form_template is None:
+        return HttpResponseBadRequest("The wide export needs a form_template")
+
+    response = StreamingHttpResponse(
+        exports.stream(employees, export_format, form_template),
+        content_type=exports.CONTENT_TYPES[export_format],
+    )
+    filename = f"employees_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{exports.EXTENSIONS[export_format]}"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-    writer = csv.writer(response)
-    writer.writerow(['Employee UUID', 'Name', 'Form Template', 'Created At', 'Active', 'Field Values (JSON)'])
-
-    for e in employees.order_by('-created_at'):
-        # Build a simple dict of field label to value
-        field_map = {}
-        for fv in e.field_values.all():
-            display_value = fv.value if fv.value else (fv.file_value.url if getattr(fv.file_value, 'url', None) else '')
-            field_map[fv.field.field_label] = display_value
-        writer.writerow([
-            str(e.employee_id),
-            e.employee_name,
-            e.form_template.name,
-            e.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'Yes' if e.is_active else 'No',
-            json.dumps(field_map, ensure_ascii=False)
-        ])
-
     return response
 
 
@@ -398,7 +384,8 @@ def employee_create(request):
 
         # Validate required fields
         validation_errors = []
-        fields = FormField.objects.filter(form_template_id=form_template_id)
+        schema = schema_cache.get_schema(form_template_id)
+        fields = schema.fields if schema is not None else ()
         for field in fields:
             if field.is_required:
                 if field.field_type == 'file':
@@ -417,20 +404,7 @@ def employee_create(request):
             for err in validation_errors:
                 messages.error(request, err)
             form_templates = FormTemplate.objects.order_by('name')
-            field_defs = []
-            for f in fields.order_by('order', 'id'):
-                submitted = field_values_data.get(str(f.id), '')
-                field_defs.append({
-                    'id': f.id,
-                    'field_label': f.field_label,
-                    'field_name': f.field_name,
-                    'field_type': f.field_type,
-                    'is_required': f.is_required,
-                    'placeholder': f.placeholder or '',
-                    'help_text': f.help_text or '',
-                    'options': f.options or [],
-                    'value': str(submitted),
-                })
+            field_defs = _field_defs(fields, field_values_data)
             return render(request, 'dashboard/employee_create.html', {
                 'form_templates': form_templates,
                 'selected_form_template': form_template_id,
@@ -448,37 +422,40 @@ def employee_create(request):
                 if field.field_name.lower() in ["password", "employee_password"]:
                     password_value = str(value)
 
-            # Create employee with username and password
-            employee = Employee.objects.create(
-                form_template_id=form_template_id,
-                created_by=request.user,
-                is_active=True,
-                username=username_value
-            )
-
-            if password_value:
-                employee.set_password(password_value)
-                employee.save()
-
-            # Save dynamic fields
-            saved_fields_count = 0
-            for field in fields:
-                if field.field_type == 'file':
-                    uploaded_file = request.FILES.get(f'field_{field.id}')
-                    if uploaded_file:
-                        from django.core.files.storage import default_storage
-                        import uuid
-                        file_name = f"{uuid.uuid4()}_{uploaded_file.name}"
-                        file_path = default_storage.save(f"employee_files/{file_name}", uploaded_file)
-                        EmployeeFieldValue.objects.create(employee=employee, field=field, value=file_path)
-                        saved_fields_count += 1
-                else:
-                    raw_value = field_values_data.get(str(field.id))
-                    if raw_value is not None:
-                        EmployeeFieldValue.objects.create(employee=employee, field=field, value=str(raw_value))
-                        saved_fields_count += 1
-
-            AuditLog.objects.create(
+            with transaction.atomic():
+                # Create employee with username and password
+                employee = Employee.objects.create(
+                    form_template_id=form_template_id,
+                    created_by=request.user,
+                    is_active=True,
+                    username=username_value
+                )
+
+                if password_value:
+                    employee.set_password(password_value)
+                    employee.save()
+
+                # Save dynamic fields
+                saved_fields_count = 0
+                for field in fields:
+                    if field.field_type == 'file':
+                        uploaded_file = request.FILES.get(f'field_{field.id}')
+                        if uploaded_file:
+                            from django.core.files.storage import default_storage
+                            import uuid
+                            file_name = f"{uuid.uuid4()}_{uploaded_file.name}"
+                            file_path = default_storage.save(f"employee_files/{file_name}", uploaded_file)
+                            EmployeeFieldValue.objects.create(employee=employee, field=field, value=file_path)
+                            saved_fields_count += 1
+                    else:
+                        raw_value = field_values_data.get(str(field.id))
+                        if raw_value is not None:
+                            EmployeeFieldValue.objects.create(employee=employee, field=field, value=str(raw_value))
+                            saved_fields_count += 1
+
+                employee.sync_field_values()
+
+            audit.record(
                 employee=employee,
                 action='create',
                 performed_by=request.user,
@@ -492,20 +469,7 @@ def employee_create(request):
         except Exception as e:
             messages.error(request, f"Could not create employee: {e}")
             form_templates = FormTemplate.objects.order_by('name')
-            field_defs = []
-            for f in fields.order_by('order', 'id'):
-                submitted = field_values_data.get(str(f.id), '')
-                field_defs.append({
-                    'id': f.id,
-                    'field_label': f.field_label,
-                    'field_name': f.field_name,
-                    'field_type': f.field_type,
-                    'is_required': f.is_required,
-                    'placeholder': f.placeholder or '',
-                    'help_text': f.help_text or '',
-                    'options': f.options or [],
-                    'value': str(submitted),
-                })
+            field_defs = _field_defs(fields, field_values_data)
             return render(request, 'dashboard/employee_create.html', {
                 'form_templates': form_templates,
                 'selected_form_template': form_template_id,
@@ -516,24 +480,30 @@ def employee_create(request):
     selected = request.GET.get('form_template')
     ctx = { 'form_templates': form_templates, 'selected_form_template': selected or '' }
     if selected:
-        fields = FormField.objects.filter(form_template_id=selected).order_by('order', 'id')
-        field_defs = []
-        for f in fields:
-            field_defs.append({
-                'id': f.id,
-                'field_label': f.field_label,
-                'field_name': f.field_name,
-                'field_type': f.field_type,
-                'is_required': f.is_required,
-                'placeholder': f.placeholder or '',
-                'help_text': f.help_text or '',
-                'options': f.options or [],
-                'value': '',
-            })
-        ctx['fields'] = field_defs
+        schema = schema_cache.get_schema(selected)
+        ctx['fields'] = _field_defs(schema.fields if schema is not None else ())
     return render(request, 'dashboard/employee_create.html', ctx)
 
 
+def _field_defs(fields, values=None):
+    """Field definitions with current values for the server-rendered employee forms"""
+    values = values or {}
+    return [
+        {
+            'id': f.id,
+            'field_label': f.field_label,
+            'field_name': f.field_name,
+            'field_type': f.field_type,
+            'is_required': f.is_required,
+            'placeholder': f.placeholder or '',
+            'help_text': f.help_text or '',
+            'options': f.options or [],
+            'value': str(values.get(str(f.id), '')),
+        }
+        for f in fields
+    ]
+
+
 
 @login_required
 def employee_edit(request, employee_id):
@@ -550,28 +520,20 @@ def employee_edit(request, employee_id):
             messages.error(request, 'Invalid field values data')
             return redirect('employee_edit', employee_id=employee_id)
 
-        employee.is_active = is_active
-        employee.save()
+        field_values_data = {field_id: value for field_id, value in field_values_data.items() if value is not None}
+        with transaction.atomic():
+            changeset = changesets.diff(employee, field_values_data, {'is_active': is_active})
+            changeset.apply()
 
-        fields = FormField.objects.filter(form_template=employee.form_template)
-        for field in fields:
-            raw_value = field_values_data.get(str(field.id))
-            if raw_value is None:
-                continue
-            efv, _ = EmployeeFieldValue.objects.get_or_create(employee=employee, field=field)
-            if field.field_type == 'file' and raw_value:
-                efv.file_value = raw_value
-                efv.value = None
-            else:
-                efv.value = str(raw_value)
-                efv.file_value = None
-            efv.save()
-
-        AuditLog.objects.create(
+        if not changeset:
+            messages.info(request, 'No changes to save')
+            return redirect('employee_detail', employee_id=employee_id)
+
+        audit.record(
             employee=employee,
             action='update',
             performed_by=request.user,
-            changes={'updated': True},
+            changes=changeset.as_audit(),
             ip_address=request.META.get('REMOTE_ADDR'),
             user_agent=request.META.get('HTTP_USER_AGENT')
         )
@@ -580,25 +542,11 @@ def employee_edit(request, employee_id):
         return redirect('employee_detail', employee_id=employee_id)
 
     # Build fields with current values for server-rendered form
-    field_defs = []
-    form_fields = FormField.objects.filter(form_template=employee.form_template).order_by('order', 'id')
-    value_by_field_id = {fv.field_id: fv for fv in employee.field_values.all()}
-    for f in form_fields:
-        current = value_by_field_id.get(f.id)
-        current_value = ''
-        if current:
-            current_value = current.value or getattr(current.file_value, 'name', '') or ''
-        field_defs.append({
-            'id': f.id,
-            'field_label': f.field_label,
-            'field_name': f.field_name,
-            'field_type': f.field_type,
-            'is_required': f.is_required,
-            'placeholder': f.placeholder or '',
-            'help_text': f.help_text or '',
-            'options': f.options or [],
-            'value': current_value,
-        })
+    current_values = {
+        str(fv.field_id): fv.value or getattr(fv.file_value, 'name', '') or ''
+        for fv in employee.field_values.all()
+    }
+    field_defs = _field_defs(schema_cache.get_schema(employee.form_template), current_values)
 
     return render(request, 'dashboard/employee_edit.html', {
         'employee_id': employee_id,
@@ -612,7 +560,7 @@ def employee_detail(request, employee_id):
     """Employee detail page"""
     employee = Employee.objects.select_related('form_template').prefetch_related('field_values__field').get(id=employee_id)
     if request.method == 'POST' and request.POST.get('action') == 'delete':
-        AuditLog.objects.create(
+        audit.record(
             employee=employee,
             action='delete',
             performed_by=request.user,